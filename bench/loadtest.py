@@ -0,0 +1,519 @@
+"""
+Offline load-test harness for the Maestro event handlers.
+
+Drives the real handlers in bot.py (on_message, scam_sniffer, mention chat, the
+slash-command callbacks, reaction roles, on_member_join) with synthetic events
+built from small fake discord objects, while Gemini/OpenAI/Groq are replaced by
+stub clients with configurable latency and error rates. Nothing talks to Discord
+or an AI provider; Discord REST calls are simulated with a fixed latency.
+
+For each scenario it reports throughput, handler latency percentiles, how long
+the outbound queue took to drain and event-loop lag, and exits non-zero if a
+--max gate fails:
+
+    python bench/loadtest.py
+    python bench/loadtest.py --scenarios raid,ask_storm --events 500 --provider-error-rate 0.2
+    python bench/loadtest.py --max-p99-ms 2000 --max-loop-lag-ms 50
+
+The harness runs in a temporary directory so bot.py's state files never touch
+the working tree.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scam_corpus.json")
+
+# Keep bot.py's state files, log file and provider keys out of the picture
+os.chdir(tempfile.mkdtemp(prefix="maestro-loadtest-"))
+for var in ("DISCORD_TOKEN", "GOOGLE_API_KEY", "OPENAI_API_KEY", "GROQ_API_KEY", "SHARD_IDS", "SHARD_WORKERS"):
+    os.environ.pop(var, None)
+
+import bot as maestro  # noqa: E402
+
+_ids = itertools.count(10_000)
+
+
+# --- Stub AI providers ---------------------------------------------------------
+class StubProvider:
+    """Answers with the Gemini or OpenAI/Groq SDK shape after a simulated delay; fails at `error_rate`."""
+    def __init__(self, name, latency_ms, error_rate, rng):
+        self.name = name
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.rng = rng
+        self.calls = 0
+        self.failures = 0
+        self.chat = self
+        self.completions = self
+
+    def _answer(self, prompt):
+        # Runs in AIEngine's worker thread, exactly like a blocking SDK call
+        self.calls += 1
+        time.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+        if self.rng.random() < self.error_rate:
+            self.failures += 1
+            raise RuntimeError(f"{self.name}: simulated 503")
+        return f"[{self.name}] " + "Here is a thorough answer. " * 20
+
+    def generate_content(self, prompt):
+        return type("GeminiResponse", (), {"text": self._answer(prompt)})()
+
+    def create(self, messages, model=None):
+        message = type("Message", (), {"content": self._answer(messages[-1]["content"])})()
+        return type("Completion", (), {"choices": [type("Choice", (), {"message": message})()]})()
+
+
+# --- Fake discord objects ------------------------------------------------------
+class FakeREST:
+    """Shared simulated Discord REST latency and call counters."""
+    latency = 0.03
+    calls = {}
+
+    @classmethod
+    async def call(cls, name):
+        cls.calls[name] = cls.calls.get(name, 0) + 1
+        await asyncio.sleep(cls.latency)
+
+
+class FakePermissions:
+    def __init__(self, administrator=False):
+        self.administrator = administrator
+
+
+class FakeRole:
+    def __init__(self, name):
+        self.id = next(_ids)
+        self.name = name
+        self.mention = f"<@&{self.id}>"
+
+
+class FakeUser:
+    def __init__(self, guild=None, admin=False, is_bot=False):
+        self.id = next(_ids)
+        self.name = self.display_name = f"user{self.id}"
+        self.bot = is_bot
+        self.guild = guild
+        self.roles = []
+        self.mention = f"<@{self.id}>"
+        self.guild_permissions = FakePermissions(admin)
+
+    def mentioned_in(self, message):
+        return f"<@{self.id}>" in message.content
+
+    async def add_roles(self, *roles, reason=None):
+        await FakeREST.call("add_roles")
+        self.roles.extend(roles)
+
+    async def remove_roles(self, *roles, reason=None):
+        await FakeREST.call("remove_roles")
+
+    async def send(self, content=None, **kwargs):
+        await FakeREST.call("dm")
+        return FakeMessage(content or "", self, None)
+
+    def __str__(self):
+        return self.name
+
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeChannel:
+    def __init__(self, guild, name):
+        self.id = next(_ids)
+        self.name = name
+        self.guild = guild
+        self.category_id = None
+        self.mention = f"<#{self.id}>"
+
+    async def send(self, content=None, **kwargs):
+        await FakeREST.call("channel_send")
+        return FakeMessage(content or "", maestro.bot.user, self)
+
+    def typing(self):
+        return _Typing()
+
+
+class FakeMessage:
+    def __init__(self, content, author, channel):
+        self.id = next(_ids)
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild if channel else None
+        self.embeds = []
+
+    async def delete(self):
+        await FakeREST.call("delete")
+
+    async def edit(self, **kwargs):
+        await FakeREST.call("edit")
+
+    async def add_reaction(self, emoji):
+        await FakeREST.call("reaction")
+
+
+class FakeGuild:
+    def __init__(self, members=200):
+        self.id = next(_ids)
+        self.name = f"guild{self.id}"
+        self.roles = [FakeRole("@everyone"), FakeRole("Gatekept"), FakeRole(maestro.COHORT_ROLE_NAME)]
+        self.default_role = self.roles[0]
+        self.text_channels = [FakeChannel(self, n) for n in ("general", "get-roles", maestro.SCAM_LOG_CHANNEL)]
+        self.categories = []
+        self.members = {}
+        self.member_count = 0
+        self.bans = 0
+        for _ in range(members):
+            self.add_member()
+
+    def add_member(self, admin=False):
+        member = FakeUser(self, admin=admin)
+        self.members[member.id] = member
+        self.member_count = len(self.members)
+        return member
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def get_role(self, role_id):
+        return next((r for r in self.roles if r.id == role_id), None)
+
+    async def ban(self, user, reason=None, delete_message_days=0):
+        await FakeREST.call("ban")
+        self.bans += 1
+
+
+class FakeResponse:
+    def __init__(self):
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        await FakeREST.call("interaction_response")
+        self._done = True
+
+    async def defer(self, **kwargs):
+        await FakeREST.call("interaction_response")
+        self._done = True
+
+
+class FakeFollowup:
+    async def send(self, content=None, **kwargs):
+        await FakeREST.call("followup")
+        return FakeMessage(content or "", maestro.bot.user, None)
+
+
+class FakeInteraction:
+    def __init__(self, guild, user, channel):
+        self.id = next(_ids)
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel
+        self.channel_id = channel.id
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+        self.extras = {}
+
+
+class FakeReactionPayload:
+    def __init__(self, guild, member, message_id):
+        self.guild_id = guild.id
+        self.user_id = member.id
+        self.member = member
+        self.message_id = message_id
+        self.emoji = "✅"
+
+
+# --- Harness ---------------------------------------------------------------------
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+class LagSampler:
+    """Measures how late the loop wakes a short sleep; the same signal as loop_lag_monitor."""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - t0 - self.interval))
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.guilds = [FakeGuild(members=args.members) for _ in range(args.guilds)]
+        with open(CORPUS_PATH, "r") as f:
+            corpus = json.load(f)
+        self.scam_texts, self.clean_texts = corpus["scam"], corpus["clean"]
+
+    def install(self):
+        """Points bot.py's globals at the fakes and stubs."""
+        FakeREST.latency = self.args.discord_latency_ms / 1000
+        client = maestro.bot
+        client._connection.user = FakeUser(is_bot=True)
+        for guild in self.guilds:
+            client._connection._guilds[guild.id] = guild
+
+        async def no_prefix_commands(message):
+            return None
+        client.process_commands = no_prefix_commands     # no prefix commands exist; skip discord.ext parsing
+
+        brain = maestro.brain
+        brain.gemini = StubProvider("gemini", self.args.provider_latency_ms, self.args.provider_error_rate, self.rng)
+        brain.openai = StubProvider("openai", self.args.provider_latency_ms, self.args.provider_error_rate, self.rng)
+        brain.groq = StubProvider("groq", self.args.provider_latency_ms, self.args.provider_error_rate, self.rng)
+        brain._clients_ready = True
+        maestro.outbound.start()
+        maestro.onboarding.start()
+
+    def reset(self):
+        """Fresh rate-limit and chat state so scenarios don't bleed into each other."""
+        maestro.admission = maestro.AdmissionController(
+            max_inflight=maestro.admission.max_inflight,
+            user_limit=maestro.admission.user_limit,
+            guild_limit=maestro.admission.guild_limit,
+        )
+        maestro.memory = maestro.ConversationMemory()
+        FakeREST.calls = {}
+        for provider in (maestro.brain.gemini, maestro.brain.openai, maestro.brain.groq):
+            provider.calls = provider.failures = 0
+
+    def pick_guild(self):
+        return self.rng.choice(self.guilds)
+
+    def pick_member(self, guild):
+        return self.rng.choice(list(guild.members.values()))
+
+    # Each scenario returns (list of event coroutine factories, extra-stats callable)
+    def raid(self):
+        """A spam raid: fresh accounts posting, `--scam-ratio` of it scam bait, the rest ordinary chat."""
+        def event():
+            guild = self.pick_guild()
+            author = guild.add_member()
+            text = self.rng.choice(self.scam_texts if self.rng.random() < self.args.scam_ratio else self.clean_texts)
+            return maestro.on_message(FakeMessage(text, author, guild.text_channels[0]))
+        return [event] * self.args.events, lambda: {
+            "bans": sum(g.bans for g in self.guilds), "deletes": FakeREST.calls.get("delete", 0)
+        }
+
+    def ask_storm(self):
+        """Many users hitting /ask at once, spread over the configured guilds."""
+        def event():
+            guild = self.pick_guild()
+            interaction = FakeInteraction(guild, self.pick_member(guild), guild.text_channels[0])
+            return maestro.cmd_ask.callback(interaction, "Explain list comprehensions with an example")
+        return [event] * self.args.events, self.ai_stats
+
+    def mention_chat(self):
+        """Mention chat in a few busy channels, exercising conversation memory and admission."""
+        def event():
+            guild = self.pick_guild()
+            channel = guild.text_channels[0]
+            author = self.pick_member(guild)
+            content = f"<@{maestro.bot.user.id}> what does enumerate() return?"
+            return maestro.on_message(FakeMessage(content, author, channel))
+        return [event] * self.args.events, self.ai_stats
+
+    def role_rush(self):
+        """Everyone reacting to the same reaction-role gate message."""
+        gates = {}
+        for guild in self.guilds:
+            gate_id = next(_ids)
+            maestro.db.role_reactions[str(gate_id)] = "Gatekept"
+            gates[guild.id] = gate_id
+
+        def event():
+            guild = self.pick_guild()
+            return maestro.on_raw_reaction_add(FakeReactionPayload(guild, self.pick_member(guild), gates[guild.id]))
+        return [event] * self.args.events, lambda: {"role_grants": FakeREST.calls.get("add_roles", 0)}
+
+    def join_burst(self):
+        """A cohort invite going out: members joining faster than roles and DMs can be delivered."""
+        def event():
+            guild = self.pick_guild()
+            return maestro.on_member_join(guild.add_member())
+        return [event] * self.args.events, lambda: {
+            "role_grants": FakeREST.calls.get("add_roles", 0), "welcome_dms": FakeREST.calls.get("dm", 0)
+        }
+
+    def ai_stats(self):
+        providers = (maestro.brain.gemini, maestro.brain.openai, maestro.brain.groq)
+        return {
+            "provider_calls": sum(p.calls for p in providers),
+            "provider_failures": sum(p.failures for p in providers),
+        }
+
+    async def drain(self, timeout):
+        """Waits for queued and in-flight sends and onboarding to finish; returns seconds taken (or the timeout)."""
+        t0 = time.perf_counter()
+        while maestro.outbound.pending() or maestro.outbound.inflight() or not maestro.onboarding.idle():
+            if time.perf_counter() - t0 > timeout:
+                break
+            await asyncio.sleep(0.01)
+        return time.perf_counter() - t0
+
+    async def run_scenario(self, name):
+        self.reset()
+        admitted_before = admission_counts()
+        factories, extra = getattr(self, name)()
+        latencies, errors = [], 0
+        interval = 1 / self.args.rate if self.args.rate else 0
+
+        async def timed(factory):
+            nonlocal errors
+            t0 = time.perf_counter()
+            try:
+                await factory()
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+        with LagSampler() as lag:
+            start = time.perf_counter()
+            tasks = []
+            for factory in factories:
+                tasks.append(asyncio.create_task(timed(factory)))
+                if interval:
+                    await asyncio.sleep(interval)
+            await asyncio.gather(*tasks)
+            handled = time.perf_counter() - start
+            drain = await self.drain(self.args.drain_timeout)
+        return {
+            "scenario": name,
+            "events": len(factories),
+            "errors": errors,
+            "wall_s": handled,
+            "events_per_sec": len(factories) / handled if handled else float("inf"),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": max(latencies, default=0) * 1000,
+            "drain_s": drain,
+            "loop_lag_p99_ms": percentile(lag.samples, 99) * 1000,
+            "loop_lag_max_ms": max(lag.samples, default=0) * 1000,
+            **{f"ai_{k}": int(v - admitted_before.get(k, 0)) for k, v in admission_counts().items()
+               if v > admitted_before.get(k, 0)},
+            **extra(),
+        }
+
+
+def admission_counts():
+    """Admission decisions so far, read back from the bot's own metrics registry."""
+    counts = {}
+    for line in maestro.metrics.render_prometheus().splitlines():
+        if line.startswith("maestro_ai_admission_total{"):
+            labels, value = line.rsplit(" ", 1)
+            result = labels.split('result="', 1)[1].split('"', 1)[0]
+            counts[result] = float(value)
+    return counts
+
+
+SCENARIOS = ("raid", "ask_storm", "mention_chat", "role_rush", "join_burst")
+
+
+def print_report(reports, args):
+    print(f"Maestro load test | {args.guilds} guild(s) | discord {args.discord_latency_ms} ms | "
+          f"providers {args.provider_latency_ms} ms, {args.provider_error_rate:.0%} errors")
+    for r in reports:
+        print(f"\n  {r['scenario']}: {r['events']} events, {r['errors']} errors")
+        print(f"    Throughput : {r['events_per_sec']:,.1f} events/sec ({r['wall_s']:.2f}s), drain {r['drain_s']:.2f}s")
+        print(f"    Latency    : p50 {r['p50_ms']:.1f} | p95 {r['p95_ms']:.1f} | p99 {r['p99_ms']:.1f} | max {r['max_ms']:.1f} ms")
+        print(f"    Loop lag   : p99 {r['loop_lag_p99_ms']:.2f} | max {r['loop_lag_max_ms']:.2f} ms")
+        extra = {k: v for k, v in r.items() if k not in REPORT_KEYS}
+        if extra:
+            print("    Counters   : " + ", ".join(f"{k}={v}" for k, v in extra.items()))
+
+
+REPORT_KEYS = {"scenario", "events", "errors", "wall_s", "events_per_sec", "p50_ms", "p95_ms", "p99_ms",
+               "max_ms", "drain_s", "loop_lag_p99_ms", "loop_lag_max_ms"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Maestro handlers offline.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {SCENARIOS}")
+    parser.add_argument("--events", type=int, default=300, help="events per scenario")
+    parser.add_argument("--rate", type=float, default=0, help="arrival rate in events/sec (0 = all at once)")
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--members", type=int, default=200, help="members per guild")
+    parser.add_argument("--scam-ratio", type=float, default=0.3, help="share of raid messages that are scams")
+    parser.add_argument("--discord-latency-ms", type=float, default=30)
+    parser.add_argument("--provider-latency-ms", type=float, default=400)
+    parser.add_argument("--provider-error-rate", type=float, default=0.05)
+    parser.add_argument("--drain-timeout", type=float, default=60, help="seconds to wait for queued sends")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-p99-ms", type=float, default=None)
+    parser.add_argument("--max-loop-lag-ms", type=float, default=None)
+    parser.add_argument("--verbose", action="store_true", help="keep bot.py's log output")
+    parser.add_argument("--json", action="store_true", help="emit the raw report as JSON")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    async def run_all():
+        harness = Harness(args)
+        harness.install()
+        return [await harness.run_scenario(name) for name in names]
+
+    reports = asyncio.run(run_all())
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print_report(reports, args)
+
+    failures = []
+    for r in reports:
+        if args.max_p99_ms is not None and r["p99_ms"] > args.max_p99_ms:
+            failures.append(f"{r['scenario']}: p99 {r['p99_ms']:.1f} ms > {args.max_p99_ms} ms")
+        if args.max_loop_lag_ms is not None and r["loop_lag_max_ms"] > args.max_loop_lag_ms:
+            failures.append(f"{r['scenario']}: loop lag {r['loop_lag_max_ms']:.2f} ms > {args.max_loop_lag_ms} ms")
+
+    for failure in failures:
+        print(f"GATE FAILED: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Property/fuzz check for paginate() in bot.py.
+
+Generates random replies shaped like the model's output (prose paragraphs, long
+unbroken tokens, fenced code blocks with and without a language, unclosed fences)
+and checks, for a range of limits, that every chunk fits within the limit, that
+every chunk has balanced code fences, and that no non-blank line of the input is
+lost. Exits non-zero on the first failure and prints a seed to reproduce it:
+
+    python bench/paginate_fuzz.py
+    python bench/paginate_fuzz.py --cases 5000 --seed 1234
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep bot.py's state files, log file and audit segments out of the repo
+os.chdir(tempfile.mkdtemp(prefix="maestro-paginate-fuzz-"))
+
+from bot import paginate, _FENCE_RE, MESSAGE_LIMIT, EMBED_PAGE_SIZE  # noqa: E402
+
+LIMITS = (200, 500, MESSAGE_LIMIT, EMBED_PAGE_SIZE)
+
+
+def words(rng, n):
+    return " ".join(rng.choice("abcdefghij") * rng.randint(1, 12) for _ in range(n))
+
+
+def random_reply(rng):
+    parts = []
+    for _ in range(rng.randint(1, 40)):
+        kind = rng.random()
+        if kind < 0.5:
+            parts.append(words(rng, rng.randint(1, 400)))
+        elif kind < 0.65:
+            parts.append("")
+        elif kind < 0.75:
+            parts.append("x" * rng.randint(100, 5000))            # no spaces: hard wrap
+        elif kind < 0.95:
+            lang = rng.choice(["", "py", "python", "javascript", "l" * rng.randint(1, 300)])
+            body = [words(rng, rng.randint(0, 30)) for _ in range(rng.randint(1, 60))]
+            close = [] if rng.random() < 0.1 else ["```"]       # sometimes left open
+            parts.append("\n".join([f"```{lang}"] + body + close))
+        else:
+            parts.append("\n" * rng.randint(1, 5))
+    return "\n".join(parts)
+
+
+def prose(text):
+    return "".join("".join(line.split()) for line in text.split("\n") if not _FENCE_RE.match(line))
+
+
+def check(text, limit):
+    """Returns a problem description, or None if paginate(text, limit) is sound."""
+    chunks = paginate(text, limit)
+    for i, chunk in enumerate(chunks):
+        if len(chunk) > limit:
+            return f"chunk {i} is {len(chunk)} chars (limit {limit})"
+        fences = sum(1 for line in chunk.split("\n") if _FENCE_RE.match(line))
+        if fences % 2:
+            return f"chunk {i} has {fences} fence lines"
+    # Every non-fence character of the input must survive, in order (re-opened fences are extra)
+    emitted = iter("".join(prose(chunk) for chunk in chunks))
+    if not all(c in emitted for c in prose(text)):
+        return "content was lost or reordered"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=1000, help="random replies to generate")
+    parser.add_argument("--seed", type=int, default=None, help="base seed (default: random)")
+    args = parser.parse_args()
+
+    base = args.seed if args.seed is not None else random.randrange(1 << 30)
+    for case in range(args.cases):
+        seed = base + case
+        text = random_reply(random.Random(seed))
+        for limit in LIMITS:
+            problem = check(text, limit)
+            if problem:
+                print(f"FAIL seed={seed} limit={limit}: {problem}")
+                return 1
+    print(f"paginate: {args.cases} cases x {len(LIMITS)} limits OK (base seed {base})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Offline benchmark + regression gate for the scam sniffer classifier.
+
+Runs scan_for_scam() from bot.py over the labeled corpus in scam_corpus.json
+plus a set of generated adversarial inputs (long, repetitive messages built to
+provoke regex backtracking), then reports throughput, per-message latency and
+precision/recall. Exits non-zero if any of the --min/--max gates fail, so rule
+changes to SCAM_PATTERNS can be checked before they ship:
+
+    python bench/scam_bench.py
+    python bench/scam_bench.py --min-precision 0.95 --min-recall 0.9 --max-p99-ms 1
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep bot.py's state files, log file and audit segments out of the repo
+os.chdir(tempfile.mkdtemp(prefix="maestro-scam-bench-"))
+
+from bot import scan_for_scam, SCAM_PATTERNS  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scam_corpus.json")
+
+
+def adversarial_inputs(size):
+    """Long near-miss inputs aimed at the .{0,40} gaps, alternations and URL rule."""
+    return {
+        "repeated_invest": "invest " * (size // 7),
+        "invest_no_crypto": "invest " + "a " * (size // 2),
+        "giveaway_no_cta": "giveaway " + "word " * (size // 5),
+        "work_from_home_tail": "work from home " + "x" * size,
+        "url_hyphen_run": "https://" + "a-" * (size // 2) + ".com",
+        "many_urls": " ".join(f"https://site{i}.example.org/p" for i in range(size // 30)),
+        "free_no_item": "free " * (size // 5),
+        "unicode_apostrophes": "don’t " * (size // 6),
+        "no_whitespace": "y" * size,
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def time_one(text):
+    t0 = time.perf_counter()
+    hit = scan_for_scam(text)
+    return time.perf_counter() - t0, hit
+
+
+def run(iterations, adversarial_size):
+    with open(CORPUS_PATH, "r") as f:
+        corpus = json.load(f)
+
+    labeled = [(t, True) for t in corpus["scam"]] + [(t, False) for t in corpus["clean"]]
+
+    latencies = []
+    tp = fp = fn = tn = 0
+    false_positives, false_negatives = [], []
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        for text, is_scam in labeled:
+            elapsed, hit = time_one(text)
+            latencies.append(elapsed)
+            if i:
+                continue
+            if hit and is_scam:
+                tp += 1
+            elif hit and not is_scam:
+                fp += 1
+                false_positives.append((text, hit))
+            elif is_scam:
+                fn += 1
+                false_negatives.append(text)
+            else:
+                tn += 1
+    wall = time.perf_counter() - start
+
+    adversarial = {}
+    for name, text in adversarial_inputs(adversarial_size).items():
+        worst = max(time_one(text)[0] for _ in range(3))
+        adversarial[name] = worst
+
+    return {
+        "patterns": len(SCAM_PATTERNS),
+        "messages": len(latencies),
+        "msgs_per_sec": len(latencies) / wall if wall else float("inf"),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "precision": tp / (tp + fp) if tp + fp else 1.0,
+        "recall": tp / (tp + fn) if tp + fn else 1.0,
+        "confusion": {"tp": tp, "fp": fp, "fn": fn, "tn": tn},
+        "false_positives": false_positives,
+        "false_negatives": false_negatives,
+        "adversarial_ms": {k: v * 1000 for k, v in adversarial.items()},
+        "adversarial_worst_ms": max(adversarial.values()) * 1000,
+    }
+
+
+def print_report(r):
+    print(f"Scam sniffer benchmark | {r['patterns']} patterns | {r['messages']} scans")
+    print(f"  Throughput : {r['msgs_per_sec']:,.0f} msgs/sec")
+    print(f"  Latency    : p50 {r['p50_ms']:.4f} ms | p99 {r['p99_ms']:.4f} ms | mean {r['mean_ms']:.4f} ms")
+    c = r["confusion"]
+    print(f"  Accuracy   : precision {r['precision']:.3f} | recall {r['recall']:.3f} "
+          f"(tp={c['tp']} fp={c['fp']} fn={c['fn']} tn={c['tn']})")
+    for text, hit in r["false_positives"]:
+        print(f"    FP: {text!r} -> '{hit}'")
+    for text in r["false_negatives"]:
+        print(f"    FN: {text!r}")
+    print(f"  Adversarial: worst {r['adversarial_worst_ms']:.3f} ms")
+    for name, ms in sorted(r["adversarial_ms"].items(), key=lambda kv: -kv[1]):
+        print(f"    {name:<22} {ms:.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Maestro scam sniffer offline.")
+    parser.add_argument("--iterations", type=int, default=200, help="passes over the labeled corpus")
+    parser.add_argument("--adversarial-size", type=int, default=20000, help="length of generated inputs")
+    parser.add_argument("--min-precision", type=float, default=None)
+    parser.add_argument("--min-recall", type=float, default=None)
+    parser.add_argument("--max-p99-ms", type=float, default=None)
+    parser.add_argument("--max-adversarial-ms", type=float, default=None)
+    parser.add_argument("--json", action="store_true", help="emit the raw report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.iterations, args.adversarial_size)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failures = []
+    if args.min_precision is not None and report["precision"] < args.min_precision:
+        failures.append(f"precision {report['precision']:.3f} < {args.min_precision}")
+    if args.min_recall is not None and report["recall"] < args.min_recall:
+        failures.append(f"recall {report['recall']:.3f} < {args.min_recall}")
+    if args.max_p99_ms is not None and report["p99_ms"] > args.max_p99_ms:
+        failures.append(f"p99 {report['p99_ms']:.4f} ms > {args.max_p99_ms} ms")
+    if args.max_adversarial_ms is not None and report["adversarial_worst_ms"] > args.max_adversarial_ms:
+        failures.append(f"adversarial {report['adversarial_worst_ms']:.3f} ms > {args.max_adversarial_ms} ms")
+
+    for failure in failures:
+        print(f"GATE FAILED: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,46 @@
+import time
+BOOT_T0 = time.perf_counter()  # startup timeline origin — keep above every other import
+
 import discord
 from discord.ext import commands
 from discord import app_commands
-import google.generativeai as genai
-import openai
-from groq import Groq
 import os
 import json
 import asyncio
 import re
+import functools
+import math
+import ast
+import bisect
+import builtins
+import difflib
+import random
 import base64
 import threading
-import requests
+import aiohttp
 import hashlib
 import hmac
+import sqlite3
+import subprocess
+import heapq
 import logging
+import logging.handlers
+import queue
+import signal
+import atexit
 import sys
 import traceback
-import time
-from datetime import datetime
+import unicodedata
+from contextlib import contextmanager, asynccontextmanager
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from itertools import islice
+from string import Template
+import html
+import io
+import gzip
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import unquote_plus, parse_qs
+from urllib.parse import unquote_plus, parse_qs, urlsplit
 
 # ==============================================================================
 # SECTION 1: SYSTEM CONFIGURATION & CONSTANTS
@@ -36,72 +57,832 @@ COLOR_SUCCESS = 0x22c55e
 COLOR_ERROR = 0xef4444
 COLOR_BG = "#0f172a"
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(levelname)-8s | %(name)s | %(message)s',
-    handlers=[
-        logging.FileHandler("maestro_monolith.log"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+def parse_shard_ids(raw):
+    """'0-3' or '0,2,5' -> sorted list of shard ids ([] when unset)."""
+    ids = set()
+    for part in filter(None, (p.strip() for p in raw.split(","))):
+        lo, _, hi = part.partition("-")
+        ids.update(range(int(lo), int(hi or lo) + 1))
+    return sorted(ids)
+
+# Sharding: SHARD_MODE=auto runs every shard in this process (discord.py AutoShardedBot).
+# SHARD_IDS/SHARD_COUNT make this process own a shard range; SHARD_WORKERS=N turns the
+# entry point into a supervisor that starts N such processes over SHARD_COUNT shards.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 0)) or None
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS", ""))
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", 0))
+SHARDED = os.getenv("SHARD_MODE") == "auto" or SHARD_COUNT is not None or bool(SHARD_IDS)
+IS_PRIMARY = not SHARD_IDS or 0 in SHARD_IDS      # owns the dashboard, command sync and shared jobs
+SHARD_LABEL = f"shards-{SHARD_IDS[0]}-{SHARD_IDS[-1]}" if SHARD_IDS else "main"
+
+# Multi-process deployments need one shared state store; SQLite (WAL) stands in for a KV service.
+STATE_BACKEND = "sqlite" if SHARD_IDS or SHARD_WORKERS > 1 else os.getenv("STATE_BACKEND", "json")
+STATE_DB = os.getenv("STATE_DB", "maestro_state.db")
+
+# Logging: handlers run on a background QueueListener thread so a logger call on
+# the event loop is just a queue put — no disk or stdout I/O in hot paths.
+LOG_FILE = os.getenv("LOG_FILE", "maestro_monolith.log")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")          # text | json
+LOG_ROTATE = os.getenv("LOG_ROTATE", "size")          # size | time
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", 5))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, with structured fields passed via `extra=`."""
+    STRUCTURED_FIELDS = ("guild", "user", "command", "latency_ms")
+
+    def format(self, record):
+        doc = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in self.STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                doc[field] = value
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+def setup_logging():
+    if LOG_ROTATE == "time":
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUPS, encoding="utf-8"
+        )
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"
+        )
+    stream_handler = logging.StreamHandler(sys.stdout)
+
+    if LOG_FORMAT == "json":
+        formatter = JsonLogFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s | %(levelname)-8s | %(name)s | %(message)s')
+    file_handler.setFormatter(formatter)
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+log_listener = setup_logging()
 logger = logging.getLogger("MaestroCore")
 
+
+class TTLCache:
+    """Small LRU dict whose entries expire after `ttl` seconds. Loop-thread only."""
+    def __init__(self, maxsize=4096, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`; callers check ready_in() then take()."""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def ready_in(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+# ==============================================================================
+# SECTION 2: TELEMETRY (METRICS & LOOP LAG)
+# ==============================================================================
+class MetricsRegistry:
+    """
+    In-process counters, gauges and histograms, rendered in Prometheus text format.
+    Written from the bot loop, read from the dashboard thread — hence the lock.
+    """
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}        # name -> (type, help)
+        self._counters = {}    # (name, labels) -> value
+        self._gauges = {}
+        self._hists = {}       # (name, labels) -> [bucket_counts, sum, count]
+        self._buckets = {}     # name -> bucket bounds
+
+    def describe(self, name, mtype, help_text, buckets=None):
+        self._meta[name] = (mtype, help_text)
+        if mtype == "histogram":
+            self._buckets[name] = tuple(buckets or self.DEFAULT_BUCKETS)
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        bounds = self._buckets.get(name, self.DEFAULT_BUCKETS)
+        with self._lock:
+            hist = self._hists.get(key)
+            if hist is None:
+                hist = self._hists[key] = [[0] * len(bounds), 0.0, 0]
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    hist[0][i] += 1
+                    break
+            hist[1] += value
+            hist[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    @classmethod
+    def _fmt_labels(cls, labels, extra=None):
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{cls._escape(v)}"' for k, v in pairs) + "}"
+
+    def render_prometheus(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            hists = {k: ([*v[0]], v[1], v[2]) for k, v in self._hists.items()}
+
+        lines = []
+        emitted = set()
+
+        def header(name, fallback_type):
+            if name in emitted:
+                return
+            emitted.add(name)
+            mtype, help_text = self._meta.get(name, (fallback_type, name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {mtype}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{self._fmt_labels(labels)} {value}")
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{self._fmt_labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in sorted(hists.items()):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(self._buckets.get(name, self.DEFAULT_BUCKETS), counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{self._fmt_labels(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_bucket{self._fmt_labels(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{name}_sum{self._fmt_labels(labels)} {total}")
+            lines.append(f"{name}_count{self._fmt_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.describe("maestro_commands_total", "counter", "Slash command invocations by command and status.")
+metrics.describe("maestro_command_seconds", "histogram", "Slash command handler latency.")
+metrics.describe("maestro_ai_provider_seconds", "histogram", "AI provider call latency.")
+metrics.describe("maestro_ai_provider_failures_total", "counter", "AI provider calls that raised.")
+metrics.describe("maestro_ai_failovers_total", "counter", "Queries that fell through to the next provider.")
+metrics.describe("maestro_ai_offline_total", "counter", "Queries where every provider failed.")
+metrics.describe("maestro_scam_scan_seconds", "histogram", "scam_sniffer classification time.",
+                 buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05))
+metrics.describe("maestro_scam_hits_total", "counter", "Messages removed by the scam sniffer.")
+metrics.describe("maestro_broadcast_messages_total", "counter", "Broadcast/DM-all deliveries by kind and status.")
+metrics.describe("maestro_gateway_events_total", "counter", "Gateway dispatch events by type.")
+metrics.describe("maestro_gateway_latency_seconds", "gauge", "Discord heartbeat latency.")
+metrics.describe("maestro_event_loop_lag_seconds", "histogram", "Event-loop scheduling lag.",
+                 buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+metrics.describe("maestro_event_loop_lag_last_seconds", "gauge", "Most recent event-loop lag sample.")
+
+async def loop_lag_monitor(interval=0.5):
+    """Samples how late the loop wakes a sleeping task; anything above ~0 is loop blocking."""
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - t0 - interval)
+        metrics.observe("maestro_event_loop_lag_seconds", lag)
+        metrics.set_gauge("maestro_event_loop_lag_last_seconds", lag)
+
+class StartupTimeline:
+    """Per-phase boot durations (import, clients, command sync, gateway connect)."""
+    def __init__(self, t0):
+        self.t0 = t0
+        self.phases = OrderedDict()
+        self._open = {}
+        self.ready_at = None
+
+    def begin(self, name):
+        self._open[name] = time.perf_counter()
+
+    def end(self, name):
+        started = self._open.pop(name, None)
+        if started is not None:
+            self.record(name, time.perf_counter() - started)
+
+    @contextmanager
+    def phase(self, name):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def record(self, name, seconds):
+        self.phases[name] = seconds
+        metrics.set_gauge("maestro_startup_phase_seconds", seconds, phase=name)
+
+    @property
+    def ready(self):
+        return self.ready_at is not None
+
+    def mark_ready(self):
+        if self.ready:
+            return
+        self.ready_at = time.perf_counter()
+        total = self.ready_at - self.t0
+        metrics.set_gauge("maestro_startup_phase_seconds", total, phase="total")
+        breakdown = " | ".join(f"{k} {v:.2f}s" for k, v in self.phases.items())
+        logger.info(f"Startup: ready in {total:.2f}s ({breakdown})")
+
+metrics.describe("maestro_startup_phase_seconds", "gauge", "Boot time spent per startup phase.")
+
+startup = StartupTimeline(BOOT_T0)
+
+class LoopStallWatchdog:
+    """
+    Side-thread stall detector. A loop task stamps a heartbeat every `interval`; when the
+    stamp goes stale for longer than `threshold`, the watchdog thread snapshots the loop
+    thread's stack to find which handler is blocking, and aggregates stalls per culprit.
+    """
+    def __init__(self, threshold=0.25, interval=0.05, top_n=10):
+        self.threshold = threshold
+        self.interval = interval
+        self.top_n = top_n
+        self.stalls = {}       # culprit -> aggregate dict
+        self._lock = threading.Lock()
+        self._beat = time.monotonic()
+        self._loop = None
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+
+    def start(self, loop):
+        """Must be called from the loop thread (setup_hook)."""
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="maestro-stall-watchdog", daemon=True).start()
+        logger.info(f"Watchdog: monitoring event loop (threshold {self.threshold * 1000:.0f} ms)")
+
+    def stop(self):
+        self._stop.set()
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _capture(self):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        stack = traceback.extract_stack(frame)
+        ours = [f for f in stack if os.path.abspath(f.filename) == os.path.abspath(__file__)]
+        culprit_frame = ours[-1] if ours else stack[-1]
+        blocked = stack[-1]
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        return {
+            "culprit": f"{culprit_frame.name} (line {culprit_frame.lineno})",
+            "blocked_in": f"{blocked.name} ({os.path.basename(blocked.filename)}:{blocked.lineno})",
+            "task": task.get_name() if task else None,
+            "stack": traceback.format_list(stack[-12:]),
+        }
+
+    def _record(self, sample, duration):
+        with self._lock:
+            agg = self.stalls.get(sample["culprit"])
+            if agg is None:
+                agg = self.stalls[sample["culprit"]] = {
+                    "culprit": sample["culprit"], "count": 0, "total": 0.0, "max": 0.0
+                }
+            agg["count"] += 1
+            agg["total"] += duration
+            agg["max"] = max(agg["max"], duration)
+            agg["last_seen"] = time.time()
+            agg["blocked_in"] = sample["blocked_in"]
+            agg["task"] = sample["task"]
+            agg["stack"] = sample["stack"]
+        metrics.inc("maestro_loop_stalls_total", handler=sample["culprit"])
+        metrics.observe("maestro_loop_stall_seconds", duration)
+        logger.warning(
+            f"Watchdog: event loop stalled {duration * 1000:.0f} ms in {sample['culprit']} "
+            f"-> {sample['blocked_in']} (task: {sample['task']})"
+        )
+
+    def _watch(self):
+        sample, worst = None, 0.0
+        while not self._stop.wait(self.interval):
+            lag = time.monotonic() - self._beat
+            if lag >= self.threshold:
+                if sample is None:
+                    sample = self._capture()
+                worst = lag
+            elif sample is not None:
+                self._record(sample, worst)
+                sample, worst = None, 0.0
+
+    def top(self, n=None):
+        with self._lock:
+            rows = [dict(v) for v in self.stalls.values()]
+        rows.sort(key=lambda r: r["total"], reverse=True)
+        return rows[:n or self.top_n]
+
+metrics.describe("maestro_loop_stalls_total", "counter", "Event-loop stalls by blocking handler.")
+metrics.describe("maestro_loop_stall_seconds", "histogram", "Duration of detected event-loop stalls.",
+                 buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+watchdog = LoopStallWatchdog(threshold=float(os.getenv("LOOP_STALL_THRESHOLD", 0.25)))
+
 # ==============================================================================
-# SECTION 2: DATA PERSISTENCE ENGINE
+# SECTION 3: DATA PERSISTENCE ENGINE
 # ==============================================================================
+class JsonFileStore:
+    """One JSON file per document. The single-process default."""
+    shared = False
+
+    def __init__(self, files):
+        self.files = files
+
+    def get(self, key, default=None):
+        filepath = self.files.get(key)
+        if not filepath or not os.path.exists(filepath): return default
+        try:
+            with open(filepath, 'r') as f: return json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to load {key} from {filepath}: {e}")
+            return default
+
+    def put(self, key, value):
+        if key not in self.files:
+            return
+        with open(self.files[key], 'w') as f:
+            json.dump(value, f, indent=4)
+
+    def update(self, key, fn, default):
+        value = fn(self.get(key, default))
+        self.put(key, value)
+        return value
+
+    def versions(self):
+        return {}
+
+    def scan(self, prefix):
+        return {}
+
+class SqliteStore:
+    """
+    Shared document store for multi-process deployments: one row per document in a WAL-mode
+    SQLite file, so every shard process sees the others' writes. Row versions let each
+    process notice remote changes cheaply (see PersistenceEngine.sync).
+    """
+    shared = True
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "version INTEGER NOT NULL DEFAULT 1, updated REAL NOT NULL)"
+            )
+
+    def has(self, key):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM kv WHERE key = ?", (key,)).fetchone() is not None
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _write(self, key, value):
+        self._conn.execute(
+            "INSERT INTO kv (key, value, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, version = version + 1, updated = excluded.updated",
+            (key, json.dumps(value), time.time())
+        )
+
+    def put(self, key, value):
+        with self._lock:
+            self._write(key, value)
+
+    def update(self, key, fn, default):
+        """Read-modify-write under a write lock, so concurrent shards can't lose each other's changes."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+                value = fn(json.loads(row[0]) if row else default)
+                self._write(key, value)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return value
+
+    def versions(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, version FROM kv"))
+
+    def scan(self, prefix):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM kv WHERE key LIKE ?", (prefix + "%",)).fetchall()
+        return {k: json.loads(v) for k, v in rows}
+
 class PersistenceEngine:
+    # Documents each shard process keeps for itself (its own guilds' reminders and polls, its content pool)
+    LOCAL_KEYS = {"reminders", "content_bank", "polls"}
+
     def __init__(self):
         self.files = {
             "optin": "dm_optin.json",
             "reactions": "role_reactions.json",
-            "logs": "admin_audit.json"
+            "domains": "domain_rules.json",
+            "reminders": "reminders.json",
+            "command_sync": "command_sync.json",
+            "ai_exempt": "ai_exempt.json",
+            "content_bank": "content_bank.json",
+            "templates": "guild_templates.json",
+            "onboarding": "onboarding.json",
+            "polls": "polls.json"
         }
-        self.dm_optins = self._load_set(self.files["optin"])
-        self.role_reactions = self._load_dict(self.files["reactions"])
+        if STATE_BACKEND == "sqlite":
+            self.store = SqliteStore(STATE_DB)
+            self._import_files()
+        else:
+            self.store = JsonFileStore(self.files)
+        self._versions = self.store.versions()
+        self._subscribers = {}
+        self.dm_optins = set(self.store.get("optin", []))
+        self.role_reactions = self.store.get("reactions", {})
 
-    def _load_set(self, filepath):
-        if not os.path.exists(filepath): return set()
-        try:
-            with open(filepath, 'r') as f: return set(json.load(f))
-        except Exception as e:
-            logger.error(f"Failed to load set from {filepath}: {e}")
-            return set()
+    def _key(self, key):
+        return f"{key}@{SHARD_LABEL}" if self.store.shared and key in self.LOCAL_KEYS else key
 
-    def _load_dict(self, filepath):
-        if not os.path.exists(filepath): return {}
-        try:
-            with open(filepath, 'r') as f: return json.load(f)
-        except Exception as e:
-            logger.error(f"Failed to load dict from {filepath}: {e}")
-            return {}
+    def _import_files(self):
+        """First run on SQLite: carry over any existing JSON documents."""
+        legacy = JsonFileStore(self.files)
+        for key, filepath in self.files.items():
+            if os.path.exists(filepath) and not self.store.has(self._key(key)):
+                self.store.put(self._key(key), legacy.get(key))
+                logger.info(f"Persistence: imported {filepath} into {STATE_DB}")
 
     def save_state(self):
         try:
-            with open(self.files["optin"], 'w') as f:
-                json.dump(list(self.dm_optins), f)
-            with open(self.files["reactions"], 'w') as f:
-                json.dump(self.role_reactions, f, indent=4)
+            self.store.put("optin", sorted(self.dm_optins))
+            self.store.put("reactions", self.role_reactions)
             logger.info("Persistence: State saved successfully.")
         except Exception as e:
             logger.critical(f"Persistence: SAVE FAILED. Error: {e}")
 
     def add_optin(self, user_id):
-        self.dm_optins.add(str(user_id))
-        self.save_state()
+        uid = str(user_id)
+        self.dm_optins = set(self.store.update("optin", lambda ids: sorted(set(ids) | {uid}), []))
 
     def remove_optin(self, user_id):
-        if str(user_id) in self.dm_optins:
-            self.dm_optins.remove(str(user_id))
-            self.save_state()
+        uid = str(user_id)
+        if uid in self.dm_optins:
+            self.dm_optins = set(self.store.update("optin", lambda ids: sorted(set(ids) - {uid}), []))
 
     def add_reaction_role(self, msg_id, role_name):
-        self.role_reactions[str(msg_id)] = role_name
-        self.save_state()
+        self.role_reactions = self.store.update("reactions", lambda r: {**r, str(msg_id): role_name}, {})
+
+    def load_json(self, key, default):
+        """Loads a subsystem's JSON document by its key in self.files."""
+        return self.store.get(self._key(key), default)
+
+    def save_json(self, key, value):
+        try:
+            self.store.put(self._key(key), value)
+        except Exception as e:
+            logger.critical(f"Persistence: SAVE FAILED for {key}. Error: {e}")
+
+    def subscribe(self, key, callback):
+        """callback(new_value) runs on the loop when another process changes the document."""
+        self._subscribers.setdefault(key, []).append(callback)
+
+    def sync(self):
+        """Picks up documents other shard processes changed since the last call."""
+        versions = self.store.versions()
+        changed = [k for k, v in versions.items() if self._versions.get(k) != v]
+        self._versions = versions
+        for key in changed:
+            if key == "optin":
+                self.dm_optins = set(self.store.get("optin", []))
+            elif key == "reactions":
+                self.role_reactions = self.store.get("reactions", {})
+            for callback in self._subscribers.get(key, ()):
+                try:
+                    callback(self.store.get(key))
+                except Exception as e:
+                    logger.error(f"Persistence: reload of {key} failed: {e}")
+
+    async def watch(self, interval=5):
+        while True:
+            await asyncio.sleep(interval)
+            self.sync()
 
 db = PersistenceEngine()
 
 # ==============================================================================
-# SECTION 3: KNOWLEDGE BASE IMPORT
+# SECTION 4: ADMIN AUDIT LOG
+# ==============================================================================
+AUDIT_DIR = os.getenv("AUDIT_DIR", "admin_audit")
+AUDIT_ACTIONS = ("kick", "ban", "unban", "scam_ban", "dmall", "post_in", "broadcast_dm", "architect_plan", "template_apply")
+
+def _audit_ts(entry):
+    return entry["ts"]
+
+def _audit_segments(directory, label=None):
+    names = sorted(
+        n for n in os.listdir(directory)
+        if n.endswith(".jsonl") and (label is None or n.rsplit("-", 1)[0] == label)
+    )
+    return [os.path.join(directory, n) for n in names]
+
+class AuditSegmentHandler(logging.Handler):
+    """
+    Appends pre-serialized audit lines to AUDIT_DIR/<shard label>-<seq>.jsonl, starting a
+    new segment every `segment_bytes` and deleting this process's segments once their
+    last write is older than the retention window. Runs on the audit QueueListener thread.
+    """
+    def __init__(self, directory, segment_bytes, retention):
+        super().__init__()
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retention = retention
+        own = _audit_segments(directory, SHARD_LABEL)
+        self.seq = int(own[-1].rsplit("-", 1)[1].split(".")[0]) if own else 1
+        self.stream = None
+
+    def _open(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.seq += 1
+        path = os.path.join(self.directory, f"{SHARD_LABEL}-{self.seq:06d}.jsonl")
+        self.stream = open(path, "a", encoding="utf-8")
+        cutoff = time.time() - self.retention
+        for old in _audit_segments(self.directory, SHARD_LABEL)[:-1]:
+            if os.path.getmtime(old) < cutoff:
+                os.remove(old)
+
+    def emit(self, record):
+        try:
+            if self.stream is None or self.stream.tell() >= self.segment_bytes:
+                self._open()
+            self.stream.write(record.msg + "\n")
+            self.stream.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        super().close()
+
+class AuditLog:
+    """
+    Append-only record of moderation and admin actions. record() indexes the entry in
+    memory (ordered by time, by user as actor or target, by guild and by action) and
+    queues its JSON line for the writer thread, so the loop never touches disk. Records
+    older than `retention_days` age out of memory and disk alike. Other shard processes'
+    segments are tailed by refresh(). Nothing touches disk until start().
+    """
+    def __init__(self, directory, segment_bytes=1_000_000, retention_days=90):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retention = retention_days * 86400
+        self._lock = threading.Lock()      # the dashboard queries from its HTTP thread
+        self.entries = []
+        self.by_user, self.by_guild, self.by_action = {}, {}, {}
+        self._offsets = {}                 # other processes' segment path -> bytes indexed
+        self._next_prune = 0
+        self._queue = queue.SimpleQueue()  # records made before start() wait here
+        self._listener = None
+        self._closed = False
+
+    def start(self):
+        """Indexes the retained segments and starts the writer thread. Blocking file I/O: run off the loop."""
+        if self._listener is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._tail(_audit_segments(self.directory))
+        self._listener = logging.handlers.QueueListener(
+            self._queue, AuditSegmentHandler(self.directory, self.segment_bytes, self.retention)
+        )
+        self._listener.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def _insert(entries, entry):
+        if not entries or entries[-1]["ts"] <= entry["ts"]:
+            entries.append(entry)
+        else:
+            bisect.insort(entries, entry, key=_audit_ts)    # a record tailed from another shard
+
+    def _index(self, entry):
+        self._insert(self.entries, entry)
+        for uid in {entry.get("actor"), entry.get("target")} - {None}:
+            self._insert(self.by_user.setdefault(uid, []), entry)
+        if entry.get("guild") is not None:
+            self._insert(self.by_guild.setdefault(entry["guild"], []), entry)
+        self._insert(self.by_action.setdefault(entry["action"], []), entry)
+
+    def _prune(self, now):
+        """Drops expired records from every index; each list is time-ordered, so it's a prefix cut."""
+        if now < self._next_prune:
+            return
+        self._next_prune = now + 3600
+        cutoff = now - self.retention
+        for entries in (self.entries, *(l for index in (self.by_user, self.by_guild, self.by_action)
+                                        for l in index.values())):
+            del entries[:bisect.bisect_left(entries, cutoff, key=_audit_ts)]
+        for index in (self.by_user, self.by_guild, self.by_action):
+            for key in [k for k, l in index.items() if not l]:
+                del index[key]
+
+    def _tail(self, paths):
+        """Indexes whatever was appended to `paths` since the last look."""
+        cutoff = time.time() - self.retention
+        for path in set(self._offsets) - set(paths):
+            del self._offsets[path]         # pruned by its owner; its records age out by time
+        for path in paths:
+            offset = self._offsets.get(path, 0)
+            try:
+                if os.path.getsize(path) <= offset:
+                    continue
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    chunk = f.read()
+            except OSError:
+                continue
+            complete = chunk[:chunk.rfind(b"\n") + 1]       # leave a half-written line for next time
+            for line in complete.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Audit: skipped a corrupt record in {path}")
+                    continue
+                if entry["ts"] >= cutoff:
+                    self._index(entry)
+            self._offsets[path] = offset + len(complete)
+
+    def refresh(self):
+        """Picks up other shard processes' new records. Blocking file I/O: call off the loop."""
+        if not db.store.shared:
+            return
+        others = [p for p in _audit_segments(self.directory)
+                  if os.path.basename(p).rsplit("-", 1)[0] != SHARD_LABEL]
+        with self._lock:
+            self._tail(others)
+
+    def record(self, action, guild=None, actor=None, target=None, reason=None, **detail):
+        """Appends one record. guild/actor/target may be discord objects or ids."""
+        entry = {"ts": time.time(), "action": action, "guild": getattr(guild, "id", guild),
+                 "actor": getattr(actor, "id", actor), "target": getattr(target, "id", target)}
+        if hasattr(actor, "id"):
+            entry["actor_name"] = str(actor)
+        if hasattr(target, "id"):
+            entry["target_name"] = str(target)
+        if reason:
+            entry["reason"] = reason
+        if detail:
+            entry["detail"] = detail
+        with self._lock:
+            self._index(entry)
+            self._prune(entry["ts"])
+        self._queue.put(logging.makeLogRecord({"msg": json.dumps(entry, default=str)}))
+        metrics.inc("maestro_audit_records_total", action=action)
+        return entry
+
+    def query(self, guild=None, user=None, action=None, since=None, until=None, limit=25):
+        """Newest-first records matching every given filter. Scans only the narrowest index."""
+        with self._lock:
+            filters = [(self.by_guild, guild), (self.by_user, user), (self.by_action, action)]
+            lists = [index.get(key, []) for index, key in filters if key is not None]
+            candidates = min(lists, key=len) if lists else self.entries
+            lo = bisect.bisect_left(candidates, since, key=_audit_ts) if since else 0
+            hi = bisect.bisect_right(candidates, until, key=_audit_ts) if until else len(candidates)
+            matches = []
+            for entry in reversed(candidates[lo:hi]):
+                if guild is not None and entry.get("guild") != guild:
+                    continue
+                if user is not None and user not in (entry.get("actor"), entry.get("target")):
+                    continue
+                if action is not None and entry["action"] != action:
+                    continue
+                matches.append(entry)
+                if len(matches) >= limit:
+                    break
+            return matches
+
+    def close(self):
+        """Writes out every queued record and stops the writer. Idempotent."""
+        if self._listener is not None and not self._closed:
+            self._closed = True
+            self._listener.stop()
+
+    def __len__(self):
+        return len(self.entries)
+
+def format_audit_entry(entry):
+    """One-line plain-text summary, shared by /audit and the dashboard."""
+    actor = entry.get("actor_name") or entry.get("actor") or "dashboard"
+    line = f"{entry['action']} by {actor}"
+    if entry.get("target") is not None:
+        line += f" → {entry.get('target_name') or entry['target']}"
+    if entry.get("reason"):
+        line += f" — {entry['reason']}"
+    if entry.get("detail"):
+        line += " (" + ", ".join(f"{k}={v}" for k, v in entry["detail"].items()) + ")"
+    return line
+
+metrics.describe("maestro_audit_records_total", "counter", "Admin audit records appended, by action.")
+
+audit = AuditLog(
+    AUDIT_DIR,
+    segment_bytes=int(os.getenv("AUDIT_SEGMENT_BYTES", 1_000_000)),
+    retention_days=float(os.getenv("AUDIT_RETENTION_DAYS", 90)),
+)
+
+# ==============================================================================
+# SECTION 5: KNOWLEDGE BASE IMPORT
 # ==============================================================================
 try:
     from knowledge import COURSE_NOTES
@@ -112,23 +893,171 @@ except ImportError:
     )
 
 # ==============================================================================
-# SECTION 4: AI BRAIN (TRIPLE FAILOVER)
+# SECTION 6: OFFLINE FALLBACK RESPONDER
+# ==============================================================================
+_WORD = re.compile(r"[a-z0-9_]+(?:\(\))?")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "the", "this", "to", "what", "when", "why", "with", "you", "your",
+    "explain", "please", "tell", "about", "python",
+}
+
+def _terms(text):
+    return [t for t in _WORD.findall(text.lower()) if t not in _STOPWORDS]
+
+class NoteSection:
+    __slots__ = ("title", "bullets", "terms", "length")
+
+    def __init__(self, title, bullets):
+        self.title = title
+        self.bullets = bullets
+        # The cue column is what students ask about; weight it twice
+        self.terms = _terms(title) * 2 + [t for b in bullets for t in _terms(b)]
+        self.length = len(self.terms)
+
+def parse_course_notes(notes):
+    """Splits the two-column notes (cue<TAB>note, then more • lines) into sections."""
+    sections, title, bullets = [], None, []
+    for raw in notes.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if "\t" in raw:
+            if title and bullets:
+                sections.append(NoteSection(title, bullets))
+            title, _, first = raw.partition("\t")
+            title, bullets = title.strip(), [first.strip()] if first.strip() else []
+        elif title:
+            bullets.append(line)
+    if title and bullets:
+        sections.append(NoteSection(title, bullets))
+    return [s for s in sections if not s.title.lower().startswith("question / cue")]
+
+class OfflineResponder:
+    """
+    Last-resort tier when every AI provider fails: BM25 retrieval over the COURSE_NOTES
+    sections, answered from the best-matching bullets. If LOCAL_MODEL_PATH points at a
+    GGUF model and llama_cpp is installed, the retrieved notes are handed to that small
+    CPU model instead. No network access, no API spend.
+    """
+    def __init__(self, notes, model_path=None, k1=1.4, b=0.75):
+        self.notes = notes
+        self.k1, self.b = k1, b
+        self.sections = None        # BM25 index, built by warm_up() or on first use
+        self.model_path = model_path
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+
+    def warm_up(self):
+        """Parses the notes and builds the BM25 index. Idempotent and thread-safe."""
+        with self._index_lock:
+            if self.sections is not None:
+                return
+            sections = parse_course_notes(self.notes)
+            self.avg_len = sum(s.length for s in sections) / max(1, len(sections))
+            df = {}
+            for section in sections:
+                for term in set(section.terms):
+                    df[term] = df.get(term, 0) + 1
+            n = len(sections)
+            self.idf = {t: math.log(1 + (n - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+            self.sections = sections
+
+    def search(self, question, k=2):
+        self.warm_up()
+        query = set(_terms(question))
+        scored = []
+        for section in self.sections:
+            tf = {}
+            for term in section.terms:
+                if term in query:
+                    tf[term] = tf.get(term, 0) + 1
+            score = sum(
+                self.idf[t] * f * (self.k1 + 1) / (f + self.k1 * (1 - self.b + self.b * section.length / self.avg_len))
+                for t, f in tf.items()
+            )
+            if score > 0:
+                scored.append((score, section))
+        scored.sort(key=lambda pair: -pair[0])
+        return [section for _, section in scored[:k]]
+
+    def _load_model(self):
+        with self._model_lock:
+            if self._model is None and self.model_path:
+                try:
+                    from llama_cpp import Llama
+                    self._model = Llama(model_path=self.model_path, n_ctx=2048, n_threads=os.cpu_count() or 2, verbose=False)
+                    logger.info(f"Offline: loaded local model {self.model_path}")
+                except Exception as e:
+                    logger.warning(f"Offline: local model unavailable ({e}); using note retrieval only")
+                    self.model_path = None
+            return self._model
+
+    def _generate(self, question, context):
+        model = self._load_model()
+        if model is None:
+            return None
+        prompt = (
+            "You are Maestro, a PY101 tutor. Answer briefly using only these course notes.\n\n"
+            f"NOTES:\n{context}\n\nQUESTION: {question}\nANSWER:"
+        )
+        with self._model_lock:
+            out = model(prompt, max_tokens=256, temperature=0.2, stop=["QUESTION:"])
+        return out["choices"][0]["text"].strip() or None
+
+    async def answer(self, question, architect_mode=False):
+        if architect_mode:
+            metrics.inc("maestro_ai_fallback_total", mode="none")
+            return "📴 AI providers are unavailable right now, so I can't plan server changes. Try again shortly."
+        sections = self.search(question)
+        if not sections:
+            metrics.inc("maestro_ai_fallback_total", mode="none")
+            topics = ", ".join(s.title for s in self.sections[:8])
+            return (
+                "📴 AI providers are unavailable right now and the course notes don't cover that.\n"
+                f"I can still help with PY101 topics like: {topics}."
+            )
+        context = "\n".join(f"{s.title}: " + " ".join(s.bullets) for s in sections)
+        if self.model_path:
+            try:
+                text = await asyncio.to_thread(self._generate, question, context)
+            except Exception as e:
+                logger.warning(f"Offline: local generation failed: {e}")
+                text = None
+            if text:
+                metrics.inc("maestro_ai_fallback_total", mode="local_model")
+                return f"📴 *Answering offline from the course notes:*\n{text}"
+        metrics.inc("maestro_ai_fallback_total", mode="retrieval")
+        query = set(_terms(question))
+        best = sections[0]
+        bullets = sorted(best.bullets, key=lambda b: -len(query & set(_terms(b))))[:3]
+        body = "\n".join(b if b.startswith("•") else f"• {b}" for b in bullets)
+        more = f"\n\nSee also: **{sections[1].title}**" if len(sections) > 1 and sections[1].title != best.title else ""
+        return f"📴 *AI providers are unavailable, so here's what the course notes say:*\n**{best.title}**\n{body}{more}"
+
+metrics.describe("maestro_ai_fallback_total", "counter", "Offline fallback answers by mode.")
+
+offline = OfflineResponder(COURSE_NOTES, model_path=os.getenv("LOCAL_MODEL_PATH"))
+
+# ==============================================================================
+# SECTION 7: AI BRAIN (TRIPLE FAILOVER)
 # ==============================================================================
 class AIEngine:
     def __init__(self):
         self.k_google = os.getenv("GOOGLE_API_KEY")
         self.k_openai = os.getenv("OPENAI_API_KEY")
         self.k_groq = os.getenv("GROQ_API_KEY")
-
-        if self.k_google:
-            genai.configure(api_key=self.k_google)
-            self.gemini = genai.GenerativeModel("gemini-1.5-flash")
-        else:
-            self.gemini = None
+        if not self.k_google:
             logger.warning("Google API Key missing.")
 
-        self.openai = openai.OpenAI(api_key=self.k_openai) if self.k_openai else None
-        self.groq = Groq(api_key=self.k_groq) if self.k_groq else None
+        # Provider SDKs are slow to import, so clients are built by warm_up() on a
+        # background thread at boot (or on first query) rather than at import time.
+        self.gemini = None
+        self.openai = None
+        self.groq = None
+        self._clients_ready = False
+        self._clients_lock = threading.Lock()
 
         self.system_prompt = (
             f"You are Maestro Bot. Version {VERSION}. "
@@ -140,103 +1069,1508 @@ class AIEngine:
             "Never output JSON for casual conversation or learning questions."
         )
 
-    async def query(self, prompt, architect_mode=False):
-        final_prompt = f"{self.system_prompt}\n\nUSER: {prompt}"
+    def warm_up(self):
+        """Imports provider SDKs and builds clients. Idempotent and thread-safe."""
+        with self._clients_lock:
+            if self._clients_ready:
+                return
+            with startup.phase("clients"):
+                if self.k_google:
+                    try:
+                        import google.generativeai as genai
+                        genai.configure(api_key=self.k_google)
+                        self.gemini = genai.GenerativeModel("gemini-1.5-flash")
+                    except Exception as e:
+                        logger.error(f"Gemini client init failed: {e}")
+                if self.k_openai:
+                    try:
+                        import openai
+                        self.openai = openai.OpenAI(api_key=self.k_openai)
+                    except Exception as e:
+                        logger.error(f"OpenAI client init failed: {e}")
+                if self.k_groq:
+                    try:
+                        from groq import Groq
+                        self.groq = Groq(api_key=self.k_groq)
+                    except Exception as e:
+                        logger.error(f"Groq client init failed: {e}")
+            self._clients_ready = True
+            logger.info(f"AI: provider clients ready in {startup.phases['clients']:.2f}s")
+
+    def _ask_gemini(self, final_prompt):
+        return self.gemini.generate_content(final_prompt).text
+
+    def _ask_openai(self, final_prompt):
+        res = self.openai.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "You are Maestro."},
+                {"role": "user", "content": final_prompt}
+            ]
+        )
+        return res.choices[0].message.content
+
+    def _ask_groq(self, final_prompt):
+        res = self.groq.chat.completions.create(
+            messages=[
+                {"role": "system", "content": "You are Maestro."},
+                {"role": "user", "content": final_prompt}
+            ],
+            model="llama3-8b-8192"
+        )
+        return res.choices[0].message.content
+
+    async def query(self, prompt, architect_mode=False, history=None):
+        final_prompt = f"{self.system_prompt}\n\n"
+        if history:
+            final_prompt += f"CONVERSATION SO FAR:\n{history}\n\n"
+        final_prompt += f"USER: {prompt}"
         if architect_mode:
             final_prompt += "\n\nINSTRUCTION: Output a valid JSON Action Plan."
+        if not self._clients_ready:
+            await asyncio.to_thread(self.warm_up)
 
-        try:
-            if self.gemini:
-                response = self.gemini.generate_content(final_prompt)
-                return response.text
-        except Exception as e:
-            logger.warning(f"Gemini Fail: {e}")
+        providers = [
+            ("gemini", self.gemini, self._ask_gemini),
+            ("openai", self.openai, self._ask_openai),
+            ("groq", self.groq, self._ask_groq),
+        ]
+        failed = None
+        for name, client, ask in providers:
+            if not client:
+                continue
+            if failed:
+                metrics.inc("maestro_ai_failovers_total", source=failed, target=name)
+            try:
+                with metrics.timer("maestro_ai_provider_seconds", provider=name):
+                    # SDK clients are synchronous; run them in a worker thread
+                    return await asyncio.to_thread(ask, final_prompt)
+            except Exception as e:
+                metrics.inc("maestro_ai_provider_failures_total", provider=name)
+                logger.warning(f"{name.capitalize()} Fail: {e}")
+                failed = name
 
-        try:
-            if self.openai:
-                res = self.openai.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": "You are Maestro."},
-                        {"role": "user", "content": final_prompt}
-                    ]
-                )
-                return res.choices[0].message.content
-        except Exception as e:
-            logger.warning(f"OpenAI Fail: {e}")
+        metrics.inc("maestro_ai_offline_total")
+        return await offline.answer(prompt, architect_mode=architect_mode)
+
+brain = AIEngine()
+
+# ==============================================================================
+# SECTION 8: AI ADMISSION CONTROL
+# ==============================================================================
+class RateLimited(Exception):
+    def __init__(self, scope, retry_after):
+        super().__init__(f"{scope} rate limit, retry in {retry_after:.0f}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Gatekeeper in front of AIEngine.query:
+      1. charge(): token buckets per user and per guild reject floods up front.
+      2. slot(): a bounded pool of in-flight provider calls. When it is full, waiters
+         queue per user and freed slots are handed out round-robin across users, so one
+         heavy user cannot hold the queue.
+    Admins and users on the override list skip the buckets but still take a slot.
+    """
+    def __init__(self, max_inflight=4, user_limit=(1 / 20, 5), guild_limit=(1 / 2, 30), notice_window=60):
+        self.max_inflight = max_inflight
+        self.user_limit = user_limit
+        self.guild_limit = guild_limit
+        self._user_buckets = TTLCache(maxsize=20000, ttl=3600)
+        self._guild_buckets = TTLCache(maxsize=5000, ttl=3600)
+        self._notified = TTLCache(maxsize=20000, ttl=notice_window)
+        self.exempt = set(db.load_json("ai_exempt", []))
+        self.inflight = 0
+        self._waiting = OrderedDict()    # user_id -> deque of futures
+        self.closed = False
 
+    def _bucket(self, cache, key, limit):
+        bucket = cache.get(key)
+        if bucket is None:
+            bucket = TokenBucket(*limit)
+            cache.set(key, bucket)
+        return bucket
+
+    def charge(self, user_id, guild_id, bypass=False):
+        """Consumes one request from the user's and guild's buckets or raises RateLimited."""
+        if self.closed:
+            metrics.inc("maestro_ai_admission_total", result="rejected_restart")
+            raise RateLimited("restart", 30)
+        if bypass or user_id in self.exempt:
+            metrics.inc("maestro_ai_admission_total", result="bypass")
+            return
+        user_bucket = self._bucket(self._user_buckets, user_id, self.user_limit)
+        guild_bucket = self._bucket(self._guild_buckets, guild_id, self.guild_limit) if guild_id else None
+        for scope, bucket in (("user", user_bucket), ("guild", guild_bucket)):
+            wait = bucket.ready_in() if bucket else 0
+            if wait > 0:
+                metrics.inc("maestro_ai_admission_total", result=f"rejected_{scope}")
+                raise RateLimited(scope, wait)
+        user_bucket.take()
+        if guild_bucket:
+            guild_bucket.take()
+        metrics.inc("maestro_ai_admission_total", result="admitted")
+
+    def first_notice(self, user_id):
+        """True at most once per user per notice window, so a flood of rejections stays quiet."""
+        if self._notified.get(user_id):
+            return False
+        self._notified.set(user_id, True)
+        return True
+
+    def set_exempt(self, user_id, enabled):
+        (self.exempt.add if enabled else self.exempt.discard)(user_id)
+        db.save_json("ai_exempt", sorted(self.exempt))
+
+    def queue_depth(self):
+        return sum(len(q) for q in self._waiting.values())
+
+    def _position(self, user_id, future):
+        """1-based position of `future` in the round-robin service order."""
+        users = list(self._waiting)
+        mine = self._waiting[user_id]
+        depth = mine.index(future)
+        owner = users.index(user_id)
+        ahead = sum(min(len(q), depth + (1 if i < owner else 0)) for i, q in enumerate(self._waiting.values()))
+        return ahead + 1
+
+    @asynccontextmanager
+    async def slot(self, user_id, on_queued=None):
+        """Holds one in-flight slot for the duration of the block. on_queued(position) is awaited if we wait."""
+        if self.inflight < self.max_inflight and not self._waiting:
+            self.inflight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._waiting.setdefault(user_id, deque()).append(future)
+            metrics.set_gauge("maestro_ai_queue_depth", self.queue_depth())
+            t0 = time.monotonic()
+            if on_queued:
+                # Posted in the background: a slot handed to us must not sit idle behind a send
+                notice = asyncio.create_task(on_queued(self._position(user_id, future)))
+                notice.add_done_callback(self._notice_done)
+            try:
+                await future        # resolved by _release(), which hands us its slot
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release()     # slot was handed to us just as we were cancelled
+                else:
+                    self._forget(user_id, future)
+                raise
+            metrics.observe("maestro_ai_queue_wait_seconds", time.monotonic() - t0)
+        metrics.set_gauge("maestro_ai_inflight", self.inflight)
         try:
-            if self.groq:
-                res = self.groq.chat.completions.create(
-                    messages=[
-                        {"role": "system", "content": "You are Maestro."},
-                        {"role": "user", "content": final_prompt}
-                    ],
-                    model="llama3-8b-8192"
-                )
-                return res.choices[0].message.content
-        except Exception as e:
-            logger.error(f"Groq Fail: {e}")
+            yield
+        finally:
+            self._release()
 
-        return "❌ CRITICAL: All AI systems are offline. Please check API quotas."
+    @staticmethod
+    def _notice_done(task):
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Admission: queue notice failed: {task.exception()}")
 
-brain = AIEngine()
+    def _forget(self, user_id, future):
+        queue_ = self._waiting.get(user_id)
+        if queue_ and future in queue_:
+            queue_.remove(future)
+            if not queue_:
+                del self._waiting[user_id]
+
+    def _release(self):
+        while self._waiting:
+            user_id, queue_ = next(iter(self._waiting.items()))
+            future = queue_.popleft()
+            if queue_:
+                self._waiting.move_to_end(user_id)
+            else:
+                del self._waiting[user_id]
+            if not future.done():
+                future.set_result(None)     # slot passes straight to the next user
+                metrics.set_gauge("maestro_ai_queue_depth", self.queue_depth())
+                return
+        self.inflight -= 1
+        metrics.set_gauge("maestro_ai_inflight", self.inflight)
+        metrics.set_gauge("maestro_ai_queue_depth", 0)
+
+metrics.describe("maestro_ai_admission_total", "counter", "AI admission decisions by result.")
+metrics.describe("maestro_ai_inflight", "gauge", "AI provider calls currently in flight.")
+metrics.describe("maestro_ai_queue_depth", "gauge", "AI requests waiting for a slot.")
+metrics.describe("maestro_ai_queue_wait_seconds", "histogram", "Time AI requests waited for a slot.")
+
+admission = AdmissionController(
+    max_inflight=int(os.getenv("AI_MAX_INFLIGHT", 4)),
+    user_limit=(1 / float(os.getenv("AI_USER_REFILL_SECONDS", 20)), int(os.getenv("AI_USER_BURST", 5))),
+    guild_limit=(1 / float(os.getenv("AI_GUILD_REFILL_SECONDS", 2)), int(os.getenv("AI_GUILD_BURST", 30))),
+    notice_window=float(os.getenv("AI_NOTICE_WINDOW_SECONDS", 60)),
+)
+db.subscribe("ai_exempt", lambda ids: setattr(admission, "exempt", set(ids or [])))
 
 # ==============================================================================
-# SECTION 5: DISCORD BOT CLIENT (WITH SLASH COMMANDS)
+# SECTION 9: CONVERSATION MEMORY
 # ==============================================================================
-class MaestroBot(commands.Bot):
-    def __init__(self):
-        intents = discord.Intents.default()
-        intents.members = True
-        intents.message_content = True
-        intents.reactions = True
-        super().__init__(command_prefix="!", intents=intents)
-        self.active_loop = None
+def estimate_tokens(text):
+    """Cheap provider-agnostic estimate (~4 chars per token); good enough for budgeting."""
+    return len(text) // 4 + 1
 
-    async def setup_hook(self):
-        # FIX: Sync slash commands to a specific guild for instant propagation during dev.
-        # To go global (up to 1 hour delay), remove guild= and use: await self.tree.sync()
-        guild_id = os.getenv("DEV_GUILD_ID")
-        if guild_id:
-            guild_obj = discord.Object(id=int(guild_id))
-            self.tree.copy_global_to(guild=guild_obj)
-            await self.tree.sync(guild=guild_obj)
-            logger.info(f"Bot Setup Hook: Slash Commands synced to dev guild {guild_id}.")
-        else:
-            await self.tree.sync()
-            logger.info("Bot Setup Hook: Slash Commands synced globally (may take up to 1 hour).")
+class Turn:
+    __slots__ = ("role", "text", "tokens")
 
-        self.active_loop = asyncio.get_running_loop()
+    def __init__(self, role, text):
+        self.role = role
+        self.text = text
+        self.tokens = estimate_tokens(text)
 
-bot = MaestroBot()
+class Conversation:
+    __slots__ = ("turns", "tokens", "summary", "last_active")
 
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)
+        self.tokens = 0
+        self.summary = ""
+        self.last_active = time.monotonic()
 
-def parse_hex_color(int_color):
-    return f"#{int_color:06x}"
+class ConversationMemory:
+    """
+    Per-channel (and therefore per-thread) history for mention chat.
+    Recent turns live in a ring buffer capped by both turn count and token budget; turns
+    pushed out are folded into a short extractive rolling summary instead of being lost.
+    Conversations idle for `idle_ttl` seconds, or beyond `max_conversations` (LRU), are dropped.
+    """
+    def __init__(self, max_conversations=500, token_budget=1200, max_turns=16,
+                 summary_tokens=300, idle_ttl=1800, turn_chars=1500):
+        self.max_conversations = max_conversations
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.summary_chars = summary_tokens * 4
+        self.idle_ttl = idle_ttl
+        self.turn_chars = turn_chars
+        self._convos = OrderedDict()
 
+    def _evict_idle(self, now):
+        while self._convos:
+            key, convo = next(iter(self._convos.items()))
+            if now - convo.last_active < self.idle_ttl and len(self._convos) <= self.max_conversations:
+                break
+            del self._convos[key]
+        metrics.set_gauge("maestro_conversations_active", len(self._convos))
 
-async def send_interaction_chunks(interaction: discord.Interaction, text: str):
-    """Safe sender for long AI responses in Slash Commands."""
-    if not text:
-        return
-    if len(text) < 2000:
-        await interaction.followup.send(text)
-    else:
-        await interaction.followup.send(text[:1900])
-        for i in range(1900, len(text), 1900):
-            await interaction.channel.send(text[i:i + 1900])
-            await asyncio.sleep(0.5)
+    def _fold(self, convo, turn):
+        """Adds the first sentence of an evicted turn to the rolling summary, keeping the newest tail."""
+        first = re.split(r"(?<=[.!?])\s", turn.text.strip(), maxsplit=1)[0][:200]
+        summary = f"{convo.summary} {turn.role}: {first}".strip()
+        if len(summary) > self.summary_chars:
+            summary = "…" + summary[-self.summary_chars:].split(" ", 1)[-1]
+        convo.summary = summary
+
+    def record(self, key, role, text):
+        now = time.monotonic()
+        convo = self._convos.get(key)
+        if convo is None:
+            convo = self._convos[key] = Conversation(self.max_turns)
+        self._convos.move_to_end(key)
+        convo.last_active = now
+
+        if len(text) > self.turn_chars:
+            text = text[:self.turn_chars] + "…"
+        if len(convo.turns) == convo.turns.maxlen:
+            dropped = convo.turns[0]
+            convo.tokens -= dropped.tokens
+            self._fold(convo, dropped)
+        turn = Turn(role, text)
+        convo.turns.append(turn)
+        convo.tokens += turn.tokens
+        while convo.tokens > self.token_budget and len(convo.turns) > 1:
+            dropped = convo.turns.popleft()
+            convo.tokens -= dropped.tokens
+            self._fold(convo, dropped)
+        self._evict_idle(now)
+
+    def context(self, key):
+        """Renders the conversation for the prompt, or "" if there is none (or it went idle)."""
+        convo = self._convos.get(key)
+        if convo is None:
+            return ""
+        if time.monotonic() - convo.last_active >= self.idle_ttl:
+            del self._convos[key]
+            return ""
+        lines = [f"(Earlier: {convo.summary})"] if convo.summary else []
+        lines += [f"{t.role.upper()}: {t.text}" for t in convo.turns]
+        return "\n".join(lines)
+
+    def forget(self, key):
+        return self._convos.pop(key, None) is not None
+
+    def __len__(self):
+        return len(self._convos)
+
+metrics.describe("maestro_conversations_active", "gauge", "Mention-chat conversations held in memory.")
+
+memory = ConversationMemory(
+    max_conversations=int(os.getenv("CHAT_MAX_CONVERSATIONS", 500)),
+    token_budget=int(os.getenv("CHAT_TOKEN_BUDGET", 1200)),
+    idle_ttl=int(os.getenv("CHAT_IDLE_SECONDS", 1800)),
+)
 
 # ==============================================================================
-# SECTION 6: WEB DASHBOARD & WEBHOOK LISTENER
+# SECTION 10: CONTENT BANK
 # ==============================================================================
-class DashboardHandler(BaseHTTPRequestHandler):
-    def log_message(self, format, *args):
-        # Suppress default HTTP access logs to keep our logger clean
-        pass
+CONTENT_KINDS = {
+    "flashcard": {
+        "fields": ("question", "answer"),
+        "prompt": (
+            "Create {n} distinct beginner flashcards about {topic}. Respond with ONLY a JSON array "
+            'of objects with string fields "question" and "answer". No markdown, no commentary.'
+        ),
+    },
+    "challenge": {
+        "fields": ("title", "prompt"),
+        "prompt": (
+            "Create {n} distinct beginner Python coding challenges about {topic}. Respond with ONLY a "
+            'JSON array of objects with string fields "title" and "prompt" (the problem description, '
+            'no solution) and "difficulty" (easy, medium or hard). No markdown, no commentary.'
+        ),
+    },
+}
 
-    def check_auth(self):
+class ContentBank:
+    """
+    Pre-generated flashcards and challenges, keyed by kind and topic, served instantly.
+    A background worker tops a topic up in batches when a user's unseen pool runs low,
+    but only while no user-facing AI request is running or queued. Items are validated
+    JSON records; each user's served ids are tracked so nobody sees a repeat until the
+    topic has grown. That history is kept for the `max_seen_users` most recent users.
+    """
+    def __init__(self, batch=6, low_water=2, max_per_topic=60, max_topics=200, seen_per_user=500,
+                 max_seen_users=5000, seed_topics=("python",)):
+        self.batch = batch
+        self.low_water = low_water
+        self.max_per_topic = max_per_topic
+        self.max_topics = max_topics
+        self.seen_per_user = seen_per_user
+        self.max_seen_users = max_seen_users
+        state = db.load_json("content_bank", {})
+        self.pools = {kind: state.get(kind, {}) for kind in CONTENT_KINDS}
+        self.seen = state.get("seen", {})
+        self._dirty = False
+        self._wanted = deque((kind, topic) for kind in CONTENT_KINDS for topic in seed_topics)
+        self._task = None
+
+    @staticmethod
+    def normalize_topic(topic):
+        return " ".join(topic.lower().split())[:40] or "python"
+
+    def prompt(self, kind, topic, n=None):
+        return CONTENT_KINDS[kind]["prompt"].format(n=n or self.batch, topic=topic)
+
+    @staticmethod
+    def parse(kind, text):
+        """Extracts and validates the JSON array a generation prompt asked for. Bad items are dropped."""
+        start, end = text.find("["), text.rfind("]")
+        if start < 0 or end <= start:
+            return []
+        try:
+            raw = json.loads(text[start:end + 1])
+        except ValueError:
+            return []
+        items = []
+        for entry in raw if isinstance(raw, list) else []:
+            if not isinstance(entry, dict):
+                continue
+            fields = CONTENT_KINDS[kind]["fields"]
+            if not all(isinstance(entry.get(f), str) and 3 <= len(entry[f].strip()) <= 1500 for f in fields):
+                continue
+            item = {f: entry[f].strip() for f in fields}
+            if kind == "challenge":
+                difficulty = str(entry.get("difficulty", "easy")).lower()
+                item["difficulty"] = difficulty if difficulty in ("easy", "medium", "hard") else "easy"
+            item["id"] = hashlib.sha1(item[fields[0]].lower().encode()).hexdigest()[:12]
+            items.append(item)
+        return items
+
+    def add(self, kind, topic, items):
+        topic = self.normalize_topic(topic)
+        pool = self.pools[kind].setdefault(topic, [])
+        known = {item["id"] for item in pool}
+        fresh = [item for item in items if item["id"] not in known and not known.add(item["id"])]
+        pool.extend(fresh)
+        del pool[:-self.max_per_topic]
+        while len(self.pools[kind]) > self.max_topics:
+            self.pools[kind].pop(next(iter(self.pools[kind])))
+        if (kind, topic) in self._wanted:
+            self._wanted.remove((kind, topic))      # a live generation already topped it up
+        self._dirty = True
+        metrics.inc("maestro_content_generated_total", len(fresh), kind=kind)
+        return len(fresh)
+
+    def take(self, kind, topic, user_id):
+        """
+        Returns an item this user hasn't seen, or None. Queues a background refill when the
+        user's pool is running low; on a miss the caller generates live (see bank_item).
+        """
+        topic = self.normalize_topic(topic)
+        seen = self.seen.pop(str(user_id), [])
+        self.seen[str(user_id)] = seen      # most recently active users last
+        while len(self.seen) > self.max_seen_users:
+            self.seen.pop(next(iter(self.seen)))
+        seen_ids = set(seen)
+        unseen = [item for item in self.pools[kind].get(topic, ()) if item["id"] not in seen_ids]
+        if 0 < len(unseen) <= self.low_water:
+            self.want(kind, topic)
+        if not unseen:
+            metrics.inc("maestro_content_served_total", kind=kind, result="miss")
+            return None
+        item = random.choice(unseen)
+        seen.append(item["id"])
+        del seen[:-self.seen_per_user]
+        self._dirty = True
+        metrics.inc("maestro_content_served_total", kind=kind, result="hit")
+        return item
+
+    def want(self, kind, topic):
+        key = (kind, self.normalize_topic(topic))
+        if key not in self._wanted:
+            self._wanted.append(key)
+
+    def flush(self):
+        if self._dirty:
+            db.save_json("content_bank", {**self.pools, "seen": self.seen})
+            self._dirty = False
+
+    def start(self):
+        self._task = asyncio.create_task(self._refill_loop())
+
+    async def _refill_loop(self):
+        while True:
+            await asyncio.sleep(5)
+            self.flush()
+            # Only generate when the AI pool is idle so users never queue behind us
+            if not self._wanted or admission.inflight or admission.queue_depth():
+                continue
+            kind, topic = self._wanted.popleft()
+            try:
+                async with admission.slot("content_bank"):
+                    text = await brain.query(self.prompt(kind, topic))
+                added = self.add(kind, topic, self.parse(kind, text))
+                logger.info(f"ContentBank: +{added} {kind}(s) for '{topic}'")
+            except Exception as e:
+                logger.warning(f"ContentBank: refill {kind}/{topic} failed: {e}")
+
+metrics.describe("maestro_content_served_total", "counter", "Content bank lookups by kind and hit/miss.")
+metrics.describe("maestro_content_generated_total", "counter", "Validated content bank items generated.")
+
+bank = ContentBank()
+
+# ==============================================================================
+# SECTION 11: CODE PRECHECK
+# ==============================================================================
+_BUILTIN_NAMES = set(dir(builtins)) | {"__name__", "__file__", "__doc__", "__builtins__"}
+_STR_CALLS = {"input", "str", "repr", "format", "chr"}
+_NUM_CALLS = {"int", "float", "len", "round", "abs", "sum", "ord"}
+_DYNAMIC_BINDERS = {"exec", "globals", "vars", "setattr"}   # can bind names the AST never shows
+
+# Short reminders tied to the course notes in knowledge.py
+PRECHECK_HINTS = {
+    "SyntaxError": "A SyntaxError is a grammar mistake: Python refuses to start the program at all.",
+    "NameError": "Python reads top to bottom. A name must be assigned (and spelled the same) before it's used.",
+    "TypeError": "`+` adds numbers but glues strings. Convert first: `str(25)` or `int(\"25\")`.",
+    "Unused": "Assigned but never used. Either use it or remove it to keep the code DRY and readable.",
+}
+
+class Finding:
+    """One precheck result. Only `certain` findings (the code cannot run) may skip the AI review."""
+    __slots__ = ("line", "kind", "message", "certain")
+
+    def __init__(self, line, kind, message, certain=False):
+        self.line = line
+        self.kind = kind
+        self.message = message
+        self.certain = certain
+
+    def __str__(self):
+        return f"Line {self.line}: **{self.kind}**: {self.message}"
+
+def strip_code_fences(code):
+    match = re.search(r"```(?:python|py)?[ \t]*\n?(.*?)```", code, re.DOTALL)
+    return match.group(1) if match else code
+
+class _LintVisitor(ast.NodeVisitor):
+    """Str/number `+` mixes via light type tracking, and unused locals per function. Never executes anything."""
+    def __init__(self):
+        self.findings = []
+        self.env = [{}]
+
+    def _kind(self, node):
+        if isinstance(node, ast.Constant) and not isinstance(node.value, bool):
+            if isinstance(node.value, str):
+                return "str"
+            if isinstance(node.value, (int, float)):
+                return "number"
+        if isinstance(node, ast.JoinedStr):
+            return "str"
+        if isinstance(node, ast.Name):
+            return self.env[-1].get(node.id)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            if node.func.id in _STR_CALLS:
+                return "str"
+            if node.func.id in _NUM_CALLS:
+                return "number"
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod)):
+            if self._kind(node.left) == self._kind(node.right) == "number":
+                return "number"
+        return None
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        kind = self._kind(node.value)
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                self.env[-1][target.id] = kind
+            else:
+                self.visit(target)
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Add):
+            kinds = {self._kind(node.left), self._kind(node.right)}
+            if kinds == {"str", "number"}:
+                self.findings.append(Finding(
+                    node.lineno, "TypeError", "adding text and a number with `+` will crash (str + int)."
+                ))
+
+    def visit_FunctionDef(self, node):
+        self.env.append({})
+        self.generic_visit(node)
+        self.env.pop()
+        self._unused(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def _unused(self, func):
+        declared = {n for s in ast.walk(func) if isinstance(s, (ast.Global, ast.Nonlocal)) for n in s.names}
+        params = {a.arg for a in ast.walk(func.args) if isinstance(a, ast.arg)}
+        loaded = {n.id for n in ast.walk(func) if isinstance(n, ast.Name) and not isinstance(n.ctx, ast.Store)}
+        stored = {}
+        for body_node in func.body:
+            for n in ast.walk(body_node):
+                if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store):
+                    stored.setdefault(n.id, n.lineno)
+        for name, line in stored.items():
+            if name not in loaded and name not in params and name not in declared and not name.startswith("_"):
+                self.findings.append(Finding(line, "Unused", f"`{name}` is assigned in `{func.name}()` but never used."))
+
+def _bound_names(tree):
+    """Every name bound anywhere (assignments, defs, params, imports, loop/with/except targets)."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.alias):
+            names.add((node.asname or node.name).split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            names.add(node.name)
+    return names
+
+def _eager_names(stmt, ctx):
+    """
+    Names of `ctx` in a top-level statement that run when it does. A def or class only
+    evaluates its decorators, defaults and bases up front; bodies and lambdas run later.
+    Annotations are skipped: `from __future__ import annotations` (and 3.14) never evaluate them.
+    """
+    if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        stack = list(stmt.decorator_list)
+        if isinstance(stmt, ast.ClassDef):
+            stack += stmt.bases + [k.value for k in stmt.keywords]
+        else:
+            stack += stmt.args.defaults + [d for d in stmt.args.kw_defaults if d is not None]
+    else:
+        stack = [stmt]
+    found = {}
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            continue
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ctx):
+            found.setdefault(node.id, node.lineno)
+        if isinstance(node, ast.AnnAssign):
+            stack += [node.target] + ([node.value] if node.value else [])
+            continue
+        stack.extend(ast.iter_child_nodes(node))
+    return found
+
+def _name_findings(tree):
+    if any(isinstance(n, ast.ImportFrom) and any(a.name == "*" for a in n.names) for n in ast.walk(tree)):
+        return []       # star imports make every name potentially defined
+    bound = _bound_names(tree)
+    known = bound | _BUILTIN_NAMES
+    compound = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.Try, ast.With, ast.AsyncWith, ast.Match)
+    # An undefined name certainly crashes only if it is loaded by an unconditional top-level
+    # statement; loads in function bodies may never run, and exec() / globals() can bind anything.
+    dynamic = any(isinstance(n, ast.Name) and n.id in _DYNAMIC_BINDERS for n in ast.walk(tree))
+    eager = set() if dynamic else {
+        name for stmt in tree.body if not isinstance(stmt, compound) for name in _eager_names(stmt, ast.Load)
+    }
+    findings = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in known:
+            close = difflib.get_close_matches(node.id, known, n=1)
+            hint = f" (did you mean `{close[0]}`?)" if close else ""
+            findings.append(Finding(
+                node.lineno, "NameError", f"`{node.id}` is never defined{hint}.", certain=node.id in eager,
+            ))
+
+    # Module level runs top to bottom: using a name before the statement that first assigns it.
+    # Certain only for an unconditional statement and a name no function rebinds via `global`.
+    declared_global = {n for s in ast.walk(tree) if isinstance(s, ast.Global) for n in s.names}
+    first_bound, defined = {}, set()
+    for stmt in tree.body:
+        for name in _eager_names(stmt, ast.Store):
+            first_bound.setdefault(name, stmt.lineno)
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            first_bound.setdefault(stmt.name, stmt.lineno)
+    for stmt in tree.body:
+        stored_here = set(_eager_names(stmt, ast.Store))
+        for name, line in _eager_names(stmt, ast.Load).items():
+            if name in first_bound and name not in defined and name not in stored_here and first_bound[name] > stmt.lineno:
+                findings.append(Finding(
+                    line, "NameError", f"`{name}` is used before line {first_bound[name]} assigns it.",
+                    certain=not isinstance(stmt, compound) and name not in declared_global and not dynamic,
+                ))
+        defined |= stored_here
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            defined.add(stmt.name)
+    return findings
+
+def precheck_code(code):
+    """
+    Static checks for /review: parse, compile (no execution) and a few lint rules.
+    Returns findings sorted by line; an empty list means nothing obvious was found.
+    """
+    source = strip_code_fences(code)
+    try:
+        tree = ast.parse(source, "<review>")
+        compile(tree, "<review>", "exec")
+    except SyntaxError as e:
+        where = f"\n```\n{e.text.rstrip()}\n{' ' * max(0, (e.offset or 1) - 1)}^\n```" if e.text else ""
+        msg = e.msg if e.msg.endswith((".", "?", "!")) else e.msg + "."
+        return [Finding(e.lineno or 1, "SyntaxError", f"{msg}{where}", certain=True)]
+    except (ValueError, RecursionError, MemoryError):
+        return []       # pathological input: leave it to the full review
+    linter = _LintVisitor()
+    linter.visit(tree)
+    findings = _name_findings(tree) + linter.findings
+    return sorted(findings, key=lambda f: (f.line, f.kind))
+
+def format_findings(findings, limit=10):
+    lines = [str(f) for f in findings[:limit]]
+    if len(findings) > limit:
+        lines.append(f"…and {len(findings) - limit} more")
+    hints = [PRECHECK_HINTS[k] for k in dict.fromkeys(f.kind for f in findings)]
+    return "\n".join(lines) + "\n\n" + "\n".join(f"💡 {h}" for h in hints)
+
+metrics.describe("maestro_review_precheck_total", "counter", "/review submissions by precheck outcome.")
+
+# ==============================================================================
+# SECTION 12: HTTP CLIENT & DOCUMENT CACHE
+# ==============================================================================
+STUDY_HELPER_README_URL = "https://raw.githubusercontent.com/MacTheAnon/study-helper/main/README.md"
+
+class HttpClient:
+    """One pooled aiohttp session for all non-Discord HTTP, opened in setup_hook."""
+    def __init__(self, pool_size=20, timeout=10):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = None
+
+    async def start(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": f"MaestroBot/{VERSION}"}
+            )
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    async def get(self, url, headers=None):
+        """Returns (status, response headers, text). Text is empty for non-200 responses."""
+        await self.start()
+        async with self.session.get(url, headers=headers or {}) as resp:
+            text = await resp.text() if resp.status == 200 else ""
+            metrics.inc("maestro_http_requests_total", host=resp.url.host, status=resp.status)
+            return resp.status, resp.headers, text
+
+class DocumentCache:
+    """
+    Stale-while-revalidate cache for external documents. Cached copies are served
+    immediately; once older than `max_age` a background conditional GET (ETag /
+    Last-Modified) refreshes them, so an unchanged document costs a body-less 304.
+    """
+    def __init__(self, client, max_age=300):
+        self.client = client
+        self.max_age = max_age
+        self._docs = {}        # url -> {"body", "etag", "last_modified", "fetched"}
+        self._inflight = {}    # url -> Task, so concurrent misses share one request
+
+    async def get(self, url):
+        """Returns the document text, or None if it has never been fetched successfully."""
+        doc = self._docs.get(url)
+        if doc is None:
+            metrics.inc("maestro_document_cache_total", result="miss")
+            return await self._refresh(url)
+        if time.monotonic() - doc["fetched"] > self.max_age:
+            metrics.inc("maestro_document_cache_total", result="stale")
+            self._refresh(url)
+        else:
+            metrics.inc("maestro_document_cache_total", result="hit")
+        return doc["body"]
+
+    def prefetch(self, url):
+        return self._refresh(url)
+
+    def _refresh(self, url):
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        return task
+
+    async def _fetch(self, url):
+        doc = self._docs.get(url)
+        headers = {}
+        if doc and doc["etag"]:
+            headers["If-None-Match"] = doc["etag"]
+        if doc and doc["last_modified"]:
+            headers["If-Modified-Since"] = doc["last_modified"]
+        try:
+            status, resp_headers, text = await self.client.get(url, headers)
+        except Exception as e:
+            logger.warning(f"DocumentCache: fetch failed for {url}: {e}")
+            return doc["body"] if doc else None
+
+        if status == 304 and doc:
+            doc["fetched"] = time.monotonic()
+            return doc["body"]
+        if status == 200:
+            self._docs[url] = {
+                "body": text,
+                "etag": resp_headers.get("ETag"),
+                "last_modified": resp_headers.get("Last-Modified"),
+                "fetched": time.monotonic(),
+            }
+            return text
+        logger.warning(f"DocumentCache: {url} returned HTTP {status}")
+        return doc["body"] if doc else None
+
+metrics.describe("maestro_http_requests_total", "counter", "Outbound non-Discord HTTP requests.")
+metrics.describe("maestro_document_cache_total", "counter", "Document cache lookups by result.")
+
+http = HttpClient()
+documents = DocumentCache(http)
+
+# ==============================================================================
+# SECTION 13: DISCORD BOT CLIENT (WITH SLASH COMMANDS)
+# ==============================================================================
+class MaestroCommandTree(app_commands.CommandTree):
+    """Timing middleware: stamps every slash interaction; completion/error handlers record it."""
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["t0"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        record_command(interaction, "error")
+        await super().on_error(interaction, error)
+
+def record_command(interaction: discord.Interaction, status):
+    t0 = interaction.extras.get("t0")
+    name = interaction.command.qualified_name if interaction.command else "unknown"
+    metrics.inc("maestro_commands_total", command=name, status=status)
+    if t0 is None:
+        return
+    elapsed = time.perf_counter() - t0
+    metrics.observe("maestro_command_seconds", elapsed, command=name)
+    logger.info(
+        f"Command /{name} {status} in {elapsed * 1000:.0f} ms",
+        extra={
+            "guild": interaction.guild_id, "user": interaction.user.id,
+            "command": name, "latency_ms": round(elapsed * 1000, 1)
+        }
+    )
+
+def command_tree_hash(tree, guild=None):
+    """Stable digest of the command payloads Discord would receive for this scope."""
+    payload = sorted(
+        (cmd.to_dict(tree) for cmd in tree.get_commands(guild=guild)),
+        key=lambda c: (c.get("type", 1), c["name"])
+    )
+    blob = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+def sync_guild_ids():
+    """Guilds to sync to instead of global: SYNC_GUILD_IDS (comma-separated) plus DEV_GUILD_ID."""
+    raw = ",".join(filter(None, [os.getenv("SYNC_GUILD_IDS"), os.getenv("DEV_GUILD_ID")]))
+    return sorted({int(g) for g in raw.split(",") if g.strip()})
+
+def shard_options():
+    if not SHARDED:
+        return {}
+    return {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS or None}
+
+class MaestroBot(commands.AutoShardedBot if SHARDED else commands.Bot):
+    def __init__(self):
+        intents = discord.Intents.default()
+        intents.members = True
+        intents.message_content = True
+        intents.reactions = True
+        super().__init__(command_prefix="!", intents=intents, tree_cls=MaestroCommandTree, **shard_options())
+        self.active_loop = None
+
+    async def setup_hook(self):
+        self.active_loop = asyncio.get_running_loop()
+        lifecycle.install(self.active_loop)
+        self.loop.create_task(loop_lag_monitor())
+        watchdog.start(self.active_loop)
+        await http.start()
+        await asyncio.to_thread(audit.start)
+        documents.prefetch(STUDY_HELPER_README_URL)
+        reminders.start()
+        bank.start()
+        if db.store.shared:
+            self.loop.create_task(db.watch())
+        outbound.start()
+        dashboard.start()
+        onboarding.start()
+        polls.start()
+
+        if IS_PRIMARY:
+            # The command tree is application-wide; one shard process syncing it is enough
+            with startup.phase("command_sync"):
+                await self.sync_commands()
+        startup.begin("gateway_connect")
+
+    async def sync_commands(self):
+        """
+        Syncs the command tree only where its hash changed since the last successful sync,
+        so restarts (and crash loops) don't spend Discord's sync rate limit. Guild scopes
+        sync in parallel. Set FORCE_COMMAND_SYNC=1 to sync regardless.
+        """
+        state = db.load_json("command_sync", {})
+        force = os.getenv("FORCE_COMMAND_SYNC") == "1"
+
+        # Guild syncs propagate instantly (dev/cohort servers); global can take up to 1 hour.
+        guilds = [discord.Object(id=g) for g in sync_guild_ids()] or [None]
+        for guild in guilds:
+            if guild:
+                self.tree.copy_global_to(guild=guild)
+
+        async def sync_scope(guild):
+            scope = f"{self.application_id}:{guild.id if guild else 'global'}"
+            digest = command_tree_hash(self.tree, guild)
+            if not force and state.get(scope) == digest:
+                return scope, "unchanged"
+            await self.tree.sync(guild=guild)
+            state[scope] = digest
+            return scope, "synced"
+
+        results = await asyncio.gather(*(sync_scope(g) for g in guilds), return_exceptions=True)
+        for guild, result in zip(guilds, results):
+            where = f"guild {guild.id}" if guild else "global"
+            if isinstance(result, Exception):
+                logger.error(f"Bot Setup Hook: Slash Command sync failed for {where}: {result}")
+            else:
+                logger.info(f"Bot Setup Hook: Slash Commands {result[1]} ({where}).")
+        db.save_json("command_sync", state)
+
+    async def close(self):
+        await http.close()
+        await super().close()
+
+bot = MaestroBot()
+
+
+def parse_hex_color(int_color):
+    return f"#{int_color:06x}"
+
+
+# ==============================================================================
+# SECTION 14: OUTBOUND SEND SCHEDULER
+# ==============================================================================
+PRIORITY_MODERATION = 0    # scam alerts, mod-log
+PRIORITY_INTERACTIVE = 1   # replies to a user who is waiting
+PRIORITY_BULK = 2          # broadcasts, DM blasts, welcome DMs
+PRIORITY_NAMES = {PRIORITY_MODERATION: "moderation", PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+# (tokens per second, burst) per route kind. Discord allows ~5 messages / 5 s per channel;
+# DMs share one global bucket so a broadcast never looks like a spam burst.
+ROUTE_LIMITS = {
+    "channel": (1.0, 5),
+    "webhook": (1.0, 5),
+    "reaction": (4.0, 1),
+    "dm": (2.0, 2),
+}
+
+class OutboundScheduler:
+    """
+    Single choke point for outbound Discord sends. Jobs wait in per-priority, per-guild
+    FIFOs; the dispatcher always serves the highest priority class first, round-robins
+    across guilds within a class, and only dispatches a job once its route bucket has a
+    token. Bulk jobs are capped to a share of the in-flight slots so a /dmall can never
+    occupy every slot while a moderation or interactive send is waiting. One-off interaction
+    acknowledgements (send_message / a single followup) deliberately bypass it: they ride
+    the interaction's own webhook token and must land within Discord's response window.
+    """
+    def __init__(self, max_inflight=8, bulk_inflight=4, lookahead=32):
+        self.max_inflight = max_inflight
+        self.bulk_inflight = bulk_inflight
+        self.lookahead = lookahead     # jobs scanned per guild queue for one with a ready route
+        self._queues = {p: OrderedDict() for p in PRIORITY_NAMES}   # priority -> guild -> deque
+        self._buckets = {}
+        self._inflight = {p: 0 for p in PRIORITY_NAMES}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._dispatch())
+
+    def pending(self):
+        return sum(len(q) for guilds in self._queues.values() for q in guilds.values())
+
+    def inflight(self):
+        return sum(self._inflight.values())
+
+    def submit(self, factory, *, priority=PRIORITY_INTERACTIVE, route, guild_id=None):
+        """Queues `factory()` (a coroutine function) and returns a future for its result."""
+        future = asyncio.get_running_loop().create_future()
+        # Fire-and-forget callers never await the future; mark failures as retrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        job = (factory, route, future, time.monotonic())
+        self._queues[priority].setdefault(guild_id, deque()).append(job)
+        metrics.set_gauge("maestro_outbound_pending", self.pending())
+        self._wakeup.set()
+        return future
+
+    def send(self, destination, *args, priority=PRIORITY_INTERACTIVE, **kwargs):
+        """Queues destination.send(*args, **kwargs) on the destination's route."""
+        route, guild_id = outbound_route(destination)
+        return self.submit(lambda: destination.send(*args, **kwargs), priority=priority, route=route, guild_id=guild_id)
+
+    def _bucket(self, route):
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = self._buckets[route] = TokenBucket(*ROUTE_LIMITS.get(route.split(":", 1)[0], (1.0, 5)))
+        return bucket
+
+    def _next_job(self):
+        """Returns (priority, job) ready to run now, or (None, seconds until one might be)."""
+        now = time.monotonic()
+        soonest = None
+        if sum(self._inflight.values()) >= self.max_inflight:
+            return None, None
+        for priority, guilds in self._queues.items():
+            if priority == PRIORITY_BULK and self._inflight[priority] >= self.bulk_inflight:
+                continue
+            for guild_id in list(guilds):
+                queue_ = guilds[guild_id]
+                # A rate-limited channel mustn't hold up the guild's other routes; jobs
+                # sharing a route stay FIFO because a route behind an unready one is skipped.
+                blocked = set()
+                for index, job in enumerate(islice(queue_, self.lookahead)):
+                    route = job[1]
+                    if route in blocked:
+                        continue
+                    bucket = self._bucket(route)
+                    wait = bucket.ready_in(now)
+                    if wait > 0:
+                        blocked.add(route)
+                        soonest = wait if soonest is None else min(soonest, wait)
+                        continue
+                    bucket.take()
+                    del queue_[index]
+                    if queue_:
+                        guilds.move_to_end(guild_id)   # round-robin across guilds
+                    else:
+                        del guilds[guild_id]
+                    return priority, job
+        return None, soonest
+
+    async def _dispatch(self):
+        while True:
+            priority, job = self._next_job()
+            if priority is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), job)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._inflight[priority] += 1
+            asyncio.create_task(self._run(priority, job))
+
+    async def _run(self, priority, job):
+        factory, route, future, enqueued = job
+        name = PRIORITY_NAMES[priority]
+        metrics.observe("maestro_outbound_queue_seconds", time.monotonic() - enqueued, priority=name)
+        try:
+            result = await factory()
+            if not future.done():
+                future.set_result(result)
+            metrics.inc("maestro_outbound_sent_total", priority=name, status="ok")
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            metrics.inc("maestro_outbound_sent_total", priority=name, status="error")
+        finally:
+            self._inflight[priority] -= 1
+            metrics.set_gauge("maestro_outbound_pending", self.pending())
+            self._wakeup.set()
+
+def outbound_route(destination):
+    """Maps a send destination to (route key, guild id) for bucketing and fair queuing."""
+    if isinstance(destination, (discord.User, discord.Member, discord.DMChannel)):
+        return "dm", None
+    guild = getattr(destination, "guild", None)
+    return f"channel:{destination.id}", guild.id if guild else None
+
+metrics.describe("maestro_outbound_queue_seconds", "histogram", "Time outbound sends waited in the scheduler.")
+metrics.describe("maestro_outbound_sent_total", "counter", "Outbound sends by priority and status.")
+metrics.describe("maestro_outbound_pending", "gauge", "Outbound sends waiting in the scheduler.")
+
+outbound = OutboundScheduler()
+
+async def dm_opted_in(text, kind):
+    """Bulk-priority DM to every opted-in user. Returns how many were delivered."""
+    async def deliver(uid):
+        user = bot.get_user(int(uid)) or await bot.fetch_user(int(uid))
+        await user.send(text)
+
+    futures = [
+        outbound.submit(lambda uid=uid: deliver(uid), priority=PRIORITY_BULK, route="dm")
+        for uid in list(db.dm_optins)
+    ]
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    count = sum(1 for r in results if not isinstance(r, Exception))
+    metrics.inc("maestro_broadcast_messages_total", count, kind=kind, status="sent")
+    metrics.inc("maestro_broadcast_messages_total", len(results) - count, kind=kind, status="failed")
+    return count
+
+# ==============================================================================
+# SECTION 15: RESPONSE PAGINATION
+# ==============================================================================
+MESSAGE_LIMIT = 2000
+EMBED_DESC_LIMIT = 4096
+EMBED_PAGE_SIZE = 2900           # two pages fit one message under the 6000-char embed total
+MAX_PAGED_MESSAGES = 3           # beyond this one file attachment is cheaper
+
+_FENCE_RE = re.compile(r"^\s*```(\S*)")
+
+def _wrap_lines(text, width):
+    """Yields lines no longer than width, breaking long lines at spaces, then hard."""
+    for line in text.split("\n"):
+        while len(line) > width:
+            cut = line.rfind(" ", 0, width)
+            if cut <= 0:
+                cut = width
+            yield line[:cut]
+            line = line[cut:].lstrip(" ")
+        yield line
+
+def paginate(text, limit=MESSAGE_LIMIT):
+    """
+    Splits text into chunks of at most `limit` characters, preferring paragraph breaks
+    over line breaks over word breaks. A code fence that is open at a split is closed
+    at the end of the chunk and re-opened (same language) at the start of the next.
+    """
+    chunks = []
+    lines = []          # [(line, fence language open after this line or None)]
+    opener = None       # fence re-opened at the top of the current chunk
+    fence = None
+
+    def chunk_len(part, carried):
+        head = len(carried) + 4 if carried is not None else 0
+        return head + sum(len(line) + 1 for line, _ in part) + 4   # +4: room for a closing fence
+
+    def emit(part, carried):
+        body = "\n".join(line for line, _ in part)
+        if carried is not None:
+            body = f"```{carried}\n{body}"
+        if part and part[-1][1] is not None:
+            body += "\n```"
+        if body.strip():
+            chunks.append(body)
+
+    for line in _wrap_lines(text, limit - 40):
+        # Lines carried past a paragraph break may still not fit with this one: keep splitting
+        while lines and chunk_len(lines + [(line, None)], opener) > limit:
+            cut = len(lines)
+            for k in range(len(lines) - 1, len(lines) // 2, -1):
+                if not lines[k][0].strip() and lines[k][1] is None:
+                    cut = k + 1     # paragraph break outside any code block
+                    break
+            head, lines = lines[:cut], lines[cut:]
+            emit(head, opener)
+            opener = head[-1][1]
+        if chunk_len([(line, None)], opener) > limit:
+            opener = ""     # absurdly long fence language: re-open the block bare
+        match = _FENCE_RE.match(line)
+        if match:
+            fence = None if fence is not None else match.group(1)
+        lines.append((line, fence))
+    emit(lines, opener)
+    return chunks
+
+def plan_delivery(text):
+    """
+    Picks the representation needing the fewest API calls. Returns a list of message
+    payloads (kwargs for .send): plain text, embed pages packed two per message, or a
+    single file attachment with a preview.
+    """
+    if len(text) <= MESSAGE_LIMIT:
+        return [{"content": text}]
+    if len(text) <= EMBED_DESC_LIMIT:
+        return [{"embeds": [discord.Embed(description=text, color=COLOR_PRIMARY)]}]
+
+    pages = paginate(text, EMBED_PAGE_SIZE)
+    if (len(pages) + 1) // 2 <= MAX_PAGED_MESSAGES:
+        return [
+            {"embeds": [discord.Embed(description=p, color=COLOR_PRIMARY) for p in pages[i:i + 2]]}
+            for i in range(0, len(pages), 2)
+        ]
+    preview = paginate(text, EMBED_DESC_LIMIT - 64)[0]
+    embed = discord.Embed(description=preview, color=COLOR_PRIMARY)
+    embed.set_footer(text=f"Full response ({len(text):,} chars) attached.")
+    return [{"embeds": [embed], "file": discord.File(io.BytesIO(text.encode()), filename="maestro-response.md")}]
+
+class PaginatorView(discord.ui.View):
+    """Prev/Next buttons over pre-split embed pages; only the requester can page."""
+    def __init__(self, pages, owner_id, timeout=600):
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.owner_id = owner_id
+        self.index = 0
+        self._sync_buttons()
+
+    def page_embed(self):
+        embed = discord.Embed(description=self.pages[self.index], color=COLOR_PRIMARY)
+        embed.set_footer(text=f"Page {self.index + 1}/{len(self.pages)}")
+        return embed
+
+    def _sync_buttons(self):
+        self.prev_page.disabled = self.index == 0
+        self.next_page.disabled = self.index >= len(self.pages) - 1
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ Only the requester can turn pages.", ephemeral=True)
+            return False
+        return True
+
+    async def _turn(self, interaction, step):
+        self.index = max(0, min(len(self.pages) - 1, self.index + step))
+        self._sync_buttons()
+        await interaction.response.edit_message(embed=self.page_embed(), view=self)
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._turn(interaction, -1)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.primary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._turn(interaction, 1)
+
+async def send_interaction_chunks(interaction: discord.Interaction, text: str, paged: bool = False):
+    """
+    Safe sender for long AI responses in Slash Commands. With paged=True, anything
+    longer than one embed becomes a single message with Prev/Next buttons.
+    """
+    if not text:
+        return
+    route = f"webhook:{interaction.id}"
+
+    def followup(**payload):
+        return outbound.submit(lambda: interaction.followup.send(**payload), route=route, guild_id=interaction.guild_id)
+
+    if paged and len(text) > EMBED_DESC_LIMIT:
+        view = PaginatorView(paginate(text, EMBED_DESC_LIMIT - 64), owner_id=interaction.user.id)
+        await followup(embed=view.page_embed(), view=view)
+        return
+    for payload in plan_delivery(text):
+        await followup(**payload)
+
+async def ask_ai(interaction: discord.Interaction, prompt: str, **kwargs):
+    """
+    Admission-controlled brain.query for slash commands. Defers the interaction once
+    admitted; returns None (after telling the user) if they are rate limited.
+    """
+    is_admin = interaction.guild is not None and interaction.user.guild_permissions.administrator
+    try:
+        admission.charge(interaction.user.id, interaction.guild_id, bypass=is_admin)
+    except RateLimited as e:
+        text = "🔄 Maestro is restarting — try again in a moment." if e.scope == "restart" else \
+               f"⏳ Slow down — the {e.scope} AI limit is reached. Try again in {e.retry_after:.0f}s."
+        await interaction.response.send_message(text, ephemeral=True)
+        return None
+    await interaction.response.defer()
+
+    async def on_queued(position):
+        await interaction.followup.send(f"🕒 Maestro is busy — you're #{position} in the queue.", ephemeral=True)
+
+    async with admission.slot(interaction.user.id, on_queued=on_queued):
+        return await brain.query(prompt, **kwargs)
+
+async def bank_item(interaction: discord.Interaction, kind: str, topic: str):
+    """
+    Serves an unseen item from the content bank instantly. On a miss, generates a batch
+    live through ask_ai (admission-controlled), banks it and serves from it, so one
+    generation both answers the user and refills the topic. Returns None
+    if the user was rate limited or the model's reply didn't validate (after telling them).
+    """
+    item = bank.take(kind, topic, interaction.user.id)
+    if item is not None:
+        await interaction.response.defer()
+        return item
+    res = await ask_ai(interaction, bank.prompt(kind, topic))
+    if res is None:
+        bank.want(kind, topic)      # rate limited: let the idle-time worker fill it instead
+        return None
+    bank.add(kind, topic, bank.parse(kind, res))
+    item = bank.take(kind, topic, interaction.user.id)
+    if item is None:
+        await interaction.followup.send(f"⚠️ Maestro couldn't put together a {kind} on that topic. Try again shortly.")
+    return item
+
+async def send_channel_chunks(channel, text, priority=PRIORITY_INTERACTIVE):
+    """Sends a long response to a channel using as few messages as plan_delivery allows."""
+    if not text:
+        return
+    for payload in plan_delivery(text):
+        await outbound.send(channel, priority=priority, **payload)
+
+# ==============================================================================
+# SECTION 16: WEB DASHBOARD & WEBHOOK LISTENER
+# ==============================================================================
+# Page shell, rendered once per published snapshot; only $-fields vary.
+DASHBOARD_TEMPLATE = Template(f"""<html><head><style>
+    body {{ background: {COLOR_BG}; color: white; font-family: sans-serif; text-align: center; padding: 40px; }}
+    .card {{ background: #1e293b; padding: 20px; border-radius: 10px; display: inline-block; text-align: left; min-width: 300px; }}
+    table {{ border-collapse: collapse; font-size: 13px; }}
+    td, th {{ padding: 4px 8px; border-bottom: 1px solid #334155; text-align: left; }}
+    textarea {{ width: 100%; height: 100px; background: #0f172a; color: white; border: 1px solid #334155; margin: 10px 0; }}
+    button {{ background: {parse_hex_color(COLOR_PRIMARY)}; border: none; padding: 10px; width: 100%; cursor: pointer; font-weight: bold; color: white; }}
+</style></head><body>
+    <div class='card'>
+        <h1>Maestro OS</h1>
+        <p>$stats</p>
+        $panel
+    </div>
+</body></html>
+""")
+
+DASHBOARD_LOGIN_LINK = f"<a href='/admin' style='color:{parse_hex_color(COLOR_PRIMARY)}'>Admin Login</a>"
+
+DASHBOARD_BROADCAST_FORM = f"""
+    <div class='card' style='border-top: 4px solid {parse_hex_color(COLOR_ACCENT)};'>
+        <h3>📢 Broadcast to Cohort</h3>
+        <form action='/broadcast' method='POST'>
+            <textarea name='message' placeholder='Type announcement...' required></textarea>
+            <button type='submit'>Send to All</button>
+        </form>
+    </div>
+"""
+
+class RenderedPage:
+    """Immutable response body with its gzip variant and ETag, shared read-only with the HTTP thread."""
+    __slots__ = ("body", "gzipped", "etag", "content_type")
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=6)
+        self.etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+        self.content_type = content_type
+
+class DashboardPublisher:
+    """
+    The bot loop periodically snapshots its stats and pre-renders every dashboard page.
+    The HTTP thread only ever reads `self.pages`, a dict that is swapped wholesale, so a
+    request never touches live discord.py state or renders anything. Until start() runs
+    (from setup_hook, once every subsystem exists) it serves a placeholder snapshot.
+    """
+    def __init__(self, interval=15):
+        self.interval = interval
+        self._task = None
+        self.stats = {"ready": False, "guilds": 0, "optins": len(db.dm_optins)}
+        self.pages = self.render(self.stats)
+
+    def collect(self):
+        """Runs on the loop thread. The only place dashboard stats read live bot state."""
+        return {
+            "ready": startup.ready,
+            "guilds": len(bot.guilds),
+            "members": sum(g.member_count or 0 for g in bot.guilds),
+            "optins": len(db.dm_optins),
+            "latency_ms": round(bot.latency * 1000, 1) if bot.is_ready() else None,
+            "uptime_seconds": round(time.perf_counter() - BOOT_T0),
+            "ai_inflight": admission.inflight,
+            "ai_queue_depth": admission.queue_depth(),
+            "outbound_pending": outbound.pending(),
+            "conversations": len(memory),
+            "reminders_pending": len(reminders.reminders),
+            "onboarding_pending": onboarding.pending(),
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z"),
+            "shard": SHARD_LABEL,
+            "shard_latency_ms": {str(sid): round(lat * 1000, 1) for sid, lat in getattr(bot, "latencies", [])},
+        }
+
+    # Per-process counters that add up across shard processes
+    SUMMED_STATS = ("guilds", "members", "ai_inflight", "ai_queue_depth", "outbound_pending",
+                    "conversations", "reminders_pending", "onboarding_pending")
+
+    def aggregate(self, own):
+        """Publishes this process's stats to the shared store and merges every live shard's."""
+        own["published"] = time.time()
+        db.store.put(f"shard_stats:{SHARD_LABEL}", own)
+        fresh = [s for s in db.store.scan("shard_stats:").values()
+                 if time.time() - s.get("published", 0) < 3 * self.interval]
+        latencies = [s["latency_ms"] for s in fresh if s.get("latency_ms") is not None]
+        return {
+            **own,
+            **{k: sum(s.get(k, 0) for s in fresh) for k in self.SUMMED_STATS},
+            "ready": all(s.get("ready") for s in fresh),
+            "latency_ms": max(latencies) if latencies else None,
+            "shard_latency_ms": {k: v for s in fresh for k, v in s.get("shard_latency_ms", {}).items()},
+            "shards": sorted(
+                ({k: s.get(k) for k in ("shard", "ready", "guilds", "latency_ms", "published")} for s in fresh),
+                key=lambda s: s["shard"]
+            ),
+        }
+
+    def render(self, stats):
+        line = html.escape(f"Users: {stats['optins']} | Servers: {stats['guilds']}")
+        return {
+            "/": RenderedPage(
+                DASHBOARD_TEMPLATE.substitute(stats=line, panel=DASHBOARD_LOGIN_LINK).encode(), "text/html"
+            ),
+            "/admin": RenderedPage(
+                DASHBOARD_TEMPLATE.substitute(
+                    stats=line,
+                    panel=DASHBOARD_BROADCAST_FORM + self.shard_html(stats) + self.stall_html() + self.audit_html()
+                ).encode(), "text/html"
+            ),
+            "/api/stats": RenderedPage(json.dumps(stats).encode(), "application/json"),
+        }
+
+    @staticmethod
+    def shard_html(stats):
+        if not stats.get("shards") and not stats.get("shard_latency_ms"):
+            return ""
+        rows = "".join(
+            f"<tr><td>{html.escape(s['shard'])}</td><td>{'✅' if s['ready'] else '⏳'}</td>"
+            f"<td>{s['guilds']}</td><td>{s['latency_ms']} ms</td></tr>"
+            for s in stats.get("shards", [])
+        )
+        gateway = ", ".join(f"#{sid}: {ms} ms" for sid, ms in sorted(stats["shard_latency_ms"].items(), key=lambda kv: int(kv[0])))
+        return f"""
+            <div class='card'>
+                <h3>🧩 Shards</h3>
+                <table><tr><th>Process</th><th>Ready</th><th>Guilds</th><th>Latency</th></tr>{rows}</table>
+                <p>{html.escape(gateway)}</p>
+            </div>
+            """
+
+    @staticmethod
+    def stall_html():
+        rows = watchdog.top()
+        if not rows:
+            return "<div class='card'><h3>⏱️ Event Loop Stalls</h3><p>No stalls recorded.</p></div>"
+        body = "".join(
+            f"<tr><td>{html.escape(r['culprit'])}</td><td>{html.escape(r['blocked_in'])}</td>"
+            f"<td>{r['count']}</td><td>{r['total']:.2f}s</td><td>{r['max']:.2f}s</td></tr>"
+            for r in rows
+        )
+        return f"""
+            <div class='card'>
+                <h3>⏱️ Event Loop Stalls (top {len(rows)})</h3>
+                <table><tr><th>Handler</th><th>Blocked In</th><th>Count</th><th>Total</th><th>Max</th></tr>{body}</table>
+            </div>
+            """
+
+    @staticmethod
+    def audit_table(entries):
+        if not entries:
+            return "<p>No matching records.</p>"
+        rows = "".join(
+            f"<tr><td>{datetime.fromtimestamp(e['ts'], timezone.utc).strftime('%Y-%m-%d %H:%M')}</td>"
+            f"<td>{e.get('guild') or ''}</td><td>{html.escape(format_audit_entry(e))}</td></tr>"
+            for e in entries
+        )
+        return f"<table><tr><th>UTC</th><th>Guild</th><th>Action</th></tr>{rows}</table>"
+
+    def audit_html(self):
+        return f"""
+            <div class='card'>
+                <h3>🧾 Audit Log</h3>
+                <form action='/admin/audit' method='GET'>
+                    <input name='user' placeholder='User ID'> <input name='guild' placeholder='Guild ID'>
+                    <select name='action'><option value=''>any action</option>
+                        {"".join(f"<option>{a}</option>" for a in AUDIT_ACTIONS)}</select>
+                    <input name='days' value='7' size='3'> days <button type='submit'>Search</button>
+                </form>
+                {self.audit_table(audit.query(limit=15))}
+            </div>
+            """
+
+    def audit_page(self, query):
+        """Renders an audit search on the HTTP thread; the audit index has its own lock."""
+        def number(name):
+            value = query.get(name, [""])[0].strip()
+            return int(value) if value.isdigit() else None
+        days = number("days") or 7
+        audit.refresh()
+        entries = audit.query(
+            guild=number("guild"), user=number("user"), action=query.get("action", [""])[0] or None,
+            since=time.time() - days * 86400, limit=200,
+        )
+        line = html.escape(f"{len(entries)} record(s) in the last {days} day(s)")
+        panel = f"<div class='card'><h3>🧾 Audit Search</h3>{self.audit_table(entries)}<p><a href='/admin'>Back</a></p></div>"
+        return RenderedPage(DASHBOARD_TEMPLATE.substitute(stats=line, panel=panel).encode(), "text/html")
+
+    def publish(self):
+        stats = self.collect()
+        if db.store.shared:
+            stats = self.aggregate(stats)
+        self.stats = stats
+        self.pages = self.render(stats)
+
+    def start(self):
+        self._task = asyncio.create_task(self._publish_loop())
+
+    async def _publish_loop(self):
+        while True:
+            try:
+                with metrics.timer("maestro_dashboard_publish_seconds"):
+                    self.publish()
+            except Exception as e:
+                logger.warning(f"Dashboard: snapshot publish failed: {e}")
+            await asyncio.sleep(self.interval)
+
+metrics.describe("maestro_dashboard_publish_seconds", "histogram", "Time to snapshot stats and pre-render the dashboard.")
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        # Suppress default HTTP access logs to keep our logger clean
+        pass
+
+    def check_auth(self):
         user = os.getenv("DASHBOARD_USER", "admin")
         pw = os.getenv("DASHBOARD_PASS", "maestro2026")
         auth_header = self.headers.get('Authorization')
@@ -249,22 +2583,57 @@ class DashboardHandler(BaseHTTPRequestHandler):
             return False
         return True
 
-    def do_GET(self):
-        if self.path == "/":
-            self.send_response(200)
-            self.send_header("Content-type", "text/html")
+    def send_page(self, page, cacheable=True):
+        """Serves a pre-rendered page, honouring If-None-Match and Accept-Encoding: gzip."""
+        if cacheable and self.headers.get("If-None-Match") == page.etag:
+            self.send_response(304)
+            self.send_header("ETag", page.etag)
             self.end_headers()
-            self.wfile.write(self.get_html(is_admin=False).encode())
-        elif self.path.startswith("/admin"):
+            return
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        body = page.gzipped if use_gzip else page.body
+        self.send_response(200)
+        self.send_header("Content-type", f"{page.content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        if cacheable:
+            self.send_header("ETag", page.etag)
+            self.send_header("Cache-Control", "no-cache")
+        else:
+            self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        pages = dashboard.pages
+        path = urlsplit(self.path).path
+        if path in ("/", "/api/stats"):
+            self.send_page(pages[path])
+        elif path == "/admin/audit":
+            if self.check_auth():
+                self.send_page(dashboard.audit_page(parse_qs(urlsplit(self.path).query)), cacheable=False)
+        elif path.startswith("/admin"):
             if self.check_auth():
-                self.send_response(200)
-                self.send_header("Content-type", "text/html")
-                self.end_headers()
-                self.wfile.write(self.get_html(is_admin=True).encode())
-        elif self.path == "/health":
+                self.send_page(pages["/admin"], cacheable=False)
+        elif path == "/health":
             self.send_response(200)
             self.end_headers()
             self.wfile.write(b"OK")
+        elif path == "/ready":
+            # Readiness (vs. /health liveness): 503 until the gateway session is up and again while draining
+            ready = startup.ready and not lifecycle.draining
+            self.send_response(200 if ready else 503)
+            self.end_headers()
+            self.wfile.write(b"READY" if ready else b"DRAINING" if lifecycle.draining else b"STARTING")
+        elif path == "/metrics":
+            body = metrics.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
 
     def do_POST(self):
         # GitHub Webhook
@@ -312,200 +2681,1232 @@ class DashboardHandler(BaseHTTPRequestHandler):
         for guild in bot.guilds:
             c = discord.utils.get(guild.text_channels, name="announcements") or guild.text_channels[0]
             if c:
-                await c.send(embed=embed)
+                outbound.send(c, embed=embed, priority=PRIORITY_BULK)
+                metrics.inc("maestro_broadcast_messages_total", kind="release", status="queued")
 
     async def broadcast_dm(self, text):
-        count = 0
-        for uid in list(db.dm_optins):
+        count = await dm_opted_in(f"📢 **Maestro Announcement**\n{text}", kind="broadcast_dm")
+        audit.record("broadcast_dm", delivered=count, message=text[:200])
+        logger.info(f"Broadcast sent to {count} users.", extra={"command": "broadcast_dm"})
+
+dashboard = DashboardPublisher(interval=int(os.getenv("DASHBOARD_REFRESH_SECONDS", 15)))
+
+# ==============================================================================
+# SECTION 17: SCAM SNIFFER ENGINE
+# ==============================================================================
+# Phrase patterns that strongly indicate a scam message.
+# All checks are case-insensitive. Add more patterns here as needed.
+SCAM_PATTERNS = [
+    # Giveaway / free gear scams
+    r"\bfree\s+(camera|laptop|iphone|macbook|pc|gpu|playstation|ps5|xbox|airpods|ipad|gift\s*card)\b",
+    r"\bgiving\s+away\b",
+    r"\bgiveaway\b.*\b(dm|message|click|link)\b",
+
+    # "I don't need this anymore" bait
+    r"\bdon['\u2019]?t\s+need\s+(it|this|my)\s+anymore\b",
+    r"\bno\s+longer\s+need\b",
+
+    # Crypto / investment scams
+    r"\b(invest|profit|earning|passive\s+income)\b.{0,40}\b(crypto|bitcoin|btc|eth|usdt|forex)\b",
+    r"\bdouble\s+your\s+(money|bitcoin|crypto|investment)\b",
+    r"\b(100|200|300|500)x\s+(return|profit|gain)\b",
+    r"\bguaranteed\s+(profit|return|income)\b",
+
+    # Phishing / account scams
+    r"\bverif(y|ication)\s+your\s+(discord|account|steam|paypal)\b",
+    r"\byour\s+account\s+(has\s+been|will\s+be)\s+(suspended|banned|flagged|terminated)\b",
+    r"\bclick\s+(this|the)\s+(link|button)\s+to\s+(claim|verify|receive|get)\b",
+    r"\bsteam\s+(gift|free\s+game|wallet)\b",
+
+    # Suspicious links are handled by the URL reputation pipeline below
+
+    # Nitro scams
+    r"\bfree\s+nitro\b",
+    r"\bnitro\s+giveaway\b",
+    r"\bdiscord\s+nitro\s+(for\s+free|free)\b",
+
+    # Job / money mule scams
+    r"\bearn\s+\$?\d+\s+(a\s+day|per\s+day|daily|weekly|a\s+week)\b",
+    r"\bwork\s+from\s+home\b.{0,40}\b(earn|make|income)\b",
+    r"\bno\s+experience\s+(needed|required)\b",
+
+    # General urgency bait
+    r"\b(limited\s+time|act\s+now|only\s+\d+\s+left|expires?\s+soon)\b",
+    r"\bdm\s+me\s+(for\s+)?(details|info|more|the\s+link)\b",
+]
+
+# Compile all patterns once at startup for performance
+_SCAM_REGEX = re.compile("|".join(SCAM_PATTERNS), re.IGNORECASE | re.UNICODE)
+
+# --- URL reputation pipeline ---
+# Links with an explicit scheme or "www." plus bare "name.tld" mentions.
+_URL_REGEX = re.compile(
+    r"(?:https?://|www\.)[^\s<>\"'`|]+|\b[a-z0-9][a-z0-9\-]{0,62}(?:\.[a-z0-9\-]{1,63})*\.[a-z]{2,24}\b(?:/[^\s<>\"'`|]*)?",
+    re.IGNORECASE
+)
+
+# Exact domains (and their subdomains) that are never flagged.
+DOMAIN_ALLOWLIST = {
+    "discord.com", "discord.gg", "discordapp.com", "discordapp.net", "discord.media", "discord.gift",
+    "github.com", "github.io", "githubusercontent.com", "youtube.com", "youtu.be", "google.com",
+    "python.org", "pypi.org", "readthedocs.io", "stackoverflow.com",
+    "steamcommunity.com", "steampowered.com", "paypal.com", "kalebmcintosh.com",
+}
+
+# Known-bad domains. Extended at runtime with /domain block.
+DOMAIN_BLOCKLIST = set()
+
+# Only applied to links with an explicit scheme — "model.ml" in chat is not a link.
+SUSPICIOUS_TLDS = {"xyz", "tk", "ml", "ga", "cf", "gq", "ru", "top", "click", "loan", "work", "download"}
+
+# File extensions that look like TLDs; bare "discord-app.py" is a student's file, not a host.
+CODE_EXTENSIONS = {"py", "js", "ts", "java", "cpp", "rs", "go", "rb", "sh", "md", "txt", "json", "html", "css", "ipynb"}
+
+# Brands that phishing domains imitate, keyed by the label we compare against.
+PROTECTED_BRANDS = {
+    "discord": "discord.com",
+    "discordapp": "discordapp.com",
+    "steamcommunity": "steamcommunity.com",
+    "steampowered": "steampowered.com",
+    "github": "github.com",
+    "paypal": "paypal.com",
+    "youtube": "youtube.com",
+}
+
+# Words that turn "<brand>-<word>.com" into an obvious lure
+_LOOKALIKE_BAIT = {
+    "gift", "gifts", "nitro", "free", "promo", "airdrop", "claim", "verify", "login", "secure",
+    "support", "giveaway", "trade", "reward", "rewards", "bonus", "drop", "event", "app",
+}
+
+# Digits and homoglyphs folded to the ASCII letter they imitate.
+_CONFUSABLES = str.maketrans({
+    "0": "o", "1": "l", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s",
+    "а": "a", "е": "e", "о": "o", "р": "p", "с": "c", "х": "x", "і": "i", "ӏ": "l",
+})
+
+def _edit_distance(a, b, limit):
+    """Levenshtein distance, abandoning early once every path exceeds `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+def normalize_host(url):
+    """Returns the lowercase, IDNA-decoded hostname of a URL (without 'www.'), or None."""
+    url = url.rstrip(").,!?:;]}>*_~")
+    if "://" not in url:
+        url = "http://" + url
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    host = host.strip(".").lower()
+    if "xn--" in host:
+        try:
+            host = host.encode("ascii").decode("idna")
+        except UnicodeError:
+            pass
+    if host.startswith("www."):
+        host = host[4:]
+    return host or None
+
+def extract_urls(content):
+    """Yields (host, explicit) for every link-like token; explicit means it had a scheme or 'www.'."""
+    if "." not in content:
+        return
+    seen = set()
+    for m in _URL_REGEX.finditer(content):
+        raw = m.group(0)
+        host = normalize_host(raw)
+        if not host or host in seen:
+            continue
+        seen.add(host)
+        explicit = raw.lower().startswith(("http://", "https://", "www."))
+        if not explicit and host.rsplit(".", 1)[-1] in CODE_EXTENSIONS:
+            continue
+        yield host, explicit
+
+class DomainReputationIndex:
+    """
+    Local verdicts for link hosts: allowlist > blocklist > look-alike > suspicious TLD.
+    The loose heuristics (near-miss spellings, brand on a foreign TLD, suspicious TLD) only
+    judge explicit links (scheme or "www."); a bare token like "discords.py" is far more
+    often a library or file name than a lure.
+    Verdicts are memoized in a TTL cache so repeated links cost one dict lookup.
+    """
+    BAD_VERDICTS = ("block", "lookalike", "suspicious_tld")
+
+    def __init__(self, allow=(), block=(), ttl=900):
+        self.allow = set(DOMAIN_ALLOWLIST) | set(allow)
+        self.block = set(DOMAIN_BLOCKLIST) | set(block)
+        self.cache = TTLCache(maxsize=8192, ttl=ttl)
+
+    @staticmethod
+    def _matches(host, domains):
+        parts = host.split(".")
+        return any(".".join(parts[i:]) in domains for i in range(len(parts) - 1))
+
+    @staticmethod
+    def _lookalike(host, explicit=True):
+        """
+        The protected domain `host` imitates, or None. High-confidence rules (prefix trick,
+        digit/homoglyph swaps, brand plus bait word) apply to bare mentions too; a brand on
+        a foreign TLD and near-miss spellings only count for explicit links.
+        """
+        labels = host.split(".")
+        # Classic "discord.com.verify-login.net" prefix trick
+        for real in PROTECTED_BRANDS.values():
+            if host.startswith(real + "."):
+                return real
+        if len(labels) < 2:
+            return None
+        raw = labels[-2]
+        name = "".join(c for c in unicodedata.normalize("NFKD", raw) if not unicodedata.combining(c))
+        name = name.translate(_CONFUSABLES).replace("rn", "m").replace("vv", "w")
+        tokens = name.split("-")
+        swapped = name != raw
+        baited = any(t in _LOOKALIKE_BAIT for t in tokens)
+        for brand, real in PROTECTED_BRANDS.items():
+            glued = any(t != brand and t.startswith(brand) and t[len(brand):] in _LOOKALIKE_BAIT
+                        or t.endswith(brand) and t[:-len(brand)] in _LOOKALIKE_BAIT for t in tokens)
+            if glued or (brand in tokens and (swapped or baited)):
+                return real         # "disc0rd", "nitro-discord", "discordnitro"
+            if not explicit:
+                continue
+            if name == brand:
+                return real         # the brand itself on a TLD it doesn't own: discord.co
+            limit = 1 if len(brand) <= 7 else 2
+            if _edit_distance(name, brand, limit) <= limit:
+                return real
+        return None
+
+    def verdict(self, host, explicit=True):
+        """Returns (verdict, reason) where verdict is allow/block/lookalike/suspicious_tld/unknown."""
+        key = (host, explicit)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        if self._matches(host, self.allow):
+            result = ("allow", host)
+        elif self._matches(host, self.block):
+            result = ("block", f"{host} (blocklisted)")
+        else:
+            real = self._lookalike(host, explicit)
+            if real:
+                result = ("lookalike", f"{host} (look-alike of {real})")
+            elif explicit and host.rsplit(".", 1)[-1] in SUSPICIOUS_TLDS:
+                result = ("suspicious_tld", f"{host} (suspicious TLD)")
+            else:
+                result = ("unknown", host)
+        self.cache.set(key, result)
+        return result
+
+    def check(self, content):
+        """Returns the reason string for the first bad link in content, otherwise None."""
+        for host, explicit in extract_urls(content):
+            verdict, reason = self.verdict(host, explicit)
+            if verdict in self.BAD_VERDICTS:
+                return reason
+        return None
+
+    def set_rule(self, domain, rule):
+        """rule is 'allow', 'block' or 'remove'. Clears cached verdicts."""
+        domain = normalize_host(domain) or domain.lower()
+        self.allow.discard(domain)
+        self.block.discard(domain)
+        if rule == "allow":
+            self.allow.add(domain)
+        elif rule == "block":
+            self.block.add(domain)
+        self.cache.clear()
+        return domain
+
+    def custom_rules(self):
+        return {
+            "allow": sorted(self.allow - DOMAIN_ALLOWLIST),
+            "block": sorted(self.block - DOMAIN_BLOCKLIST),
+        }
+
+_domain_rules = db.load_json("domains", {})
+domain_index = DomainReputationIndex(
+    allow=_domain_rules.get("allow", []),
+    block=_domain_rules.get("block", [])
+)
+
+def _reload_domain_rules(rules):
+    global domain_index
+    rules = rules or {}
+    domain_index = DomainReputationIndex(allow=rules.get("allow", []), block=rules.get("block", []))
+
+db.subscribe("domains", _reload_domain_rules)
+
+# Channel name to post scam alerts in (must exist in your server)
+SCAM_LOG_CHANNEL = "mod-log"
+
+def scan_for_scam(content: str):
+    """
+    Pure classifier shared by the sniffer, /scam_test and bench/scam_bench.py.
+    Returns the trigger phrase if the text looks like a scam, otherwise None.
+    """
+    match = _SCAM_REGEX.search(content)
+    if match:
+        return match.group(0)
+    return domain_index.check(content)
+
+def collect_scan_text(message: discord.Message) -> str:
+    """Message content plus embed text (common in link previews)."""
+    content = message.content
+    for embed in message.embeds:
+        if embed.title:       content += " " + embed.title
+        if embed.description: content += " " + embed.description
+        if embed.url:         content += " " + embed.url
+    return content
+
+async def scam_sniffer(message: discord.Message) -> bool:
+    """
+    Scans a message for scam patterns.
+    If detected: deletes the message, bans the user, and logs to mod-log.
+    Returns True if a scam was detected, False otherwise.
+    Admins and bots are always exempt.
+    """
+    if message.author.bot:
+        return False
+    if message.author.guild_permissions.administrator:
+        return False
+
+    content = collect_scan_text(message)
+    with metrics.timer("maestro_scam_scan_seconds"):
+        matched = scan_for_scam(content)
+    if not matched:
+        return False
+    metrics.inc("maestro_scam_hits_total")
+
+    guild  = message.guild
+    author = message.author
+
+    logger.warning(
+        f"SCAM DETECTED | User: {author} ({author.id}) | Match: '{matched}' | Msg: {content[:100]}",
+        extra={"guild": guild.id, "user": author.id, "command": "scam_sniffer"}
+    )
+
+    # 1. Delete the message
+    try:
+        await message.delete()
+    except discord.Forbidden:
+        logger.error("Scam Sniffer: Missing permission to delete messages.")
+    except discord.NotFound:
+        pass
+
+    # 2. Ban the user
+    try:
+        await guild.ban(
+            author,
+            reason=f"[Maestro AutoMod] Scam detected. Trigger: '{matched}'",
+            delete_message_days=1
+        )
+        logger.info(f"Scam Sniffer: Banned {author} ({author.id})", extra={"guild": guild.id, "user": author.id})
+        audit.record("scam_ban", guild=guild, actor=bot.user, target=author, reason=f"Trigger: '{matched}'")
+    except discord.Forbidden:
+        logger.error("Scam Sniffer: Missing permission to ban members.")
+    except Exception as e:
+        logger.error(f"Scam Sniffer: Ban failed: {e}")
+
+    # 3. Log to mod-log channel
+    log_chan = discord.utils.get(guild.text_channels, name=SCAM_LOG_CHANNEL)
+    if log_chan:
+        embed = discord.Embed(
+            title="🚨 Scam Message Auto-Removed",
+            color=COLOR_ERROR,
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.add_field(name="User",           value=f"{author.mention} (`{author.id}`)", inline=True)
+        embed.add_field(name="Channel",        value=message.channel.mention,              inline=True)
+        embed.add_field(name="Trigger Phrase", value=f"`{matched}`",                       inline=False)
+        embed.add_field(
+            name="Message Preview",
+            value=f"```{message.content[:300]}```" if message.content else "*No text content*",
+            inline=False
+        )
+        embed.set_footer(text="Action: Message deleted | User banned")
+
+        def log_failure(future):
+            if not future.cancelled() and future.exception():
+                logger.error(f"Scam Sniffer: Could not post to mod-log: {future.exception()}")
+
+        # Fire-and-forget: during a raid the mod-log bucket is the bottleneck, and the
+        # next scam message shouldn't wait behind this one's log post to be deleted.
+        outbound.send(log_chan, embed=embed, priority=PRIORITY_MODERATION).add_done_callback(log_failure)
+    else:
+        logger.warning(f"Scam Sniffer: No '{SCAM_LOG_CHANNEL}' channel found for logging.")
+
+    return True
+
+# ==============================================================================
+# SECTION 18: REMINDER SCHEDULER
+# ==============================================================================
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+MAX_REMINDER_SECONDS = 365 * 86400
+MAX_REMINDERS_PER_USER = 25
+
+def parse_duration(text):
+    """'45m', '1h30m', '2d' -> seconds, or None if the text isn't a valid duration."""
+    text = text.strip().lower().replace(" ", "")
+    if not re.fullmatch(r"(\d+[smhdw])+", text):
+        return None
+    total = sum(int(n) * DURATION_UNITS[u] for n, u in re.findall(r"(\d+)([smhdw])", text))
+    return total or None
+
+def format_duration(secs):
+    secs = int(secs)
+    parts = []
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60), ("s", 1)):
+        if secs >= size:
+            parts.append(f"{secs // size}{unit}")
+            secs %= size
+    return "".join(parts) or "0s"
+
+class ReminderScheduler:
+    """
+    Restart-safe reminders. Pending reminders live in reminders.json and a min-heap of
+    due times; one dispatcher task sleeps until the earliest one instead of a sleeping
+    coroutine per reminder. Cancelled entries stay in the heap and are skipped on pop.
+    """
+    def __init__(self):
+        self.reminders = {r["id"]: r for r in db.load_json("reminders", [])}
+        self._heap = [(r["due"], r["id"]) for r in self.reminders.values()]
+        heapq.heapify(self._heap)
+        self._next_id = max(self.reminders, default=0) + 1
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._dispatch())
+            logger.info(f"Reminders: {len(self.reminders)} pending reminder(s) loaded.")
+
+    def save(self):
+        db.save_json("reminders", sorted(self.reminders.values(), key=lambda r: r["due"]))
+
+    def add(self, user_id, channel_id, guild_id, task, delay):
+        reminder = {
+            "id": self._next_id,
+            "user_id": user_id,
+            "channel_id": channel_id,
+            "guild_id": guild_id,
+            "task": task,
+            "due": time.time() + delay,
+            "created": time.time(),
+        }
+        self._next_id += 1
+        self.reminders[reminder["id"]] = reminder
+        heapq.heappush(self._heap, (reminder["due"], reminder["id"]))
+        self.save()
+        if self._heap[0][1] == reminder["id"]:
+            self._wakeup.set()
+        return reminder
+
+    def cancel(self, user_id, reminder_id):
+        reminder = self.reminders.get(reminder_id)
+        if not reminder or reminder["user_id"] != user_id:
+            return False
+        del self.reminders[reminder_id]
+        self.save()
+        return True
+
+    def for_user(self, user_id):
+        return sorted((r for r in self.reminders.values() if r["user_id"] == user_id), key=lambda r: r["due"])
+
+    async def _dispatch(self):
+        while True:
+            now = time.time()
+            fired = False
+            while self._heap and self._heap[0][0] <= now:
+                _, rid = heapq.heappop(self._heap)
+                reminder = self.reminders.pop(rid, None)
+                if reminder:
+                    fired = True
+                    asyncio.create_task(self._fire(reminder, late=now - reminder["due"]))
+            if fired:
+                self.save()
+
+            timeout = self._heap[0][0] - now if self._heap else None
+            self._wakeup.clear()
             try:
-                u = await bot.fetch_user(int(uid))
-                await u.send(f"📢 **Maestro Announcement**\n{text}")
-                count += 1
-                await asyncio.sleep(1)
-            except Exception:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
                 pass
-        logger.info(f"Broadcast sent to {count} users.")
 
-    def get_html(self, is_admin):
-        stats = f"Users: {len(db.dm_optins)} | Servers: {len(bot.guilds)}"
-        admin_panel = f"<a href='/admin' style='color:{parse_hex_color(COLOR_PRIMARY)}'>Admin Login</a>"
-        if is_admin:
-            admin_panel = f"""
-            <div class='card' style='border-top: 4px solid {parse_hex_color(COLOR_ACCENT)};'>
-                <h3>📢 Broadcast to Cohort</h3>
-                <form action='/broadcast' method='POST'>
-                    <textarea name='message' placeholder='Type announcement...' required></textarea>
-                    <button type='submit'>Send to All</button>
-                </form>
-            </div>
-            """
-        return f"""
-        <html><head><style>
-            body {{ background: {COLOR_BG}; color: white; font-family: sans-serif; text-align: center; padding: 40px; }}
-            .card {{ background: #1e293b; padding: 20px; border-radius: 10px; display: inline-block; text-align: left; min-width: 300px; }}
-            textarea {{ width: 100%; height: 100px; background: #0f172a; color: white; border: 1px solid #334155; margin: 10px 0; }}
-            button {{ background: {parse_hex_color(COLOR_PRIMARY)}; border: none; padding: 10px; width: 100%; cursor: pointer; font-weight: bold; color: white; }}
-        </style></head><body>
-            <div class='card'>
-                <h1>Maestro OS</h1>
-                <p>{stats}</p>
-                {admin_panel}
-            </div>
-        </body></html>
-        """
+    async def _fire(self, reminder, late):
+        text = f"🔔 **Reminder:** <@{reminder['user_id']}> — {reminder['task']}"
+        if late > 60:
+            text += f"\n*(delivered {format_duration(late)} late — I was restarting)*"
+        try:
+            channel = bot.get_channel(reminder["channel_id"]) or await bot.fetch_channel(reminder["channel_id"])
+            await outbound.send(channel, text)
+            return
+        except Exception as e:
+            logger.warning(f"Reminder send failed in channel {reminder['channel_id']}: {e}")
+        try:
+            user = bot.get_user(reminder["user_id"]) or await bot.fetch_user(reminder["user_id"])
+            await outbound.send(user, text)
+        except Exception as e:
+            logger.warning(f"Reminder DM fallback failed for {reminder['user_id']}: {e}")
+
+reminders = ReminderScheduler()
+
+# ==============================================================================
+# SECTION 19: POLL ENGINE
+# ==============================================================================
+POLL_LETTERS = [chr(0x1F1E6 + i) for i in range(10)]
+
+class Poll:
+    __slots__ = ("id", "question", "options", "counts", "votes", "guild_id", "channel_id", "message_id",
+                 "author_id", "closes_at", "closed")
+
+    def __init__(self, id, question, options, guild_id, channel_id, author_id, closes_at=None,
+                 message_id=None, votes=None, closed=False):
+        self.id = id
+        self.question = question
+        self.options = options
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.closes_at = closes_at
+        self.message_id = message_id
+        self.votes = {int(u): i for u, i in (votes or {}).items()}     # user id -> option index
+        self.counts = [0] * len(options)
+        for choice in self.votes.values():
+            self.counts[choice] += 1
+        self.closed = closed
+
+    def to_json(self):
+        return {
+            "id": self.id, "question": self.question, "options": self.options, "guild_id": self.guild_id,
+            "channel_id": self.channel_id, "author_id": self.author_id, "closes_at": self.closes_at,
+            "message_id": self.message_id, "votes": {str(u): i for u, i in self.votes.items()}, "closed": self.closed,
+        }
+
+    def vote(self, user_id, choice):
+        """Records one vote per user; returns False if that was already their choice."""
+        previous = self.votes.get(user_id)
+        if previous == choice:
+            return False
+        if previous is not None:
+            self.counts[previous] -= 1
+        self.votes[user_id] = choice
+        self.counts[choice] += 1
+        return True
+
+    def embed(self):
+        total = len(self.votes)
+        lines = []
+        for i, option in enumerate(self.options):
+            share = self.counts[i] / total if total else 0
+            bar = "█" * round(share * 12) or "▏"
+            lines.append(f"{POLL_LETTERS[i]} **{option}**\n{bar} {self.counts[i]} ({share:.0%})")
+        embed = discord.Embed(
+            title=f"📊 {self.question}" + (" — closed" if self.closed else ""),
+            description="\n".join(lines),
+            color=COLOR_ERROR if self.closed else COLOR_SUCCESS,
+        )
+        status = "Final results" if self.closed else (
+            f"Closes in {format_duration(max(0, self.closes_at - time.time()))}" if self.closes_at else "Open"
+        )
+        embed.set_footer(text=f"Poll {self.id} · {total} vote(s) · {status}")
+        return embed
+
+class PollView(discord.ui.View):
+    """One button per option. Persistent (custom_id + no timeout) so votes keep working after a restart."""
+    def __init__(self, poll):
+        super().__init__(timeout=None)
+        for i, option in enumerate(poll.options):
+            button = discord.ui.Button(
+                label=option[:80], emoji=POLL_LETTERS[i], style=discord.ButtonStyle.secondary,
+                custom_id=f"poll:{poll.id}:{i}", disabled=poll.closed,
+            )
+            button.callback = functools.partial(polls.vote, poll.id, i)
+            self.add_item(button)
+
+class PollEngine:
+    """
+    Button polls with in-memory tallies. A vote only answers the voter ephemerally; the
+    public embed is re-rendered at most once per `refresh_interval` per poll, however many
+    votes arrive, and state is saved on the same debounced tick. Timed polls close themselves
+    (also across restarts); closed results stay in polls.json.
+    """
+    def __init__(self, refresh_interval=5, keep_closed=200):
+        self.refresh_interval = refresh_interval
+        self.keep_closed = keep_closed
+        self.polls = {p["id"]: Poll(**p) for p in db.load_json("polls", [])}
+        self._refreshing = set()
+        self._closers = {}
+
+    def start(self):
+        for poll in self.polls.values():
+            if not poll.closed and poll.message_id:
+                bot.add_view(PollView(poll), message_id=poll.message_id)
+                self._schedule_close(poll)
+
+    def save(self):
+        closed = [p for p in self.polls.values() if p.closed]
+        for poll in closed[:-self.keep_closed]:
+            del self.polls[poll.id]
+        db.save_json("polls", [p.to_json() for p in self.polls.values()])
+
+    async def create(self, channel, author_id, question, options, duration=None):
+        poll_id = os.urandom(3).hex()
+        closes_at = time.time() + duration if duration else None
+        poll = Poll(poll_id, question, options, channel.guild.id, channel.id, author_id, closes_at)
+        self.polls[poll_id] = poll
+        msg = await outbound.send(channel, embed=poll.embed(), view=PollView(poll))
+        poll.message_id = msg.id
+        self.save()
+        self._schedule_close(poll)
+        metrics.inc("maestro_polls_total", event="created")
+        return poll
+
+    async def vote(self, poll_id, choice, interaction: discord.Interaction):
+        poll = self.polls.get(poll_id)
+        if poll is None or poll.closed:
+            return await interaction.response.send_message("🔒 This poll is closed.", ephemeral=True)
+        changed = poll.vote(interaction.user.id, choice)
+        metrics.inc("maestro_polls_total", event="vote" if changed else "repeat_vote")
+        note = "✅ Vote recorded" if changed else "You already voted for"
+        await interaction.response.send_message(f"{note}: {POLL_LETTERS[choice]} **{poll.options[choice]}**", ephemeral=True)
+        if changed:
+            self._schedule_refresh(poll)
+
+    def _schedule_refresh(self, poll):
+        if poll.id not in self._refreshing:
+            self._refreshing.add(poll.id)
+            asyncio.create_task(self._refresh_later(poll))
+
+    async def _refresh_later(self, poll):
+        await asyncio.sleep(self.refresh_interval)
+        self._refreshing.discard(poll.id)
+        if not poll.closed:
+            self._edit(poll)
+            self.save()
+
+    def _edit(self, poll, view=None):
+        channel = bot.get_channel(poll.channel_id)
+        if channel is None or poll.message_id is None:
+            return None
+        message = channel.get_partial_message(poll.message_id)
+        kwargs = {"embed": poll.embed()}
+        if view is not None:
+            kwargs["view"] = view
+        metrics.inc("maestro_polls_total", event="embed_refresh")
+        route, guild_id = outbound_route(channel)
+        return outbound.submit(lambda: message.edit(**kwargs), route=route, guild_id=guild_id)
+
+    def _schedule_close(self, poll):
+        if poll.closes_at and not poll.closed and poll.id not in self._closers:
+            self._closers[poll.id] = asyncio.create_task(self._close_at(poll))
+
+    async def _close_at(self, poll):
+        await asyncio.sleep(max(0, poll.closes_at - time.time()))
+        self._closers.pop(poll.id, None)
+        await self.close(poll)
+
+    async def close(self, poll):
+        if poll.closed:
+            return
+        poll.closed = True
+        closer = self._closers.pop(poll.id, None)
+        if closer and closer is not asyncio.current_task():
+            closer.cancel()
+        self.save()
+        metrics.inc("maestro_polls_total", event="closed")
+        edit = self._edit(poll, view=PollView(poll))      # same buttons, now disabled
+        if edit is not None:
+            try:
+                await edit
+            except Exception as e:
+                logger.warning(f"Polls: couldn't post final results for {poll.id}: {e}")
+
+metrics.describe("maestro_polls_total", "counter", "Poll events (created, vote, repeat_vote, embed_refresh, closed).")
+
+polls = PollEngine(refresh_interval=float(os.getenv("POLL_REFRESH_SECONDS", 5)))
+
+# ==============================================================================
+# SECTION 20: GUILD PLAN ENGINE
+# ==============================================================================
+# Guild plan schema: action type -> (required fields, optional fields)
+PLAN_ACTIONS = {
+    "create_role": (("name",), ("color",)),
+    "create_category": (("name",), ("private_to",)),
+    "create_text": (("name",), ("category", "private_to", "topic", "seed")),
+}
+PLAN_FIELD_LIMITS = {"topic": 1024, "seed": 2000}
+_HEX_COLOR = re.compile(r"^#?[0-9a-fA-F]{6}$")
+
+class PlanError(Exception):
+    def __init__(self, problems):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+def channel_slug(name):
+    """Discord stores text channel names lower-cased with whitespace as hyphens."""
+    return re.sub(r"\s+", "-", name.strip().lower())
+
+class GuildSnapshot:
+    """Name indexes over a guild's roles, categories and text channels, built in one pass."""
+    def __init__(self, guild):
+        self.guild = guild
+        self.roles = {r.name.lower(): r for r in guild.roles}
+        self.categories = {c.name.lower(): c for c in guild.categories}
+        self.text_channels = {(c.category_id, c.name): c for c in guild.text_channels}
+        self.channels_by_name = {c.name: c for c in guild.text_channels}
+
+    def find(self, action, category=None):
+        if action.kind == "create_role":
+            return self.roles.get(action.name.lower())
+        if action.kind == "create_category":
+            return self.categories.get(action.name.lower())
+        return self.text_channels.get((category.id if category else None, channel_slug(action.name)))
+
+# Snapshots are reused across plans until a role/channel event invalidates them
+_guild_snapshots = TTLCache(maxsize=256, ttl=300)
+
+def guild_snapshot(guild):
+    snapshot = _guild_snapshots.get(guild.id)
+    if snapshot is None:
+        snapshot = GuildSnapshot(guild)
+        _guild_snapshots.set(guild.id, snapshot)
+    return snapshot
+
+def invalidate_guild_snapshot(guild_id):
+    _guild_snapshots.set(guild_id, None)
+
+class PlanAction:
+    __slots__ = ("kind", "name", "params", "key", "deps", "status", "result")
+
+    def __init__(self, kind, name, params):
+        self.kind = kind
+        self.name = name.strip()
+        self.params = params
+        self.deps = {}              # "category" / "role" -> PlanAction this one needs first
+        self.status = "create"      # create | exists | done | failed | blocked
+        self.result = None
+        if kind == "create_role":
+            self.key = ("role", self.name.lower())
+        elif kind == "create_category":
+            self.key = ("category", self.name.lower())
+        else:
+            parent = params.get("category")
+            self.key = ("text", parent.strip().lower() if parent else None, channel_slug(self.name))
+
+    def label(self):
+        noun = {"create_role": "role", "create_category": "category", "create_text": "channel"}[self.kind]
+        where = f" in {self.params['category']}" if self.kind == "create_text" and self.params.get("category") else ""
+        private = f" (private to {self.params['private_to']})" if self.params.get("private_to") else ""
+        return f"{noun} **{self.name}**{where}{private}"
+
+class GuildPlan:
+    """
+    A validated set of create-actions with their dependency graph, diffed against a
+    GuildSnapshot: objects that already exist are marked `exists` and skipped.
+    """
+    def __init__(self, name, actions, snapshot):
+        self.name = name
+        self.actions = actions
+        self.snapshot = snapshot
+
+    @classmethod
+    def from_json(cls, plan, snapshot):
+        problems = []
+        raw_actions = plan.get("actions")
+        if not isinstance(raw_actions, list):
+            raise PlanError(["`actions` must be a list"])
+        actions, seen = [], set()
+        for i, raw in enumerate(raw_actions, 1):
+            if not isinstance(raw, dict) or raw.get("type") not in PLAN_ACTIONS:
+                problems.append(f"action {i}: unknown type {raw.get('type') if isinstance(raw, dict) else raw!r}")
+                continue
+            required, optional = PLAN_ACTIONS[raw["type"]]
+            fields = {f: raw.get(f) for f in required + optional if raw.get(f) is not None}
+            bad = [f for f in fields
+                   if not isinstance(fields[f], str) or not 1 <= len(fields[f].strip()) <= PLAN_FIELD_LIMITS.get(f, 100)]
+            bad += [f for f in required if f not in fields]
+            if "color" in fields and not _HEX_COLOR.match(fields["color"]):
+                bad.append("color")
+            if bad:
+                problems.append(f"action {i} ({raw['type']}): invalid {', '.join(sorted(set(bad)))}")
+                continue
+            action = PlanAction(raw["type"], fields.pop("name"), fields)
+            if action.key not in seen:
+                seen.add(action.key)
+                actions.append(action)
+        plan_obj = cls(str(plan.get("plan_name") or "Unnamed"), actions, snapshot)
+        problems += plan_obj._link()
+        if problems:
+            raise PlanError(problems)
+        plan_obj._diff()
+        return plan_obj
+
+    def _link(self):
+        """Points actions at the category/role actions they need; each must be in the plan or the guild."""
+        by_key = {a.key: a for a in self.actions}
+        existing = {"category": self.snapshot.categories, "role": self.snapshot.roles}
+        problems = []
+        for action in self.actions:
+            refs = {"role": action.params.get("private_to")}
+            if action.kind == "create_text":
+                refs["category"] = action.params.get("category")
+            for kind, ref in refs.items():
+                if not ref:
+                    continue
+                dep = by_key.get((kind, ref.strip().lower()))
+                if dep:
+                    action.deps[kind] = dep
+                elif ref.strip().lower() not in existing[kind]:
+                    problems.append(f"{action.label()}: {kind} {ref} is not in the plan or the server")
+        return problems
+
+    def _resolve(self, action, kind):
+        """The guild object for a category/role reference: created by this plan or already there."""
+        ref = action.params.get("private_to" if kind == "role" else "category")
+        if not ref or (kind == "category" and action.kind != "create_text"):
+            return None
+        if kind in action.deps:
+            return action.deps[kind].result
+        return (self.snapshot.roles if kind == "role" else self.snapshot.categories).get(ref.strip().lower())
+
+    def _diff(self):
+        # Roles and categories first, so a channel sees whether its category already exists
+        for action in sorted(self.actions, key=lambda a: a.kind == "create_text"):
+            category = action.deps.get("category")
+            if category is not None and category.status == "create":
+                continue        # its category will be new, so the channel can't exist yet
+            existing = self.snapshot.find(action, self._resolve(action, "category"))
+            if existing is not None:
+                action.status = "exists"
+                action.result = existing
+
+    @property
+    def pending(self):
+        return [a for a in self.actions if a.status == "create"]
+
+    def outcome(self):
+        """Action counts after execution, for metrics and the audit log."""
+        return {
+            "created": sum(a.status == "done" for a in self.actions),
+            "skipped": sum(a.status == "exists" for a in self.actions),
+            "failed": sum(a.status in ("failed", "blocked") for a in self.actions),
+        }
+
+    def diff_lines(self, limit=25):
+        lines = [f"{'➕' if a.status == 'create' else '⏭️'} {a.label()}{'' if a.status == 'create' else ' (exists)'}"
+                 for a in self.actions]
+        if len(lines) > limit:
+            lines = lines[:limit] + [f"…and {len(lines) - limit} more"]
+        return "\n".join(lines)
+
+    def levels(self):
+        """Pending actions grouped so every action comes after the ones it depends on."""
+        depth = {}
+
+        def level_of(action):
+            if action.key not in depth:
+                depth[action.key] = 1 + max((level_of(d) for d in action.deps.values()), default=-1)
+            return depth[action.key]
+
+        grouped = {}
+        for action in self.pending:
+            grouped.setdefault(level_of(action), []).append(action)
+        return [grouped[k] for k in sorted(grouped)]
+
+class ProgressMessage:
+    """One status message edited in place, at most once per `interval` seconds (final edits always land)."""
+    def __init__(self, message, interval=1.5):
+        self.message = message
+        self.interval = interval
+        self._last = 0.0
+        self._latest = None
+        self._flush_task = None
+
+    def update(self, content, final=False):
+        self._latest = content
+        wait = self._last + self.interval - time.monotonic()
+        if final or wait <= 0:
+            if self._flush_task:
+                self._flush_task.cancel()
+                self._flush_task = None
+            return self._edit()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._delayed(wait))
+        return None
+
+    async def _delayed(self, wait):
+        await asyncio.sleep(wait)
+        self._flush_task = None
+        await self._edit()
+
+    def _edit(self):
+        self._last = time.monotonic()
+        content = self._latest
+        route, guild_id = outbound_route(self.message.channel)
+        return outbound.submit(lambda: self.message.edit(content=content), route=route, guild_id=guild_id)
+
+class PlanExecutor:
+    """Applies a GuildPlan level by level; actions within a level run concurrently, bounded by a semaphore."""
+    def __init__(self, concurrency=3):
+        self.concurrency = concurrency
+
+    @staticmethod
+    def _overwrites(plan, action):
+        role = plan._resolve(action, "role")
+        if role is None:
+            return {}
+        return {
+            plan.snapshot.guild.default_role: discord.PermissionOverwrite(view_channel=False),
+            role: discord.PermissionOverwrite(view_channel=True),
+        }
+
+    async def _apply(self, plan, action):
+        guild = plan.snapshot.guild
+        reason = f"Guild plan: {plan.name}"
+        if action.kind == "create_role":
+            color = action.params.get("color", "#99aab5").lstrip("#")
+            color = discord.Color.from_str(f"#{color}")
+            return await guild.create_role(name=action.name, color=color, reason=reason)
+        if action.kind == "create_category":
+            return await guild.create_category(action.name, overwrites=self._overwrites(plan, action), reason=reason)
+        extra = {"topic": action.params["topic"]} if action.params.get("topic") else {}
+        channel = await guild.create_text_channel(
+            action.name, category=plan._resolve(action, "category"), overwrites=self._overwrites(plan, action),
+            reason=reason, **extra
+        )
+        if action.params.get("seed"):
+            # Seed messages are only posted into channels this plan created, so re-runs don't repeat them
+            outbound.send(channel, action.params["seed"], priority=PRIORITY_BULK)
+        return channel
+
+    async def execute(self, plan, progress=None):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        total = len(plan.pending)
+        finished = 0
+
+        def render(final=False):
+            done = sum(a.status == "done" for a in plan.actions)
+            failed = [a for a in plan.actions if a.status in ("failed", "blocked")]
+            skipped = sum(a.status == "exists" for a in plan.actions)
+            head = "✅ **Execution Complete.**" if final and not failed else \
+                   "⚠️ **Execution finished with errors.**" if final else f"🏗️ **Executing {plan.name}…** {finished}/{total}"
+            lines = [head, f"Created {done} · skipped {skipped} existing · failed {len(failed)}"]
+            lines += [f"❌ {a.label()}: {a.result}" for a in failed[:10]]
+            return "\n".join(lines)
+
+        async def run(action):
+            nonlocal finished
+            if any(d.status not in ("done", "exists") for d in action.deps.values()):
+                action.status, action.result = "blocked", "dependency failed"
+            else:
+                async with semaphore:
+                    try:
+                        action.result = await self._apply(plan, action)
+                        action.status = "done"
+                    except Exception as e:
+                        action.status, action.result = "failed", e
+                        logger.warning(f"GuildPlan: {action.kind} {action.name} failed: {e}")
+            finished += 1
+            if progress:
+                progress.update(render())
+
+        for level in plan.levels():
+            await asyncio.gather(*(run(a) for a in level))
+        invalidate_guild_snapshot(plan.snapshot.guild.id)
+        if progress:
+            await progress.update(render(final=True))
+        for result, count in plan.outcome().items():
+            metrics.inc("maestro_guild_plan_actions_total", count, result=result)
+        return plan
+
+metrics.describe("maestro_guild_plan_actions_total", "counter", "Guild plan actions by result.")
+
+planner = PlanExecutor(concurrency=int(os.getenv("GUILD_PLAN_CONCURRENCY", 3)))
+
+# --- Declarative guild templates ---
+# A layout lists roles, categories (each with channels) and uncategorised channels.
+# "{param}" placeholders in any string are filled from the caller's params.
+BUILTIN_TEMPLATES = {
+    "py101": {
+        "name": "PY101 Course",
+        "categories": [{
+            "name": "PY101 - Python",
+            "channels": [
+                {"name": "syllabus"},
+                {"name": "homework-help"},
+                {"name": "resources", "seed": "📚 **Course Notes:**\n{course_notes}"},
+            ],
+        }],
+    },
+    "private_role": {
+        "name": "Private space for {role_name}",
+        "roles": [{"name": "{role_name}"}],
+        "categories": [{
+            "name": "{category_name}",
+            "private_to": "{role_name}",
+            "channels": [
+                {"name": "{channel_name}", "private_to": "{role_name}", "seed": "**Welcome to {role_name}!**\n{description}"},
+            ],
+        }],
+    },
+}
+
+_TEMPLATE_PARAM = re.compile(r"\{(\w+)\}")
+
+def compile_template(layout, params=None):
+    """Flattens a template layout into a guild plan dict (see PLAN_ACTIONS) with params filled in."""
+    params = params or {}
 
-# ==============================================================================
-# SECTION 7: SCAM SNIFFER ENGINE
-# ==============================================================================
-# Phrase patterns that strongly indicate a scam message.
-# All checks are case-insensitive. Add more patterns here as needed.
-SCAM_PATTERNS = [
-    # Giveaway / free gear scams
-    r"\bfree\s+(camera|laptop|iphone|macbook|pc|gpu|playstation|ps5|xbox|airpods|ipad|gift\s*card)\b",
-    r"\bgiving\s+away\b",
-    r"\bgiveaway\b.*\b(dm|message|click|link)\b",
+    def fill(value):
+        # Single pass, so braces inside user-supplied params are never expanded
+        return _TEMPLATE_PARAM.sub(lambda m: str(params.get(m.group(1), m.group(0))), value)
 
-    # "I don't need this anymore" bait
-    r"\bdon['\u2019]?t\s+need\s+(it|this|my)\s+anymore\b",
-    r"\bno\s+longer\s+need\b",
+    def entry(kind, spec, **extra):
+        if not isinstance(spec, dict):
+            raise PlanError([f"{kind} entries must be objects"])
+        fields = {k: fill(v) for k, v in spec.items() if isinstance(v, str)}
+        return {"type": kind, **fields, **extra}
 
-    # Crypto / investment scams
-    r"\b(invest|profit|earning|passive\s+income)\b.{0,40}\b(crypto|bitcoin|btc|eth|usdt|forex)\b",
-    r"\bdouble\s+your\s+(money|bitcoin|crypto|investment)\b",
-    r"\b(100|200|300|500)x\s+(return|profit|gain)\b",
-    r"\bguaranteed\s+(profit|return|income)\b",
+    def listed(spec, key):
+        value = spec.get(key, [])
+        if not isinstance(value, list):
+            raise PlanError([f"'{key}' must be a list"])
+        return value
 
-    # Phishing / account scams
-    r"\bverif(y|ication)\s+your\s+(discord|account|steam|paypal)\b",
-    r"\byour\s+account\s+(has\s+been|will\s+be)\s+(suspended|banned|flagged|terminated)\b",
-    r"\bclick\s+(this|the)\s+(link|button)\s+to\s+(claim|verify|receive|get)\b",
-    r"\bsteam\s+(gift|free\s+game|wallet)\b",
+    if not isinstance(layout, dict):
+        raise PlanError(["template must be a JSON object"])
+    actions = [entry("create_role", r) for r in listed(layout, "roles")]
+    for category in listed(layout, "categories"):
+        actions.append(entry("create_category", category))
+        parent = fill(category.get("name", ""))
+        actions += [entry("create_text", c, category=parent) for c in listed(category, "channels")]
+    actions += [entry("create_text", c) for c in listed(layout, "channels")]
+    return {"plan_name": fill(str(layout.get("name", "Template"))), "actions": actions}
 
-    # Suspicious TLD link patterns
-    r"https?://(?!discord\.com|discord\.gg|github\.com|youtube\.com|youtu\.be)[a-z0-9\-]+\.(xyz|tk|ml|ga|cf|gq|ru|top|click|loan|work|download)\b",
+class TemplateStore:
+    """Built-in layouts plus admin-saved ones (guild_templates.json), usable in any guild."""
+    def __init__(self):
+        self.saved = db.load_json("templates", {})
 
-    # Nitro scams
-    r"\bfree\s+nitro\b",
-    r"\bnitro\s+giveaway\b",
-    r"\bdiscord\s+nitro\s+(for\s+free|free)\b",
+    def get(self, name):
+        return self.saved.get(name) or BUILTIN_TEMPLATES.get(name)
 
-    # Job / money mule scams
-    r"\bearn\s+\$?\d+\s+(a\s+day|per\s+day|daily|weekly|a\s+week)\b",
-    r"\bwork\s+from\s+home\b.{0,40}\b(earn|make|income)\b",
-    r"\bno\s+experience\s+(needed|required)\b",
+    def names(self):
+        return sorted(set(BUILTIN_TEMPLATES) | set(self.saved))
 
-    # General urgency bait
-    r"\b(limited\s+time|act\s+now|only\s+\d+\s+left|expires?\s+soon)\b",
-    r"\bdm\s+me\s+(for\s+)?(details|info|more|the\s+link)\b",
-]
+    def save(self, name, layout):
+        compile_template(layout)        # raises PlanError on a malformed layout
+        self.saved[name] = layout
+        db.save_json("templates", self.saved)
 
-# Compile all patterns once at startup for performance
-_SCAM_REGEX = re.compile("|".join(SCAM_PATTERNS), re.IGNORECASE | re.UNICODE)
+templates = TemplateStore()
+db.subscribe("templates", lambda saved: setattr(templates, "saved", saved or {}))
 
-# Channel name to post scam alerts in (must exist in your server)
-SCAM_LOG_CHANNEL = "mod-log"
+async def apply_template(interaction: discord.Interaction, layout, params=None, dry_run=False):
+    """
+    Diffs a template against the cached guild snapshot and creates only what's missing,
+    reporting through one progress message. Expects a deferred interaction.
+    Returns the executed GuildPlan, or None if it was rejected or a dry run.
+    """
+    try:
+        plan = GuildPlan.from_json(compile_template(layout, params), guild_snapshot(interaction.guild))
+    except PlanError as e:
+        problems = "\n".join(f"• {p}" for p in e.problems[:10])
+        await interaction.followup.send(f"⚠️ **Template rejected:**\n{problems}")
+        return None
+    if dry_run:
+        await interaction.followup.send(f"🔍 **Dry run: {plan.name}**\n{plan.diff_lines()}")
+        return None
+    if not plan.pending:
+        await interaction.followup.send(f"✅ **{plan.name}** is already in place. Nothing to create.")
+        return plan
+    progress = ProgressMessage(await interaction.followup.send(f"🏗️ **Applying {plan.name}…**\n{plan.diff_lines()}"))
+    await planner.execute(plan, progress)
+    audit.record("template_apply", guild=interaction.guild, actor=interaction.user, plan=plan.name, **plan.outcome())
+    return plan
 
-async def scam_sniffer(message: discord.Message) -> bool:
+# ==============================================================================
+# SECTION 21: ONBOARDING PIPELINE
+# ==============================================================================
+COHORT_ROLE_NAME = os.getenv("COHORT_ROLE_NAME", "FebruaryCohort")
+
+WELCOME_DM = (
+    "👋 Welcome to the cohort, {name}!\n"
+    "Type `/help` in the server to get started.\n"
+    "Use `/optin` if you want DM alerts."
+)
+
+class OnboardingQueue:
     """
-    Scans a message for scam patterns.
-    If detected: deletes the message, bans the user, and logs to mod-log.
-    Returns True if a scam was detected, False otherwise.
-    Admins and bots are always exempt.
+    Absorbs join bursts (e.g. a cohort invite going out). on_member_join only enqueues;
+    a worker drains joins in batches, granting the guild's cohort role with bounded
+    concurrency under a per-guild token bucket, then queues the welcome DM on the
+    outbound scheduler's DM route with retries. Nothing fails silently: every outcome
+    is counted and failures are logged.
     """
-    if message.author.bot:
-        return False
-    if message.author.guild_permissions.administrator:
-        return False
+    def __init__(self, batch_size=20, grant_concurrency=4, grant_rate=(5, 10), dm_attempts=3):
+        self.batch_size = batch_size
+        self.grant_rate = grant_rate
+        self.dm_attempts = dm_attempts
+        self.config = db.load_json("onboarding", {})    # guild id -> {"role_id", "role_name"}
+        self._role_ids = TTLCache(maxsize=1024, ttl=600)  # guild id -> role id, 0 = none found
+        self._grant_buckets = {}
+        self._grant_slots = asyncio.Semaphore(grant_concurrency)
+        self._pending = deque()
+        self._wake = asyncio.Event()
+        self._task = None
+        self._welcomes = set()
+        self._in_batch = 0
 
-    content = message.content
+    def pending(self):
+        return len(self._pending)
 
-    # Also scan embed text (common in link previews)
-    for embed in message.embeds:
-        if embed.title:       content += " " + embed.title
-        if embed.description: content += " " + embed.description
-        if embed.url:         content += " " + embed.url
+    def idle(self):
+        """True once nothing is queued, no batch is running and every welcome DM has finished."""
+        return not self._pending and not self._in_batch and not self._welcomes
 
-    if not _SCAM_REGEX.search(content):
-        return False
+    def enqueue(self, member):
+        self._pending.append((member, time.monotonic()))
+        metrics.set_gauge("maestro_onboarding_queue_depth", len(self._pending))
+        self._wake.set()
 
-    matched = _SCAM_REGEX.search(content).group(0)
-    guild  = message.guild
-    author = message.author
+    def cohort_role(self, guild):
+        """The guild's cohort role, by cached id; falls back to a name lookup at most once per TTL."""
+        role_id = self._role_ids.get(guild.id)
+        if role_id is None:
+            conf = self.config.get(str(guild.id), {})
+            role = guild.get_role(conf["role_id"]) if conf.get("role_id") else None
+            role = role or discord.utils.get(guild.roles, name=conf.get("role_name", COHORT_ROLE_NAME))
+            role_id = role.id if role else 0
+            self._role_ids.set(guild.id, role_id)
+        return guild.get_role(role_id) if role_id else None
 
-    logger.warning(f"SCAM DETECTED | User: {author} ({author.id}) | Match: '{matched}' | Msg: {content[:100]}")
+    def reload(self, config):
+        self.config = config or {}
+        self._role_ids.clear()
 
-    # 1. Delete the message
-    try:
-        await message.delete()
-    except discord.Forbidden:
-        logger.error("Scam Sniffer: Missing permission to delete messages.")
-    except discord.NotFound:
-        pass
+    def set_role(self, guild_id, role):
+        self.config[str(guild_id)] = {"role_id": role.id, "role_name": role.name}
+        db.save_json("onboarding", self.config)
+        self._role_ids.set(guild_id, role.id)
 
-    # 2. Ban the user
-    try:
-        await guild.ban(
-            author,
-            reason=f"[Maestro AutoMod] Scam detected. Trigger: '{matched}'",
-            delete_message_days=1
-        )
-        logger.info(f"Scam Sniffer: Banned {author} ({author.id})")
-    except discord.Forbidden:
-        logger.error("Scam Sniffer: Missing permission to ban members.")
-    except Exception as e:
-        logger.error(f"Scam Sniffer: Ban failed: {e}")
+    def start(self):
+        self._task = asyncio.create_task(self._drain())
 
-    # 3. Log to mod-log channel
-    log_chan = discord.utils.get(guild.text_channels, name=SCAM_LOG_CHANNEL)
-    if log_chan:
-        embed = discord.Embed(
-            title="🚨 Scam Message Auto-Removed",
-            color=COLOR_ERROR,
-            timestamp=datetime.utcnow()
-        )
-        embed.add_field(name="User",           value=f"{author.mention} (`{author.id}`)", inline=True)
-        embed.add_field(name="Channel",        value=message.channel.mention,              inline=True)
-        embed.add_field(name="Trigger Phrase", value=f"`{matched}`",                       inline=False)
-        embed.add_field(
-            name="Message Preview",
-            value=f"```{message.content[:300]}```" if message.content else "*No text content*",
-            inline=False
-        )
-        embed.set_footer(text="Action: Message deleted | User banned")
-        try:
-            await log_chan.send(embed=embed)
-        except Exception as e:
-            logger.error(f"Scam Sniffer: Could not post to mod-log: {e}")
-    else:
-        logger.warning(f"Scam Sniffer: No '{SCAM_LOG_CHANNEL}' channel found for logging.")
+    async def _drain(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                metrics.set_gauge("maestro_onboarding_queue_depth", len(self._pending))
+                self._in_batch = len(batch)
+                try:
+                    await asyncio.gather(*(self._onboard(member, t0) for member, t0 in batch))
+                finally:
+                    self._in_batch = 0
 
-    return True
+    async def _onboard(self, member, t0):
+        guild = member.guild
+        if guild.get_member(member.id) is None:
+            metrics.inc("maestro_onboarding_total", step="role", result="left")
+            return
+        role = self.cohort_role(guild)
+        if role is not None and role not in member.roles:
+            await self._grant(member, role, t0)
+        task = asyncio.create_task(self._welcome(member, t0))
+        self._welcomes.add(task)
+        task.add_done_callback(self._welcomes.discard)
+
+    async def _grant(self, member, role, t0):
+        bucket = self._grant_buckets.get(member.guild.id)
+        if bucket is None:
+            bucket = self._grant_buckets[member.guild.id] = TokenBucket(*self.grant_rate)
+        async with self._grant_slots:
+            while (wait := bucket.ready_in()) > 0:
+                await asyncio.sleep(wait)
+            bucket.take()
+            for attempt in range(2):
+                try:
+                    await member.add_roles(role, reason="Cohort onboarding")
+                    metrics.inc("maestro_onboarding_total", step="role", result="granted")
+                    metrics.observe("maestro_onboarding_latency_seconds", time.monotonic() - t0, step="role")
+                    return
+                except discord.Forbidden as e:
+                    error = e
+                    break
+                except discord.HTTPException as e:
+                    error = e
+                    await asyncio.sleep(2 ** attempt)
+        metrics.inc("maestro_onboarding_total", step="role", result="failed")
+        logger.error(f"Onboarding: failed to grant {role.name} to {member.name}: {error}",
+                     extra={"guild": member.guild.id, "user": member.id})
+
+    async def _welcome(self, member, t0):
+        msg = WELCOME_DM.format(name=member.name)
+        for attempt in range(self.dm_attempts):
+            try:
+                await outbound.send(member, msg, priority=PRIORITY_BULK)
+                metrics.inc("maestro_onboarding_total", step="dm", result="sent")
+                metrics.observe("maestro_onboarding_latency_seconds", time.monotonic() - t0, step="dm")
+                return
+            except discord.Forbidden:
+                # DMs closed: expected for some members, not worth retrying
+                metrics.inc("maestro_onboarding_total", step="dm", result="closed")
+                return
+            except discord.HTTPException as e:
+                logger.warning(f"Onboarding: welcome DM to {member.name} failed (attempt {attempt + 1}): {e}",
+                               extra={"guild": member.guild.id, "user": member.id})
+                await asyncio.sleep(5 * 2 ** attempt)
+        metrics.inc("maestro_onboarding_total", step="dm", result="failed")
+
+metrics.describe("maestro_onboarding_queue_depth", "gauge", "Joins waiting for onboarding.")
+metrics.describe("maestro_onboarding_total", "counter", "Onboarding outcomes by step and result.")
+metrics.describe("maestro_onboarding_latency_seconds", "histogram", "Time from join to role grant / welcome DM.")
+
+onboarding = OnboardingQueue(
+    batch_size=int(os.getenv("ONBOARDING_BATCH_SIZE", 20)),
+    grant_concurrency=int(os.getenv("ONBOARDING_GRANT_CONCURRENCY", 4)),
+)
+db.subscribe("onboarding", onboarding.reload)
 
 # ==============================================================================
-# SECTION 8: EVENT LISTENERS
+# SECTION 22: EVENT LISTENERS
 # ==============================================================================
 @bot.event
 async def on_ready():
     logger.info(f"Discord: Online as {bot.user}")
+    startup.end("gateway_connect")
+    startup.mark_ready()
     await bot.change_presence(activity=discord.Game(name="/help | v3.2"))
 
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    record_command(interaction, "ok")
+
+@bot.event
+async def on_socket_event_type(event_type):
+    metrics.inc("maestro_gateway_events_total", event=event_type)
+    metrics.set_gauge("maestro_gateway_latency_seconds", bot.latency)
+
 @bot.event
 async def on_member_join(member):
-    role = discord.utils.get(member.guild.roles, name="FebruaryCohort")
-    if role:
-        try:
-            await member.add_roles(role)
-        except Exception:
-            logger.error(f"Failed to assign role to {member.name}")
-    msg = (
-        f"👋 Welcome to the cohort, {member.name}!\n"
-        "Type `/help` in the server to get started.\n"
-        "Use `/optin` if you want DM alerts."
-    )
-    try:
-        await member.send(msg)
-    except Exception:
-        pass
+    onboarding.enqueue(member)
 
 @bot.event
 async def on_raw_reaction_add(payload):
@@ -518,7 +3919,7 @@ async def on_raw_reaction_add(payload):
         member = payload.member or guild.get_member(payload.user_id)
         if role and member:
             await member.add_roles(role)
-            logger.info(f"Role {role.name} given to {member.name}")
+            logger.info(f"Role {role.name} given to {member.name}", extra={"guild": guild.id, "user": member.id})
 
 @bot.event
 async def on_raw_reaction_remove(payload):
@@ -529,7 +3930,31 @@ async def on_raw_reaction_remove(payload):
         member = guild.get_member(payload.user_id)
         if role and member:
             await member.remove_roles(role)
-            logger.info(f"Role {role.name} removed from {member.name}")
+            logger.info(f"Role {role.name} removed from {member.name}", extra={"guild": guild.id, "user": member.id})
+
+@bot.event
+async def on_guild_channel_create(channel):
+    invalidate_guild_snapshot(channel.guild.id)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    invalidate_guild_snapshot(channel.guild.id)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    invalidate_guild_snapshot(after.guild.id)
+
+@bot.event
+async def on_guild_role_create(role):
+    invalidate_guild_snapshot(role.guild.id)
+
+@bot.event
+async def on_guild_role_delete(role):
+    invalidate_guild_snapshot(role.guild.id)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    invalidate_guild_snapshot(after.guild.id)
 
 @bot.event
 async def on_message(message):
@@ -550,12 +3975,35 @@ async def on_message(message):
         if not prompt:
             return
 
+        def react(emoji):
+            # Reactions use their own route, so notices never queue behind replies in the channel
+            outbound.submit(lambda: message.add_reaction(emoji), route=f"reaction:{message.channel.id}",
+                            guild_id=message.guild.id, priority=PRIORITY_BULK)
+
+        try:
+            admission.charge(message.author.id, message.guild.id if message.guild else None, bypass=is_admin)
+        except RateLimited as e:
+            if admission.first_notice(message.author.id):
+                if e.scope == "restart":
+                    outbound.send(message.channel, f"🔄 {message.author.mention} Maestro is restarting — ask again in a moment.")
+                else:
+                    react("⏳")
+            return
+
+        async def on_queued(position):
+            react("🕒")
+
+        history = memory.context(message.channel.id)
+        memory.record(message.channel.id, "user", f"{message.author.display_name}: {prompt}")
+
         if is_admin:
             async with message.channel.typing():
                 # Send with architect_mode=True so the AI knows it CAN return JSON for server actions.
                 # But we only EXECUTE if the response actually contains a JSON block with actions.
                 # If the AI decides the message is casual, it will return plain text and we just show it.
-                response = await brain.query(prompt, architect_mode=True)
+                async with admission.slot(message.author.id, on_queued=on_queued):
+                    response = await brain.query(prompt, architect_mode=True, history=history)
+                memory.record(message.channel.id, "assistant", response)
 
                 if "```json" in response:
                     try:
@@ -565,19 +4013,30 @@ async def on_message(message):
 
                         if not actions:
                             # Valid JSON but no actions — just show the response as text
-                            chunks = [response[i:i+2000] for i in range(0, len(response), 2000)]
-                            for chunk in chunks:
-                                await message.channel.send(chunk)
+                            await send_channel_chunks(message.channel, response)
+                            return
+
+                        try:
+                            guild_plan = GuildPlan.from_json(plan, guild_snapshot(message.guild))
+                        except PlanError as e:
+                            problems = "\n".join(f"• {p}" for p in e.problems[:10])
+                            await outbound.send(message.channel, f"⚠️ **Architect plan rejected:**\n{problems}")
+                            return
+                        if not guild_plan.pending:
+                            await outbound.send(message.channel, "✅ Everything in this plan already exists. No changes needed.")
                             return
 
-                        # Confirm with the admin before executing
-                        confirm_msg = await message.channel.send(
-                            f"🏗️ **Architect Plan: {plan.get('plan_name', 'Unnamed')}**\n"
-                            f"This will perform **{len(actions)} action(s)** on the server.\n"
+                        # Show the dry-run diff and confirm with the admin before executing
+                        confirm_msg = await outbound.send(
+                            message.channel,
+                            f"🏗️ **Architect Plan: {guild_plan.name}**\n"
+                            f"{guild_plan.diff_lines()}\n"
+                            f"This will perform **{len(guild_plan.pending)} action(s)** on the server.\n"
                             f"React ✅ to confirm or ❌ to cancel."
                         )
-                        await confirm_msg.add_reaction("✅")
-                        await confirm_msg.add_reaction("❌")
+                        for emoji in ("✅", "❌"):   # awaited in turn so they appear in this order
+                            await outbound.submit(lambda emoji=emoji: confirm_msg.add_reaction(emoji),
+                                                  route=f"reaction:{message.channel.id}", guild_id=message.guild.id)
 
                         def check(reaction, user):
                             return (
@@ -589,49 +4048,33 @@ async def on_message(message):
                         try:
                             reaction, _ = await bot.wait_for("reaction_add", timeout=30.0, check=check)
                         except asyncio.TimeoutError:
-                            await message.channel.send("⏱️ Architect plan timed out. No changes were made.")
+                            await outbound.send(message.channel, "⏱️ Architect plan timed out. No changes were made.")
                             return
 
                         if str(reaction.emoji) == "❌":
-                            await message.channel.send("🚫 Architect plan cancelled.")
+                            await outbound.send(message.channel, "🚫 Architect plan cancelled.")
                             return
 
-                        # Execute actions
-                        for action in actions:
-                            atype = action.get('type')
-                            aname = action.get('name')
-                            if atype == 'create_role':
-                                await message.guild.create_role(
-                                    name=aname,
-                                    color=discord.Color.from_str(action.get('color', '#99aab5'))
-                                )
-                                await message.channel.send(f"🔹 Created Role: **{aname}**")
-                            elif atype == 'create_text':
-                                cat = discord.utils.get(message.guild.categories, name=action.get('category'))
-                                await message.guild.create_text_channel(aname, category=cat)
-                                await message.channel.send(f"🔹 Created Channel: **{aname}**")
-                            elif atype == 'create_category':
-                                await message.guild.create_category(aname)
-                                await message.channel.send(f"🔹 Created Category: **{aname}**")
-
-                        await message.channel.send("✅ **Execution Complete.**")
+                        # Execute: categories before their channels, independent actions concurrently
+                        progress = ProgressMessage(await outbound.send(message.channel, f"🏗️ **Executing {guild_plan.name}…**"))
+                        await planner.execute(guild_plan, progress)
+                        audit.record("architect_plan", guild=message.guild, actor=message.author,
+                                     plan=guild_plan.name, **guild_plan.outcome())
 
                     except Exception as e:
-                        await message.channel.send(f"⚠️ **Architect Malfunction:** {e}")
+                        await outbound.send(message.channel, f"⚠️ **Architect Malfunction:** {e}")
                 else:
                     # Plain text response — just send it normally
-                    chunks = [response[i:i+2000] for i in range(0, len(response), 2000)]
-                    for chunk in chunks:
-                        await message.channel.send(chunk)
+                    await send_channel_chunks(message.channel, response)
         else:
             async with message.channel.typing():
-                res = await brain.query(prompt)
-                chunks = [res[i:i+2000] for i in range(0, len(res), 2000)]
-                for chunk in chunks:
-                    await message.channel.send(chunk)
+                async with admission.slot(message.author.id, on_queued=on_queued):
+                    res = await brain.query(prompt, history=history)
+                memory.record(message.channel.id, "assistant", res)
+                await send_channel_chunks(message.channel, res)
 
 # ==============================================================================
-# SECTION 8: SLASH COMMANDS
+# SECTION 23: SLASH COMMANDS
 # ==============================================================================
 
 # --- HELP ---
@@ -641,12 +4084,12 @@ async def cmd_help(interaction: discord.Interaction):
     embed = discord.Embed(title="Maestro Command Suite", color=COLOR_PRIMARY)
     embed.add_field(
         name="🎓 Education",
-        value="`/ask`, `/review`, `/yt`, `/resource`, `/flashcard`, `/studygroup`",
+        value="`/ask`, `/review`, `/yt`, `/resource`, `/flashcard`, `/studygroup`, `/forget`",
         inline=False
     )
     embed.add_field(
         name="🛠️ Utilities",
-        value="`/poll`, `/remindme`, `/dev`, `/studyhelper`, `/challenge`",
+        value="`/poll`, `/poll_close`, `/remindme`, `/reminders`, `/reminder_cancel`, `/dev`, `/studyhelper`, `/challenge`",
         inline=False
     )
     embed.add_field(
@@ -657,7 +4100,7 @@ async def cmd_help(interaction: discord.Interaction):
     if is_admin:
         embed.add_field(
             name="🛡️ Admin",
-            value="`/kick`, `/ban`, `/unban`, `/make_role`, `/announce`, `/dmall`, `/dmtouser`, `/setup_py101`, `/setup_private_role`, `/post_in`, `/scam_test`",
+            value="`/kick`, `/ban`, `/unban`, `/make_role`, `/announce`, `/dmall`, `/dmtouser`, `/setup_py101`, `/setup_private_role`, `/template_apply`, `/template_save`, `/cohort_role`, `/post_in`, `/scam_test`, `/domain`, `/ai_override`, `/audit`",
             inline=False
         )
     embed.set_footer(text=f"Maestro v{VERSION} | {BRAND_NAME}")
@@ -669,6 +4112,7 @@ async def cmd_help(interaction: discord.Interaction):
 async def cmd_kick(interaction: discord.Interaction, member: discord.Member, reason: str = "No reason provided"):
     try:
         await member.kick(reason=reason)
+        audit.record("kick", guild=interaction.guild, actor=interaction.user, target=member, reason=reason)
         await interaction.response.send_message(f"👞 **Kicked:** {member.mention} | Reason: {reason}")
     except discord.Forbidden:
         await interaction.response.send_message("❌ I don't have permission to kick that member.", ephemeral=True)
@@ -678,6 +4122,7 @@ async def cmd_kick(interaction: discord.Interaction, member: discord.Member, rea
 async def cmd_ban(interaction: discord.Interaction, member: discord.Member, reason: str = "No reason provided"):
     try:
         await member.ban(reason=reason)
+        audit.record("ban", guild=interaction.guild, actor=interaction.user, target=member, reason=reason)
         await interaction.response.send_message(f"🔨 **Banned:** {member.mention} | Reason: {reason}")
     except discord.Forbidden:
         await interaction.response.send_message("❌ I don't have permission to ban that member.", ephemeral=True)
@@ -706,54 +4151,74 @@ async def cmd_dev(interaction: discord.Interaction):
 @bot.tree.command(name="studyhelper", description="Get info on the Study Helper repo")
 async def cmd_studyhelper(interaction: discord.Interaction):
     await interaction.response.defer()
-    # FIX: Was incorrectly wrapped in markdown link syntax in v3.2 draft
-    raw_url = "https://raw.githubusercontent.com/MacTheAnon/study-helper/main/README.md"
-    try:
-        r = requests.get(raw_url, timeout=10)
-        text = r.text if r.status_code == 200 else "README unavailable."
-        content = f"🚀 **Study Helper Tool**\n🔗 <{GITHUB_PROJECT_LINK}>\n\n{text}"
-        await send_interaction_chunks(interaction, content)
-    except Exception as e:
-        await interaction.followup.send(f"⚠️ Error fetching data: {e}")
+    text = await documents.get(STUDY_HELPER_README_URL) or "README unavailable."
+    content = f"🚀 **Study Helper Tool**\n🔗 <{GITHUB_PROJECT_LINK}>\n\n{text}"
+    await send_interaction_chunks(interaction, content)
 
-@bot.tree.command(name="poll", description="Create a poll (2–10 options, comma-separated)")
-async def cmd_poll(interaction: discord.Interaction, question: str, options_comma_separated: str):
-    options = [opt.strip() for opt in options_comma_separated.split(",")]
+@bot.tree.command(name="poll", description="Create a button poll (2–10 options, comma-separated; optional duration like 1h)")
+async def cmd_poll(interaction: discord.Interaction, question: str, options_comma_separated: str, duration: str = None):
+    options = [opt.strip() for opt in options_comma_separated.split(",") if opt.strip()]
     if len(options) < 2 or len(options) > 10:
         return await interaction.response.send_message(
             "❌ Provide between 2 and 10 comma-separated options.", ephemeral=True
         )
+    seconds = parse_duration(duration) if duration else None
+    if duration and not seconds:
+        return await interaction.response.send_message("❌ Duration looks like `30m`, `2h` or `1d`.", ephemeral=True)
 
-    desc = ""
-    for i, opt in enumerate(options):
-        desc += f"{chr(0x1F1E6 + i)} {opt}\n"
+    await interaction.response.send_message("✅ Poll created!", ephemeral=True)
+    await polls.create(interaction.channel, interaction.user.id, question, options, seconds)
 
-    embed = discord.Embed(title=f"📊 {question}", description=desc, color=COLOR_SUCCESS)
-    await interaction.response.send_message("✅ Poll created!")
-    msg = await interaction.channel.send(embed=embed)
-    for i in range(len(options)):
-        await msg.add_reaction(chr(0x1F1E6 + i))
+@bot.tree.command(name="poll_close", description="Close a poll early and post the final results")
+async def cmd_poll_close(interaction: discord.Interaction, poll_id: str):
+    poll = polls.polls.get(poll_id.strip().lower())
+    if poll is None or poll.guild_id != interaction.guild_id:
+        return await interaction.response.send_message("❌ No poll with that id here.", ephemeral=True)
+    if interaction.user.id != poll.author_id and not interaction.user.guild_permissions.manage_messages:
+        return await interaction.response.send_message("❌ Only the poll's creator or a moderator can close it.", ephemeral=True)
+    await interaction.response.send_message(f"🔒 Poll {poll.id} closed.", ephemeral=True)
+    await polls.close(poll)
 
-@bot.tree.command(name="remindme", description="Set a reminder (e.g. duration: 5m or 1h)")
+@bot.tree.command(name="remindme", description="Set a reminder (e.g. duration: 45m, 1h30m or 2d)")
 async def cmd_remindme(interaction: discord.Interaction, duration: str, task: str):
-    match = re.match(r"(\d+)([mh])", duration.lower())
-    if not match:
+    secs = parse_duration(duration)
+    if not secs:
+        return await interaction.response.send_message(
+            "❌ Invalid duration format. Combine numbers with s/m/h/d/w, e.g. `45m`, `1h30m` or `2d`.",
+            ephemeral=True
+        )
+    if secs > MAX_REMINDER_SECONDS:
+        return await interaction.response.send_message("❌ Reminders can be at most 365 days out.", ephemeral=True)
+    if len(reminders.for_user(interaction.user.id)) >= MAX_REMINDERS_PER_USER:
         return await interaction.response.send_message(
-            "❌ Invalid duration format. Use '5m' for minutes or '1h' for hours.", ephemeral=True
+            f"❌ You already have {MAX_REMINDERS_PER_USER} pending reminders. Cancel one with `/reminder_cancel`.",
+            ephemeral=True
         )
 
-    val, unit = match.groups()
-    secs = int(val) * (60 if unit == 'm' else 3600)
-    await interaction.response.send_message(f"⏰ Timer set for {val}{unit}. I'll remind you!")
+    reminder = reminders.add(interaction.user.id, interaction.channel_id, interaction.guild_id, task, secs)
+    await interaction.response.send_message(
+        f"⏰ Timer set for {format_duration(secs)} (reminder #{reminder['id']}). I'll remind you!"
+    )
 
-    async def reminder_task():
-        await asyncio.sleep(secs)
-        try:
-            await interaction.channel.send(f"🔔 **Reminder:** {interaction.user.mention} — {task}")
-        except Exception as e:
-            logger.warning(f"Reminder send failed: {e}")
+@bot.tree.command(name="reminders", description="List your pending reminders")
+async def cmd_reminders(interaction: discord.Interaction):
+    pending = reminders.for_user(interaction.user.id)
+    if not pending:
+        return await interaction.response.send_message("📭 You have no pending reminders.", ephemeral=True)
+    lines = [
+        f"`#{r['id']}` <t:{int(r['due'])}:R> — {r['task'][:80]}"
+        for r in pending
+    ]
+    await interaction.response.send_message("⏰ **Your Reminders**\n" + "\n".join(lines), ephemeral=True)
 
-    bot.loop.create_task(reminder_task())
+@bot.tree.command(name="reminder_cancel", description="Cancel one of your pending reminders")
+async def cmd_reminder_cancel(interaction: discord.Interaction, reminder_id: int):
+    if reminders.cancel(interaction.user.id, reminder_id):
+        await interaction.response.send_message(f"✅ Reminder #{reminder_id} cancelled.", ephemeral=True)
+    else:
+        await interaction.response.send_message(
+            f"❌ You don't have a pending reminder #{reminder_id}.", ephemeral=True
+        )
 
 @bot.tree.command(name="studygroup", description="Create a private study group channel")
 async def cmd_studygroup(interaction: discord.Interaction):
@@ -773,12 +4238,13 @@ async def cmd_studygroup(interaction: discord.Interaction):
 
 # --- AI & LEARNING TOOLS ---
 @bot.tree.command(name="challenge", description="Generate a daily coding challenge")
-async def cmd_challenge(interaction: discord.Interaction):
-    await interaction.response.defer()
-    res = await brain.query(
-        "Generate a beginner Python coding challenge. No code solution, just the problem description."
+async def cmd_challenge(interaction: discord.Interaction, topic: str = "Python"):
+    item = await bank_item(interaction, "challenge", topic)
+    if item is None:
+        return
+    await send_interaction_chunks(
+        interaction, f"🧩 **Daily Challenge: {item['title']}** ({item['difficulty']})\n{item['prompt']}"
     )
-    await interaction.followup.send(f"🧩 **Daily Challenge**\n{res}")
 
 @bot.tree.command(name="earn", description="Earn the Python Learner badge")
 async def cmd_earn(interaction: discord.Interaction):
@@ -801,59 +4267,78 @@ async def cmd_earn(interaction: discord.Interaction):
 
 @bot.tree.command(name="flashcard", description="Generate a flashcard on a topic")
 async def cmd_flashcard(interaction: discord.Interaction, topic: str = "Python"):
-    await interaction.response.defer()
-    res = await brain.query(
-        f"Create a flashcard for {topic}. Format: Question: [Q] || Answer: [A]."
-    )
-    if "||" in res:
-        q, a = res.split("||", 1)
-        try:
-            await interaction.user.send(f"❓ **Flashcard ({topic})**\n{q.strip()}\n\n✅ **Answer:**\n{a.strip()}")
-            await interaction.followup.send("📩 Check your DMs for your flashcard!")
-        except discord.Forbidden:
-            await interaction.followup.send(
-                "❌ I couldn't DM you. Please check your privacy settings and try again."
-            )
-    else:
-        await interaction.followup.send(res)
+    card = await bank_item(interaction, "flashcard", topic)
+    if card is None:
+        return
+    try:
+        await outbound.send(interaction.user, f"❓ **Flashcard ({topic})**\n{card['question']}\n\n✅ **Answer:**\n{card['answer']}")
+        await interaction.followup.send("📩 Check your DMs for your flashcard!")
+    except discord.Forbidden:
+        await interaction.followup.send(
+            "❌ I couldn't DM you. Please check your privacy settings and try again."
+        )
 
 @bot.tree.command(name="ask", description="Ask Maestro a question")
 async def cmd_ask(interaction: discord.Interaction, query: str):
-    await interaction.response.defer()
-    response = await brain.query(query)
+    response = await ask_ai(interaction, query)
+    if response is None:
+        return
     await send_interaction_chunks(interaction, response)
 
 @bot.tree.command(name="review", description="Submit code for Maestro to review")
 async def cmd_review(interaction: discord.Interaction, code: str):
-    await interaction.response.defer()
-    response = await brain.query(f"Review this code for bugs and improvements:\n{code}")
-    await send_interaction_chunks(interaction, response)
+    findings = precheck_code(code)
+    if findings and all(f.certain for f in findings):
+        # The code would crash before anything else matters: answer now, no AI call
+        metrics.inc("maestro_review_precheck_total", outcome="instant")
+        await interaction.response.send_message(
+            f"🔎 **Quick check found {len(findings)} problem(s):**\n{format_findings(findings)}\n\n"
+            "Fix these and run `/review` again for a full review."
+        )
+        return
+    if findings:
+        metrics.inc("maestro_review_precheck_total", outcome="targeted")
+        prompt = (
+            "A beginner's code was statically checked. These hints may include false alarms, so confirm "
+            "each one against the code first:\n"
+            + "\n".join(f"- line {f.line}: {f.kind}{'' if f.certain else ' (possible)'}: {f.message}" for f in findings[:10])
+            + "\nBriefly explain the real issues and show the corrected lines, then give at most two other tips."
+            + f"\n\nCode:\n{code}"
+        )
+    else:
+        metrics.inc("maestro_review_precheck_total", outcome="clean")
+        prompt = f"Review this code for bugs and improvements:\n{code}"
+    response = await ask_ai(interaction, prompt)
+    if response is None:
+        return
+    await send_interaction_chunks(interaction, response, paged=True)
 
 @bot.tree.command(name="yt", description="Get a high-quality YouTube tutorial recommendation")
 async def cmd_yt(interaction: discord.Interaction, topic: str):
-    await interaction.response.defer()
-    response = await brain.query(
-        f"Provide one high-quality YouTube URL for learning: {topic}. Output ONLY the URL."
-    )
+    response = await ask_ai(interaction, f"Provide one high-quality YouTube URL for learning: {topic}. Output ONLY the URL.")
+    if response is None:
+        return
     await interaction.followup.send(f"📺 **Maestro Pick:** {response}")
 
 @bot.tree.command(name="resource", description="Get 3 free learning resources on a topic")
 async def cmd_resource(interaction: discord.Interaction, topic: str):
-    await interaction.response.defer()
-    res = await brain.query(f"List 3 free learning resources for {topic} with URLs.")
+    res = await ask_ai(interaction, f"List 3 free learning resources for {topic} with URLs.")
+    if res is None:
+        return
     await send_interaction_chunks(interaction, res)
 
+@bot.tree.command(name="forget", description="Clear Maestro's chat memory for this channel")
+async def cmd_forget(interaction: discord.Interaction):
+    cleared = memory.forget(interaction.channel_id)
+    msg = "🧹 Conversation memory cleared." if cleared else "Nothing to forget here."
+    await interaction.response.send_message(msg, ephemeral=True)
+
 # --- ADMIN COMMANDS ---
 @bot.tree.command(name="setup_py101", description="Initialize PY101 Course Structure")
 @app_commands.default_permissions(administrator=True)
 async def cmd_setup_py101(interaction: discord.Interaction):
     await interaction.response.defer()
-    cat = await interaction.guild.create_category("PY101 - Python")
-    await interaction.guild.create_text_channel("syllabus", category=cat)
-    await interaction.guild.create_text_channel("homework-help", category=cat)
-    res_chan = await interaction.guild.create_text_channel("resources", category=cat)
-    await res_chan.send(f"📚 **Course Notes:**\n{COURSE_NOTES[:1500]}")
-    await interaction.followup.send("✅ PY101 Course Environment is ready.")
+    await apply_template(interaction, templates.get("py101"), {"course_notes": COURSE_NOTES[:1500]})
 
 @bot.tree.command(name="make_role", description="Create a new server role")
 @app_commands.default_permissions(manage_roles=True)
@@ -872,13 +4357,14 @@ async def cmd_make_role(interaction: discord.Interaction, name: str, hex_color:
 async def cmd_announce(interaction: discord.Interaction, title: str, description: str):
     embed = discord.Embed(title=title, description=description, color=COLOR_ACCENT)
     await interaction.response.send_message("✅ Announcement posted.", ephemeral=True)
-    await interaction.channel.send(embed=embed)
+    await outbound.send(interaction.channel, embed=embed)
 
 @bot.tree.command(name="post_in", description="Post a message to a specific channel")
 @app_commands.default_permissions(administrator=True)
 async def cmd_post_in(interaction: discord.Interaction, channel: discord.TextChannel, message: str):
     try:
-        await channel.send(message)
+        await outbound.send(channel, message)
+        audit.record("post_in", guild=interaction.guild, actor=interaction.user, channel=channel.id, message=message[:200])
         await interaction.response.send_message(f"✅ Posted in {channel.mention}", ephemeral=True)
     except discord.Forbidden:
         await interaction.response.send_message(
@@ -889,22 +4375,15 @@ async def cmd_post_in(interaction: discord.Interaction, channel: discord.TextCha
 @app_commands.default_permissions(administrator=True)
 async def cmd_dmall(interaction: discord.Interaction, message: str):
     await interaction.response.defer(ephemeral=True)
-    count = 0
-    for uid in list(db.dm_optins):
-        try:
-            u = await bot.fetch_user(int(uid))
-            await u.send(f"🚨 **Admin Notice:** {message}")
-            count += 1
-            await asyncio.sleep(0.5)  # Rate limit safety
-        except Exception:
-            pass
+    count = await dm_opted_in(f"🚨 **Admin Notice:** {message}", kind="dmall")
+    audit.record("dmall", guild=interaction.guild, actor=interaction.user, delivered=count, message=message[:200])
     await interaction.followup.send(f"✅ Sent to {count} users.")
 
 @bot.tree.command(name="dmtouser", description="Send a DM to a specific user")
 @app_commands.default_permissions(administrator=True)
 async def cmd_dmtouser(interaction: discord.Interaction, user: discord.Member, message: str):
     try:
-        await user.send(f"📩 **Message from Admin:** {message}")
+        await outbound.send(user, f"📩 **Message from Admin:** {message}")
         await interaction.response.send_message(f"✅ Sent to {user.mention}.", ephemeral=True)
     except discord.Forbidden:
         await interaction.response.send_message(
@@ -923,50 +4402,63 @@ async def cmd_setup_private_role(
 ):
     await interaction.response.defer()
     try:
-        # 1. Role
-        role = discord.utils.get(interaction.guild.roles, name=role_name)
-        if not role:
-            role = await interaction.guild.create_role(name=role_name)
-
-        # 2. Permissions
-        overwrites = {
-            interaction.guild.default_role: discord.PermissionOverwrite(view_channel=False),
-            role: discord.PermissionOverwrite(view_channel=True)
-        }
-
-        # 3. Category & Channel
-        cat = discord.utils.get(interaction.guild.categories, name=category_name)
-        if not cat:
-            cat = await interaction.guild.create_category(category_name, overwrites=overwrites)
-
-        chan = await interaction.guild.create_text_channel(channel_name, category=cat, overwrites=overwrites)
-        await chan.send(f"**Welcome to {role_name}!**\n{description}")
+        # 1. Role, category and channel (only the missing pieces)
+        params = {"role_name": role_name, "category_name": category_name,
+                  "channel_name": channel_name, "description": description}
+        plan = await apply_template(interaction, templates.get("private_role"), params)
+        if plan is None:
+            return
 
-        # 4. Reaction Gate
-        gate_chan = discord.utils.get(interaction.guild.text_channels, name="get-roles")
+        # 2. Reaction Gate (once per role)
+        if role_name in db.role_reactions.values():
+            return
+        gate_chan = guild_snapshot(interaction.guild).channels_by_name.get("get-roles")
         if gate_chan:
-            gate_msg = await gate_chan.send(f"{emoji} React here to join **{role_name}**")
-            await gate_msg.add_reaction(emoji)
+            gate_msg = await outbound.send(gate_chan, f"{emoji} React here to join **{role_name}**")
+            await outbound.submit(lambda: gate_msg.add_reaction(emoji), route=f"reaction:{gate_chan.id}",
+                                  guild_id=interaction.guild_id)
             db.add_reaction_role(gate_msg.id, role_name)
-            await interaction.followup.send(
-                f"✅ Private ecosystem created for **{role_name}**. Reaction gate posted in {gate_chan.mention}."
-            )
+            await interaction.followup.send(f"🔐 Reaction gate for **{role_name}** posted in {gate_chan.mention}.")
         else:
-            await interaction.followup.send(
-                f"✅ Private ecosystem created for **{role_name}**.\n"
-                "⚠️ No `#get-roles` channel found — reaction gate was not posted."
-            )
+            await interaction.followup.send("⚠️ No `#get-roles` channel found — reaction gate was not posted.")
     except Exception as e:
         logger.error(f"setup_private_role error: {e}")
         await interaction.followup.send(f"❌ Setup Error: {e}")
 
 
+@bot.tree.command(name="cohort_role", description="Set the role new members receive when they join")
+@app_commands.default_permissions(administrator=True)
+async def cmd_cohort_role(interaction: discord.Interaction, role: discord.Role):
+    onboarding.set_role(interaction.guild_id, role)
+    await interaction.response.send_message(f"✅ New members will receive {role.mention}.", ephemeral=True)
+
+@bot.tree.command(name="template_apply", description="Create whatever a guild template needs that this server is missing")
+@app_commands.default_permissions(administrator=True)
+async def cmd_template_apply(interaction: discord.Interaction, name: str, dry_run: bool = False):
+    layout = templates.get(name)
+    if layout is None:
+        return await interaction.response.send_message(
+            f"❌ Unknown template. Available: {', '.join(templates.names())}", ephemeral=True
+        )
+    await interaction.response.defer()
+    await apply_template(interaction, layout, {"course_notes": COURSE_NOTES[:1500]}, dry_run=dry_run)
+
+@bot.tree.command(name="template_save", description="Store a guild template (JSON layout) for reuse in any server")
+@app_commands.default_permissions(administrator=True)
+async def cmd_template_save(interaction: discord.Interaction, name: str, layout: str):
+    try:
+        templates.save(name, json.loads(layout))
+    except (ValueError, PlanError) as e:
+        return await interaction.response.send_message(f"❌ Invalid template: {e}", ephemeral=True)
+    await interaction.response.send_message(f"✅ Template **{name}** saved.", ephemeral=True)
+
 @bot.tree.command(name="unban", description="Unban a user by their ID")
 @app_commands.default_permissions(ban_members=True)
 async def cmd_unban(interaction: discord.Interaction, user_id: str, reason: str = "Manual unban by admin"):
     try:
         user = await bot.fetch_user(int(user_id))
         await interaction.guild.unban(user, reason=reason)
+        audit.record("unban", guild=interaction.guild, actor=interaction.user, target=user, reason=reason)
         await interaction.response.send_message(f"✅ Unbanned **{user}** (`{user_id}`).")
     except discord.NotFound:
         await interaction.response.send_message("❌ User not found or is not banned.", ephemeral=True)
@@ -975,13 +4467,20 @@ async def cmd_unban(interaction: discord.Interaction, user_id: str, reason: str
     except discord.Forbidden:
         await interaction.response.send_message("❌ I don't have permission to unban members.", ephemeral=True)
 
+@bot.tree.command(name="ai_override", description="Exempt a member from AI rate limits (or remove the exemption)")
+@app_commands.default_permissions(administrator=True)
+async def cmd_ai_override(interaction: discord.Interaction, member: discord.Member, enabled: bool = True):
+    admission.set_exempt(member.id, enabled)
+    state = "exempt from" if enabled else "subject to"
+    await interaction.response.send_message(f"✅ {member.mention} is now {state} AI rate limits.", ephemeral=True)
+
 @bot.tree.command(name="scam_test", description="Test a message against the scam sniffer without taking action")
 @app_commands.default_permissions(administrator=True)
 async def cmd_scam_test(interaction: discord.Interaction, text: str):
-    match = _SCAM_REGEX.search(text)
-    if match:
+    matched = scan_for_scam(text)
+    if matched:
         await interaction.response.send_message(
-            f"🚨 **SCAM DETECTED**\nTrigger phrase: `{match.group(0)}`\nThis message would be deleted and the user banned.",
+            f"🚨 **SCAM DETECTED**\nTrigger phrase: `{matched}`\nThis message would be deleted and the user banned.",
             ephemeral=True
         )
     else:
@@ -990,21 +4489,192 @@ async def cmd_scam_test(interaction: discord.Interaction, text: str):
             ephemeral=True
         )
 
+@bot.tree.command(name="domain", description="Allow, block or check a link domain for the scam sniffer")
+@app_commands.default_permissions(administrator=True)
+@app_commands.choices(action=[
+    app_commands.Choice(name="check", value="check"),
+    app_commands.Choice(name="allow", value="allow"),
+    app_commands.Choice(name="block", value="block"),
+    app_commands.Choice(name="remove", value="remove"),
+])
+async def cmd_domain(interaction: discord.Interaction, action: app_commands.Choice[str], domain: str):
+    if action.value == "check":
+        host = normalize_host(domain)
+        if not host:
+            return await interaction.response.send_message("❌ That doesn't look like a domain.", ephemeral=True)
+        verdict, reason = domain_index.verdict(host)
+        return await interaction.response.send_message(f"🔎 `{host}` → **{verdict}** ({reason})", ephemeral=True)
+
+    host = domain_index.set_rule(domain, action.value)
+    db.save_json("domains", domain_index.custom_rules())
+    logger.info(f"Domain rule: {host} -> {action.value} by {interaction.user}")
+    await interaction.response.send_message(f"✅ `{host}` rule set to **{action.value}**.", ephemeral=True)
+
+@bot.tree.command(name="audit", description="Search this server's admin audit log")
+@app_commands.default_permissions(administrator=True)
+@app_commands.choices(action=[app_commands.Choice(name=a, value=a) for a in AUDIT_ACTIONS])
+async def cmd_audit(
+    interaction: discord.Interaction,
+    user: discord.User = None,
+    action: app_commands.Choice[str] = None,
+    days: app_commands.Range[int, 1, 365] = 7,
+):
+    await asyncio.to_thread(audit.refresh)
+    entries = audit.query(
+        guild=interaction.guild_id, user=user.id if user else None, action=action.value if action else None,
+        since=time.time() - days * 86400, limit=20,
+    )
+    if not entries:
+        return await interaction.response.send_message("🧾 No matching audit records.", ephemeral=True)
+    lines = [f"<t:{int(e['ts'])}:f> {discord.utils.escape_markdown(format_audit_entry(e))}" for e in entries]
+    embed = discord.Embed(title=f"🧾 Audit log · last {days} day(s)", description="\n".join(lines)[:4000], color=COLOR_PRIMARY)
+    embed.set_footer(text=f"Newest {len(entries)} record(s)")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 # ==============================================================================
-# SECTION 9: SYSTEM ENTRY POINT
+# SECTION 24: GRACEFUL SHUTDOWN
 # ==============================================================================
+class LifecycleManager:
+    """
+    Turns SIGTERM/SIGINT into an orderly exit: /ready goes 503 and new AI requests are
+    refused, then in-flight AI calls and the outbound queue drain until `grace` seconds
+    have passed, every subsystem flushes its state, and the gateway is closed. A second
+    signal skips the drain.
+    """
+    def __init__(self, grace=20.0):
+        self.grace = grace
+        self.draining = False
+        self._task = None
+        self._force = asyncio.Event()
+
+    def install(self, loop):
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.request, sig.name)
+            except (NotImplementedError, RuntimeError):
+                pass    # Windows: KeyboardInterrupt still ends bot.run()
+
+    def request(self, reason):
+        if self._task is None:
+            logger.warning(f"Lifecycle: {reason} received; draining for up to {self.grace:.0f}s")
+            self._task = asyncio.create_task(self.shutdown())
+        else:
+            logger.warning(f"Lifecycle: second {reason}; closing without waiting for the drain")
+            self._force.set()
+
+    def busy(self):
+        return {
+            "ai_inflight": admission.inflight,
+            "ai_queued": admission.queue_depth(),
+            "outbound": outbound.pending() + outbound.inflight(),
+            "onboarding": not onboarding.idle(),
+        }
+
+    async def drain(self):
+        deadline = time.monotonic() + self.grace
+        while any(self.busy().values()) and time.monotonic() < deadline and not self._force.is_set():
+            try:
+                await asyncio.wait_for(self._force.wait(), 0.2)
+            except asyncio.TimeoutError:
+                pass
+        return self.busy()
+
+    def flush(self):
+        """
+        Saves every subsystem that buffers state in memory. Opt-ins and reaction roles are
+        written through to the store as they change, so they are not rewritten here (a blind
+        put would clobber other shards' updates).
+        """
+        bank.flush()
+        reminders.save()
+        polls.save()
+        if onboarding.pending():
+            logger.warning(f"Lifecycle: {onboarding.pending()} queued member welcome(s) dropped")
+
+    async def shutdown(self):
+        self.draining = True
+        admission.closed = True
+        t0 = time.monotonic()
+        left = await self.drain()
+        drained = time.monotonic() - t0
+        metrics.observe("maestro_shutdown_drain_seconds", drained)
+        if any(left.values()):
+            logger.warning(f"Lifecycle: stopped draining after {drained:.1f}s with work left: {left}")
+        else:
+            logger.info(f"Lifecycle: drained in {drained:.1f}s")
+        try:
+            self.flush()
+        except Exception as e:
+            logger.critical(f"Lifecycle: state flush failed: {e}")
+        await bot.close()
+        audit.close()   # last: closing the gateway can still record audit entries
+
+metrics.describe("maestro_shutdown_drain_seconds", "histogram", "Time spent draining work before shutdown.")
+
+lifecycle = LifecycleManager(grace=float(os.getenv("SHUTDOWN_GRACE_SECONDS", 20)))
+
+# ==============================================================================
+# SECTION 25: SYSTEM ENTRY POINT
+# ==============================================================================
+def run_shard_supervisor(workers, shard_count):
+    """Starts `workers` copies of this script, each owning a contiguous slice of the shards; restarts crashes."""
+    per = -(-shard_count // workers)
+    ranges = [(lo, min(lo + per, shard_count) - 1) for lo in range(0, shard_count, per)]
+
+    def spawn(lo, hi):
+        env = {**os.environ, "SHARD_IDS": f"{lo}-{hi}", "SHARD_COUNT": str(shard_count), "SHARD_WORKERS": "0",
+               "LOG_FILE": f"{os.path.splitext(LOG_FILE)[0]}.shards-{lo}-{hi}.log"}
+        logger.info(f"Supervisor: starting worker for shards {lo}-{hi}")
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+
+    def on_sigterm(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    procs = {r: spawn(*r) for r in ranges}
+    try:
+        while True:
+            time.sleep(5)
+            for r, proc in procs.items():
+                if proc.poll() is not None:
+                    logger.error(f"Supervisor: worker {r[0]}-{r[1]} exited with {proc.returncode}; restarting")
+                    procs[r] = spawn(*r)
+    except KeyboardInterrupt:
+        # Workers drain on SIGTERM; only kill the ones that overrun their grace period
+        for proc in procs.values():
+            proc.terminate()
+        for proc in procs.values():
+            try:
+                proc.wait(timeout=lifecycle.grace + 10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 8080))
-    server = HTTPServer(('0.0.0.0', port), DashboardHandler)
+    startup.record("import", time.perf_counter() - BOOT_T0)
+
+    if SHARD_WORKERS > 1 and not SHARD_IDS:
+        run_shard_supervisor(SHARD_WORKERS, SHARD_COUNT or SHARD_WORKERS)
+        sys.exit(0)
+
+    if IS_PRIMARY:
+        # Dashboard (and /health) first, so the orchestrator sees a live process right away
+        port = int(os.environ.get("PORT", 8080))
+        server = HTTPServer(('0.0.0.0', port), DashboardHandler)
+
+        t = threading.Thread(target=server.serve_forever, daemon=True)
+        t.start()
+        startup.record("dashboard", time.perf_counter() - BOOT_T0)
+        logger.info(f"System: Dashboard active on port {port}")
 
-    t = threading.Thread(target=server.serve_forever, daemon=True)
-    t.start()
-    logger.info(f"System: Dashboard active on port {port}")
+    # Provider SDKs and the offline notes index load in the background while the gateway connects
+    threading.Thread(target=brain.warm_up, name="maestro-ai-warmup", daemon=True).start()
+    threading.Thread(target=offline.warm_up, name="maestro-offline-warmup", daemon=True).start()
 
     token = os.getenv("DISCORD_TOKEN")
     if token:
         try:
-            bot.run(token)
+            # log_handler=None: keep discord.py on our queue-backed root logger
+            bot.run(token, log_handler=None)
         except Exception as e:
             logger.critical(f"System: Bot Crash: {e}")
             traceback.print_exc()